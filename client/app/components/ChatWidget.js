@@ -113,6 +113,17 @@ export default function ChatWidget() {
   const renderUi = (ui) => {
     if (!ui || typeof ui !== 'object') return null;
 
+    if (ui.type === 'multi') {
+      const parts = Array.isArray(ui.items) ? ui.items : [];
+      return (
+        <div>
+          {parts.map((part, idx) => (
+            <div key={`${part?.type || 'ui'}-${idx}`}>{renderUi(part)}</div>
+          ))}
+        </div>
+      );
+    }
+
     if (ui.type === 'product_list') {
       const items = Array.isArray(ui.items) ? ui.items : [];
       return (
@@ -189,6 +200,7 @@ export default function ChatWidget() {
     if (ui.type === 'cart') {
       const items = Array.isArray(ui.items) ? ui.items : [];
       const totalQty = items.reduce((sum, it) => sum + (Number(it.quantity) || 0), 0);
+      const totals = ui.totals && typeof ui.totals === 'object' ? ui.totals : null;
       return (
         <div className="mt-2 rounded-md border border-gray-200 bg-white p-2 text-xs text-gray-700">
           <div className="font-semibold">Cart Summary</div>
@@ -198,9 +210,22 @@ export default function ChatWidget() {
               <div key={item.part_number} className="flex justify-between gap-2">
                 <span className="font-medium">{item.part_number}</span>
                 <span className="flex-1 text-right">Qty {item.quantity}</span>
+                {formatCents(item.line_total_cents) ? <span>{formatCents(item.line_total_cents)}</span> : null}
               </div>
             ))}
           </div>
+          {totals && formatCents(totals.subtotal_cents) && totalQty > 0 ? (
+            <div className="mt-2 space-y-1 border-t border-gray-100 pt-1">
+              <div className="flex justify-between"><span>Subtotal</span><span>{formatCents(totals.subtotal_cents)}</span></div>
+              {totals.tax_cents ? (
+                <div className="flex justify-between"><span>Tax</span><span>{formatCents(totals.tax_cents)}</span></div>
+              ) : null}
+              {formatCents(totals.shipping_cents) ? (
+                <div className="flex justify-between"><span>Shipping (est.)</span><span>{formatCents(totals.shipping_cents)}</span></div>
+              ) : null}
+              <div className="flex justify-between font-semibold"><span>Total</span><span>{formatCents(totals.total_cents)}</span></div>
+            </div>
+          ) : null}
         </div>
       );
     }
@@ -0,0 +1,158 @@
+"""
+Synthetic PartSelect-scale catalog for the SQLite backend.
+
+Generates products, appliance_models, product_compatibility, product_prices
+and installation_guides for a target number of compatibility links. Fan-out
+is skewed like the real catalog: a few parts (filters, gaskets) fit thousands
+of models and a few models take hundreds of parts, while most have a handful
+(Zipf-like draws on both sides). Output is deterministic for a given seed.
+
+    cd server
+    python -m bench.catalog_gen --links 100k --out .local/catalog_100k.db
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import itertools
+import random
+import string
+import time
+from typing import Dict, Iterator, List, Tuple
+
+from my_agent.local_db import SqliteClient, table_counts
+
+
+BRANDS = ["Whirlpool", "GE", "Frigidaire", "Samsung", "LG", "KitchenAid", "Maytag", "Bosch", "Kenmore", "Amana"]
+COMPONENTS = {
+    "refrigerator": [
+        "Door Shelf Bin", "Ice Maker Assembly", "Water Filter", "Defrost Thermostat", "Evaporator Fan Motor",
+        "Door Gasket", "Crisper Drawer", "Water Inlet Valve", "Temperature Control", "Condenser Fan Motor",
+    ],
+    "dishwasher": [
+        "Lower Spray Arm", "Upper Rack Adjuster", "Door Gasket", "Drain Pump", "Rack Wheel",
+        "Door Latch", "Silverware Basket", "Heating Element", "Inlet Valve", "Float Switch",
+    ],
+}
+VARIANTS = ["", "Kit", "Assembly", "Replacement", "OEM", "Left", "Right", "White", "Stainless", "Black"]
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+CHUNK = 20_000
+
+
+def parse_size(value: str) -> int:
+    value = value.strip().lower()
+    if value in SIZES:
+        return SIZES[value]
+    if value.endswith("k"):
+        return int(float(value[:-1]) * 1_000)
+    if value.endswith("m"):
+        return int(float(value[:-1]) * 1_000_000)
+    return int(value)
+
+
+def shape(links: int) -> Tuple[int, int]:
+    """(products, models) for a link count; roughly PartSelect's ratios."""
+    return max(50, links // 12), max(20, links // 25)
+
+
+def _zipf_cdf(n: int, s: float) -> List[float]:
+    weights = [1.0 / (rank ** s) for rank in range(1, n + 1)]
+    return list(itertools.accumulate(weights))
+
+
+def _draw(rng: random.Random, cdf: List[float]) -> int:
+    return bisect.bisect_left(cdf, rng.random() * cdf[-1])
+
+
+def _model_number(rng: random.Random, brand: str) -> str:
+    prefix = brand[:1] + rng.choice(string.ascii_uppercase) + rng.choice(string.ascii_uppercase)
+    body = "".join(rng.choice(string.digits) for _ in range(rng.randint(3, 4)))
+    suffix = "".join(rng.choice(string.ascii_uppercase + string.digits) for _ in range(rng.randint(3, 5)))
+    return prefix + body + suffix
+
+
+def products(rng: random.Random, n: int) -> Iterator[Dict[str, str]]:
+    seen = set()
+    for i in range(n):
+        category = "refrigerator" if rng.random() < 0.55 else "dishwasher"
+        pn = f"PS{rng.randint(1_000_000, 99_999_999)}"
+        while pn in seen:
+            pn = f"PS{rng.randint(1_000_000, 99_999_999)}"
+        seen.add(pn)
+        name = " ".join(w for w in (category.title(), rng.choice(COMPONENTS[category]), rng.choice(VARIANTS)) if w)
+        yield {"id": f"p{i}", "part_number": pn, "name": name, "category": category}
+
+
+def models(rng: random.Random, n: int) -> Iterator[Dict[str, str]]:
+    seen = set()
+    for i in range(n):
+        brand = rng.choice(BRANDS)
+        mn = _model_number(rng, brand)
+        while mn in seen:
+            mn = _model_number(rng, brand)
+        seen.add(mn)
+        yield {"id": f"m{i}", "model_number": mn, "brand": brand}
+
+
+def links(rng: random.Random, n_links: int, n_products: int, n_models: int) -> Iterator[Dict[str, str]]:
+    # Popular parts and popular models are drawn far more often; duplicates are
+    # dropped by the primary key, so the final count is a little under n_links.
+    p_cdf = _zipf_cdf(n_products, 0.9)
+    m_cdf = _zipf_cdf(n_models, 0.8)
+    p_order = list(range(n_products))
+    m_order = list(range(n_models))
+    rng.shuffle(p_order)
+    rng.shuffle(m_order)
+    for _ in range(n_links):
+        yield {"product_id": f"p{p_order[_draw(rng, p_cdf)]}", "model_id": f"m{m_order[_draw(rng, m_cdf)]}"}
+
+
+def _chunks(rows: Iterator[Dict], size: int = CHUNK) -> Iterator[List[Dict]]:
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def generate(db: SqliteClient, n_links: int, seed: int = 7) -> Dict[str, int]:
+    rng = random.Random(seed)
+    n_products, n_models = shape(n_links)
+    for chunk in _chunks(products(rng, n_products)):
+        db.bulk_insert("products", chunk, on_conflict="id")
+        db.bulk_insert("product_prices", [{"product_id": p["id"], "unit_price_cents": rng.randint(499, 24999)} for p in chunk], on_conflict="product_id")
+        db.bulk_insert(
+            "installation_guides",
+            [
+                {"id": f"g{p['id']}", "product_id": p["id"], "title": f"Replacing the {p['name'].lower()}",
+                 "steps": ["Disconnect power.", "Remove the old part.", "Fit the new part.", "Restore power and test."]}
+                for p in chunk
+                if rng.random() < 0.3
+            ],
+            on_conflict="id",
+        )
+    for chunk in _chunks(models(rng, n_models)):
+        db.bulk_insert("appliance_models", chunk, on_conflict="id")
+    for chunk in _chunks(links(rng, n_links, n_products, n_models)):
+        db.bulk_insert("product_compatibility", chunk, on_conflict="product_id,model_id")
+    return dict(table_counts(db))
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate a synthetic catalog into a SQLite database.")
+    parser.add_argument("--links", default="10k", help="compatibility links: 10k, 100k, 1m or a number")
+    parser.add_argument("--out", required=True, help="SQLite file to create or extend")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    counts = generate(SqliteClient(args.out), parse_size(args.links), args.seed)
+    print(f"{args.out} in {time.perf_counter() - t0:.1f}s")
+    for name in ("products", "appliance_models", "product_compatibility", "installation_guides"):
+        print(f"  {name}: {counts.get(name, 0)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,166 @@
+"""
+Catalog tool scaling benchmark on synthetic data.
+
+For each catalog size (compatibility links) this builds, or reuses, a
+synthetic SQLite catalog (catalog_gen.py) and runs search_products,
+list_supported_models, get_compatible_parts and
+find_compatible_parts_by_keyword against it through sb(). Per tool it
+reports p50/p95 latency, queries and rows transferred per call, peak Python
+memory per call, and two scaling cliffs:
+
+- cap: calls where one query returned >= 1000 rows; PostgREST truncates
+  there (max-rows), so on Supabase those answers are silently partial;
+- recall (find_compatible_parts_by_keyword): share of the truly compatible
+  keyword matches the tool returned.
+
+    cd server
+    python -m bench.catalog_scale --sizes 10k,100k,1m --reps 20
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+os.environ.setdefault("TRACE_SAMPLE_RATE", "0")
+os.environ.setdefault("WRITE_BEHIND_SPILL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".local", "bench-spill"))
+
+from my_agent import tools  # noqa: E402
+from my_agent.local_db import SqliteClient, SqliteQuery  # noqa: E402
+from my_agent.supabase_client import set_client  # noqa: E402
+
+from .catalog_gen import COMPONENTS, generate, parse_size  # noqa: E402
+
+
+POSTGREST_MAX_ROWS = 1000
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".local")
+
+
+class _MeasuredQuery(SqliteQuery):
+    def execute(self):
+        res = super().execute()
+        self.client.results.append(len(res.data))
+        return res
+
+
+class MeasuredClient(SqliteClient):
+    """SqliteClient that remembers the row count of every query."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.results: List[int] = []
+
+    def table(self, name: str) -> _MeasuredQuery:
+        return _MeasuredQuery(self, name)
+
+
+def _catalog(size: str, directory: str) -> MeasuredClient:
+    path = os.path.join(directory, f"catalog_{size}.db")
+    fresh = not os.path.exists(path)
+    db = MeasuredClient(path)
+    if fresh:
+        t0 = time.perf_counter()
+        generate(db, parse_size(size))
+        print(f"generated {path} in {time.perf_counter() - t0:.1f}s")
+    return db
+
+
+def _samples(db: SqliteClient, rng: random.Random, reps: int) -> Dict[str, List[Tuple]]:
+    conn = db.conn
+    n_models = conn.execute("select count(*) from appliance_models").fetchone()[0]
+    # Popular models (many links) and tail models, half each.
+    popular = [r[0] for r in conn.execute(
+        "select m.model_number from appliance_models m join product_compatibility c on c.model_id = m.id "
+        "group by m.id order by count(*) desc limit ?", (max(1, reps // 2),)
+    )]
+    tail = [r[0] for r in conn.execute(
+        "select model_number from appliance_models limit ? offset ?", (reps, max(0, n_models - reps))
+    )]
+    model_numbers = (popular + tail)[:reps] or tail
+    keywords = [w.split()[0].lower() for ws in COMPONENTS.values() for w in ws]
+    return {
+        "search_products": [(rng.choice(keywords), rng.choice(["refrigerator", "dishwasher", None])) for _ in range(reps)],
+        "list_supported_models": [(rng.choice(["refrigerator", "dishwasher"]), rng.choice([0, 25, 100])) for _ in range(reps)],
+        "get_compatible_parts": [(m,) for m in model_numbers],
+        "find_compatible_parts_by_keyword": [(m, rng.choice(keywords)) for m in model_numbers],
+    }
+
+
+CALLS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "search_products": lambda q, c: tools.search_products(q, category=c),
+    "list_supported_models": lambda c, o: tools.list_supported_models(c, offset=o),
+    "get_compatible_parts": lambda m: tools.get_compatible_parts(m),
+    "find_compatible_parts_by_keyword": lambda m, k: tools.find_compatible_parts_by_keyword(m, k, limit=25),
+}
+
+
+def _true_keyword_matches(db: SqliteClient, model_number: str, keyword: str) -> int:
+    return db.conn.execute(
+        "select count(*) from products p join product_compatibility c on c.product_id = p.id "
+        "join appliance_models m on m.id = c.model_id "
+        "where m.model_number = ? and (lower(p.name) like ? or lower(p.part_number) like ?)",
+        (model_number, f"%{keyword}%", f"%{keyword}%"),
+    ).fetchone()[0]
+
+
+def bench_tool(db: MeasuredClient, name: str, samples: List[Tuple]) -> Dict[str, Any]:
+    latencies, queries, rows, peaks, capped, recalls = [], [], [], [], 0, []
+    for args in samples:
+        db.results.clear()
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        res = CALLS[name](*args)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        queries.append(len(db.results))
+        rows.append(sum(db.results))
+        if any(n >= POSTGREST_MAX_ROWS for n in db.results):
+            capped += 1
+        if name == "find_compatible_parts_by_keyword" and res.get("status") == "ok":
+            truth = min(_true_keyword_matches(db, *args), 25)
+            if truth:
+                recalls.append(len(res.get("items") or []) / truth)
+    latencies.sort()
+    return {
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "queries": statistics.mean(queries),
+        "rows": statistics.mean(rows),
+        "peak_kb": max(peaks) / 1024,
+        "capped": capped,
+        "recall": statistics.mean(recalls) if recalls else None,
+    }
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the catalog tools against synthetic catalogs of growing size.")
+    parser.add_argument("--sizes", default="10k,100k,1m")
+    parser.add_argument("--reps", type=int, default=20)
+    parser.add_argument("--dir", default=DEFAULT_DIR, help="where the generated catalogs are kept")
+    parser.add_argument("--seed", type=int, default=11)
+    args = parser.parse_args(argv)
+    os.makedirs(args.dir, exist_ok=True)
+
+    print(f"{'size':>5} {'tool':<34} {'p50 ms':>8} {'p95 ms':>8} {'queries':>7} {'rows':>9} {'peak KB':>9} {'capped':>6} {'recall':>6}")
+    for size in [s.strip() for s in args.sizes.split(",") if s.strip()]:
+        db = _catalog(size, args.dir)
+        set_client(db)
+        samples = _samples(db, random.Random(args.seed), args.reps)
+        for name in CALLS:
+            r = bench_tool(db, name, samples[name])
+            recall = f"{r['recall']:.2f}" if r["recall"] is not None else "-"
+            print(
+                f"{size:>5} {name:<34} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['queries']:>7.1f} "
+                f"{r['rows']:>9.0f} {r['peak_kb']:>9.0f} {r['capped']:>6} {recall:>6}"
+            )
+    set_client(None)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
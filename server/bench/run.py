@@ -0,0 +1,271 @@
+"""
+Offline routing-cost benchmark for the agent graph in my_agent/agent.py.
+
+Runs the scripted conversations in conversations.json through the real
+root_agent with the deterministic StubLlm (MODEL_BACKEND=stub) and a small
+seed catalog in an in-memory local_db.SqliteClient (the PS_DATA_BACKEND=sqlite
+backend), and reports per turn: model calls, tool calls, DB queries,
+input/output tokens and wall time.
+
+Each turn lists the tools it must call (`tools`, compared as a multiset,
+specialist agent tools included) and optionally text the reply must contain
+(`reply_contains`); a mismatch fails the run. Totals per conversation are
+compared with baseline.json; any count that grows by more than --tolerance
+fails the run (exit 1). Wall time is reported but not gated, it depends on
+the machine.
+
+    cd server
+    python -m bench.run                      # compare with the baseline
+    python -m bench.run --update-baseline    # accept the current numbers
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+# Must be set before my_agent is imported.
+os.environ["MODEL_BACKEND"] = "stub"
+os.environ["UI_CHANNEL_URL"] = ""
+os.environ["PROMPT_CACHE"] = "0"
+os.environ.setdefault("TRACE_SAMPLE_RATE", "0")
+os.environ["PREFETCH"] = "0"
+# A tool over its query budget should fail the run, not just log.
+os.environ.setdefault("DB_STRICT_BUDGETS", "1")
+os.environ.setdefault("WRITE_BEHIND_SPILL_DIR", tempfile.mkdtemp(prefix="bench-spill-"))
+
+from google.adk.runners import Runner  # noqa: E402
+from google.adk.sessions import InMemorySessionService  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from my_agent import agent as agents  # noqa: E402
+from my_agent import stub_llm  # noqa: E402
+from my_agent.local_db import SqliteClient, SqliteQuery  # noqa: E402
+from my_agent.supabase_client import set_client  # noqa: E402
+from my_agent.write_behind import write_behind  # noqa: E402
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CONVERSATIONS = os.path.join(HERE, "conversations.json")
+BASELINE = os.path.join(HERE, "baseline.json")
+APP_NAME = "my_agent"
+GATED = ("model_calls", "tool_calls", "db_queries", "input_tokens", "output_tokens")
+
+tool_calls: List[str] = []
+
+
+class _CountedQuery(SqliteQuery):
+    def execute(self):
+        with self.client.lock:
+            self.client.queries[(self.table, self.op)] += 1
+        return super().execute()
+
+
+class CountingClient(SqliteClient):
+    """In-memory SqliteClient that counts every execute() by (table, operation)."""
+
+    def __init__(self, tables: Dict[str, List[Dict[str, Any]]]):
+        super().__init__(":memory:")
+        self.queries: "Counter[tuple]" = Counter()
+        for table, rows in tables.items():
+            self.bulk_insert(table, rows)
+
+    def table(self, name: str) -> _CountedQuery:
+        return _CountedQuery(self, name)
+
+    def query_count(self) -> int:
+        with self.lock:
+            return sum(self.queries.values())
+
+
+def seed_rows() -> Dict[str, List[Dict[str, Any]]]:
+    """A small catalog: a few parts per category, models, fits, guides and prices."""
+    products = [
+        {"id": "p1", "part_number": "PS11752778", "name": "Refrigerator Door Shelf Bin", "category": "refrigerator"},
+        {"id": "p2", "part_number": "PS11701542", "name": "Refrigerator Ice Maker Assembly", "category": "refrigerator"},
+        {"id": "p3", "part_number": "PS12728638", "name": "Refrigerator Water Filter", "category": "refrigerator"},
+        {"id": "p4", "part_number": "PS3406971", "name": "Dishwasher Lower Spray Arm", "category": "dishwasher"},
+        {"id": "p5", "part_number": "PS10065979", "name": "Dishwasher Upper Rack Adjuster", "category": "dishwasher"},
+        {"id": "p6", "part_number": "PS11746591", "name": "Dishwasher Door Gasket", "category": "dishwasher"},
+    ]
+    models = [
+        {"id": "m1", "model_number": "WDT780SAEM1", "brand": "Whirlpool"},
+        {"id": "m2", "model_number": "WRS325SDHZ01", "brand": "Whirlpool"},
+        {"id": "m3", "model_number": "GSS25GSHSS", "brand": "GE"},
+        {"id": "m4", "model_number": "KDTE334GPS0", "brand": "KitchenAid"},
+    ]
+    fits = [("p1", "m2"), ("p2", "m2"), ("p2", "m3"), ("p3", "m3"), ("p4", "m1"), ("p5", "m1"), ("p6", "m4"), ("p4", "m4")]
+    return {
+        "products": products,
+        "appliance_models": models,
+        "product_compatibility": [{"product_id": p, "model_id": m} for p, m in fits],
+        "installation_guides": [
+            {
+                "id": f"g{p['id']}",
+                "product_id": p["id"],
+                "title": f"Replacing the {p['name'].lower()}",
+                "steps": ["Disconnect power.", "Remove the old part.", "Fit the new part.", "Restore power and test."],
+            }
+            for p in products
+        ],
+        "product_prices": [{"product_id": p["id"], "unit_price_cents": 1999 + 500 * i} for i, p in enumerate(products)],
+    }
+
+
+def _count_tool(tool, args, tool_context):
+    tool_calls.append(getattr(tool, "name", "?"))
+    return None
+
+
+def _instrument() -> None:
+    for agent in (agents.root_agent, agents.catalog_agent, agents.transaction_agent, agents.history_agent):
+        existing = agent.before_tool_callback
+        chain = existing if isinstance(existing, list) else [existing] if existing else []
+        agent.before_tool_callback = [_count_tool] + chain
+
+
+async def _run_turn(runner: Runner, db: CountingClient, user_id: str, session_id: str, text: str) -> Dict[str, Any]:
+    calls_before = len(stub_llm.calls())
+    tools_before = len(tool_calls)
+    queries_before = db.query_count()
+    reply = ""
+    t0 = time.perf_counter()
+    async for event in runner.run_async(
+        user_id=user_id,
+        session_id=session_id,
+        new_message=types.Content(role="user", parts=[types.Part(text=text)]),
+    ):
+        if event.author == agents.root_agent.name and event.content and event.content.parts:
+            reply = "".join(p.text or "" for p in event.content.parts) or reply
+    wall_ms = (time.perf_counter() - t0) * 1000
+    # Audit writes are part of the turn's cost even though they trail it.
+    write_behind.flush()
+
+    calls = stub_llm.calls()[calls_before:]
+    return {
+        "user": text,
+        "reply": reply,
+        "model_calls": len(calls),
+        "tool_calls": len(tool_calls) - tools_before,
+        "tools": sorted(tool_calls[tools_before:]),
+        "db_queries": db.query_count() - queries_before,
+        "input_tokens": sum(c["input_tokens"] for c in calls),
+        "output_tokens": sum(c["output_tokens"] for c in calls),
+        "wall_ms": round(wall_ms, 1),
+    }
+
+
+async def run(conversations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    db = CountingClient(seed_rows())
+    set_client(db)
+    _instrument()
+    stub_llm.reset_calls()
+    sessions = InMemorySessionService()
+    runner = Runner(app_name=APP_NAME, agent=agents.root_agent, session_service=sessions)
+
+    report: Dict[str, Any] = {}
+    for conv in conversations:
+        user_id = f"bench_user_{conv['name']}"
+        session_id = f"bench_{conv['name']}"
+        await sessions.create_session(
+            app_name=APP_NAME,
+            user_id=user_id,
+            session_id=session_id,
+            state={"ps_session_id": session_id, "ps_user_id": user_id},
+        )
+        turns = [await _run_turn(runner, db, user_id, session_id, turn["text"]) for turn in conv["turns"]]
+        totals = {k: sum(t[k] for t in turns) for k in GATED + ("wall_ms",)}
+        report[conv["name"]] = {"turns": turns, "totals": totals}
+    report["_db_queries_by_table"] = {f"{t}.{op}": n for (t, op), n in sorted(db.queries.items())}
+    return report
+
+
+def _print(report: Dict[str, Any]) -> None:
+    header = f"{'turn':<60} {'model':>5} {'tools':>5} {'db':>4} {'in_tok':>7} {'out_tok':>7} {'ms':>8}"
+    for name, conv in report.items():
+        if name.startswith("_"):
+            continue
+        print(f"\n== {name}")
+        print(header)
+        for t in conv["turns"] + [{**conv["totals"], "user": "TOTAL"}]:
+            print(
+                f"{t['user'][:60]:<60} {t['model_calls']:>5} {t['tool_calls']:>5} {t['db_queries']:>4} "
+                f"{t['input_tokens']:>7} {t['output_tokens']:>7} {t['wall_ms']:>8.1f}"
+            )
+
+
+def check_expectations(report: Dict[str, Any], conversations: List[Dict[str, Any]]) -> List[str]:
+    failures = []
+    for conv in conversations:
+        turns = (report.get(conv["name"]) or {}).get("turns") or []
+        for n, (spec, turn) in enumerate(zip(conv["turns"], turns), 1):
+            where = f"{conv['name']} turn {n}"
+            if "tools" in spec and sorted(spec["tools"]) != turn["tools"]:
+                failures.append(f"{where}: called {turn['tools']}, expected {sorted(spec['tools'])}")
+            if spec.get("reply_contains") and spec["reply_contains"] not in turn["reply"]:
+                failures.append(f"{where}: reply {turn['reply']!r} lacks {spec['reply_contains']!r}")
+    return failures
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for name, totals in baseline.items():
+        current = (report.get(name) or {}).get("totals")
+        if current is None:
+            continue
+        for key in GATED:
+            base = totals.get(key)
+            if base is not None and current[key] > base * (1 + tolerance):
+                regressions.append(f"{name}.{key}: {current[key]} > baseline {base}")
+    return regressions
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="allowed growth per gated total (default 5%%)")
+    parser.add_argument("--json", help="also write the full report here")
+    args = parser.parse_args(argv)
+
+    with open(CONVERSATIONS, encoding="utf-8") as f:
+        conversations = json.load(f)
+    report = asyncio.run(run(conversations))
+    _print(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    failures = check_expectations(report, conversations)
+    if failures:
+        print("\nUNEXPECTED TURNS:\n  " + "\n  ".join(failures))
+        return 1
+
+    current = {name: {k: conv["totals"][k] for k in GATED} for name, conv in report.items() if not name.startswith("_")}
+    if not args.update_baseline and not os.path.exists(BASELINE):
+        print(f"\nno baseline at {BASELINE}; run with --update-baseline to create it")
+        return 1
+    if args.update_baseline:
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nbaseline written to {BASELINE}")
+        return 0
+
+    with open(BASELINE, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance)
+    if regressions:
+        print("\nREGRESSIONS:\n  " + "\n  ".join(regressions))
+        return 1
+    print("\nno regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
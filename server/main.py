@@ -1,14 +1,38 @@
 import uvicorn
+import asyncio
+import json
+import logging
+import os
 import re
-from fastapi import FastAPI, HTTPException
+import secrets
+from fastapi import FastAPI, Header, HTTPException, Response
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware #even though adk api-server has allow origin option we can enable it here too
 from pydantic import BaseModel
 import httpx
 
+from my_agent import tracing
+from my_agent.ui_channel import channel_token
+
 ADK_BASE_URL = "http://127.0.0.1:8000"
 PS_RE = re.compile(r"\bPS\d{5,10}\b", re.IGNORECASE)
 INSTALL_RE = re.compile(r"\binstall|installation|installing|how do i install|how to install|instructions?\b", re.IGNORECASE)
+# Never open: without UI_CHANNEL_TOKEN a random token is generated and shared
+# with the agent process through a 0600 file (see my_agent/ui_channel.py).
+UI_CHANNEL_TOKEN = channel_token(create=True)
+WARMUP_TIMEOUT_S = float(os.environ.get("WARMUP_TIMEOUT_S", "120"))
+WARMUP_USER_ID = "__warmup__"
+
+# Flipped by warm_agent() once the agent process has loaded and warmed up.
+_readiness: dict = {"ready": False}
+
+# Open /agent/stream responses by (user_id, session_id). The agent process
+# posts UI payloads to /internal/ui as tools return, and they are written into
+# the matching stream ahead of ADK's own (later) stateDelta event.
+_ui_streams: dict[tuple[str, str], asyncio.Queue] = {}
+_STREAM_END = object()
+
+logger = logging.getLogger("main")
 
 app = FastAPI()
 app.add_middleware(
@@ -27,6 +51,12 @@ class QueryRequest(BaseModel):
     reset: bool = False  # optionally start a fresh conversation
 
 
+class UiEvent(BaseModel):
+    user_id: str
+    session_id: str
+    ui: dict
+
+
 async def ensure_session(client: httpx.AsyncClient, app_name: str, user_id: str, session_id: str, reset: bool):
     # Optional reset
     if reset:
@@ -71,10 +101,33 @@ def maybe_augment_install_message(message: str, session: dict | None) -> str:
     return message
 
 
+def sse_error(detail: str) -> str:
+    # One data: line per line of the message, as the SSE format requires.
+    return "event: error\n" + "".join(f"data: {line}\n" for line in str(detail).splitlines() or [""]) + "\n"
+
+
+def start_request_span(name: str, req: QueryRequest, traceparent: str | None):
+    # Honors an incoming traceparent; otherwise this request starts (and samples) the trace.
+    return tracing.start_span(
+        name,
+        parent=tracing.parse_traceparent(traceparent),
+        session_id=req.session_id,
+        user_id=req.user_id,
+    )
+
+
 @app.post("/agent/query")
-async def query_agent(req: QueryRequest):
+async def query_agent(req: QueryRequest, traceparent: str | None = Header(default=None)):
     app_name = "my_agent"
+    span, trace_ctx = start_request_span("proxy /agent/query", req, traceparent)
+    try:
+        return await run_query(app_name, req, trace_ctx)
+    finally:
+        if span is not None:
+            span.end()
+
 
+async def run_query(app_name: str, req: QueryRequest, trace_ctx):
     async with httpx.AsyncClient(timeout=None) as client:
         session = await ensure_session(client, app_name, req.user_id, req.session_id, req.reset)
         msg = maybe_augment_install_message(req.message, session)
@@ -92,6 +145,7 @@ async def query_agent(req: QueryRequest):
                 "state_delta": {
                     "ps_session_id": req.session_id,
                     "ps_user_id": req.user_id,
+                    tracing.TRACEPARENT_KEY: tracing.format_traceparent(trace_ctx),
                 },
             },
         )
@@ -102,12 +156,103 @@ async def query_agent(req: QueryRequest):
         return run_res.json()
 
 
+async def warm_agent(app_name: str = "my_agent"):
+    """
+    Prime the ADK server: wait for it to answer, then run one turn in a
+    throwaway session with the warm-up flag set. That makes it import the
+    agent, and the coordinator runs the warm-up (client, catalog, guides)
+    and replies without calling the model. /ready flips when it replies
+    "ready"; a "degraded" reply keeps it not ready with the failed steps.
+    """
+    from my_agent.startup import WARMUP_KEY, failed_steps  # light: my_agent loads the agent graph lazily
+
+    started = asyncio.get_running_loop().time()
+    deadline = started + WARMUP_TIMEOUT_S
+    session_id = f"warmup-{os.getpid()}"
+    async with httpx.AsyncClient(timeout=WARMUP_TIMEOUT_S) as client:
+        while True:
+            try:
+                if (await client.get(f"{ADK_BASE_URL}/list-apps")).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if asyncio.get_running_loop().time() > deadline:
+                _readiness.update(ready=False, error="ADK server did not come up")
+                return
+            await asyncio.sleep(1.0)
+        try:
+            await ensure_session(client, app_name, WARMUP_USER_ID, session_id, reset=True)
+            run_res = await client.post(
+                f"{ADK_BASE_URL}/run",
+                json={
+                    "app_name": app_name,
+                    "user_id": WARMUP_USER_ID,
+                    "session_id": session_id,
+                    "new_message": {"role": "user", "parts": [{"text": "warm up"}]},
+                    "state_delta": {WARMUP_KEY: True},
+                },
+            )
+            await client.delete(f"{ADK_BASE_URL}/apps/{app_name}/users/{WARMUP_USER_ID}/sessions/{session_id}")
+        except (httpx.HTTPError, HTTPException) as e:
+            _readiness.update(ready=False, error=f"warm-up run failed: {e}")
+            return
+    if run_res.status_code != 200:
+        _readiness.update(ready=False, error=f"warm-up run failed: {run_res.status_code}")
+        return
+    reply = final_text(run_res.json())
+    failed = failed_steps(reply)
+    if failed is None:
+        _readiness.update(ready=False, error=f"unexpected warm-up reply: {reply!r}")
+        return
+    if failed:
+        _readiness.update(ready=False, error="warm-up degraded", failed_steps=failed)
+        return
+    _readiness.update(ready=True, failed_steps=[], warm_ms=round((asyncio.get_running_loop().time() - started) * 1000), error=None)
+
+
+def final_text(events) -> str:
+    """Text of the last /run event that has any."""
+    for event in reversed(events if isinstance(events, list) else []):
+        parts = ((event or {}).get("content") or {}).get("parts") or []
+        text = "".join(p.get("text") or "" for p in parts)
+        if text:
+            return text
+    return ""
+
+
+@app.on_event("startup")
+async def start_warm_up():
+    # Keep a reference: the event loop only holds tasks weakly.
+    app.state.warm_up_task = asyncio.create_task(warm_agent())
+
+
+@app.get("/ready")
+async def ready():
+    if not _readiness["ready"]:
+        return Response(content=json.dumps(_readiness), status_code=503, media_type="application/json")
+    return _readiness
+
+
+@app.post("/internal/ui")
+async def push_ui(event: UiEvent, x_ui_channel_token: str = Header(default="")):
+    if not secrets.compare_digest(x_ui_channel_token.encode(), UI_CHANNEL_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="bad ui channel token")
+    out = _ui_streams.get((event.user_id, event.session_id))
+    if out is None:
+        return Response(status_code=204)
+    # Same shape as an ADK event so the widget's stateDelta.ui handling applies.
+    out.put_nowait("data: " + json.dumps({"actions": {"stateDelta": {"ui": event.ui}}}) + "\n\n")
+    return {"status": "ok"}
+
+
 @app.post("/agent/stream")
-async def stream_agent(req: QueryRequest):
+async def stream_agent(req: QueryRequest, traceparent: str | None = Header(default=None)):
     app_name = "my_agent"
+    key = (req.user_id, req.session_id)
+    span, trace_ctx = start_request_span("proxy /agent/stream", req, traceparent)
 
-    async def sse_generator():
-        async with httpx.AsyncClient(timeout=None) as client:
+    async def forward_adk(client: httpx.AsyncClient, out: asyncio.Queue):
+        try:
             session = await ensure_session(client, app_name, req.user_id, req.session_id, req.reset)
             msg = maybe_augment_install_message(req.message, session)
 
@@ -125,6 +270,7 @@ async def stream_agent(req: QueryRequest):
                     "state_delta": {
                         "ps_session_id": req.session_id,
                         "ps_user_id": req.user_id,
+                        tracing.TRACEPARENT_KEY: tracing.format_traceparent(trace_ctx),
                     },
                     # ADK: token-level streaming when true
                     "streaming": True,
@@ -132,7 +278,8 @@ async def stream_agent(req: QueryRequest):
             ) as res:
                 if res.status_code != 200:
                     # Return a single SSE error event
-                    yield f"event: error\ndata: {res.text}\n\n"
+                    body = await res.aread()
+                    out.put_nowait(sse_error(body.decode(errors="replace")))
                     return
 
                 # ADK already emits SSE lines like: data: {...}
@@ -140,7 +287,40 @@ async def stream_agent(req: QueryRequest):
                     if not line:
                         continue
                     # forward exactly
-                    yield line + "\n"
+                    out.put_nowait(line + "\n")
+        except HTTPException as e:
+            out.put_nowait(sse_error(e.detail))
+        except Exception as e:
+            # ADK server down (ConnectError), stream cut mid-way (ReadError), ...:
+            # the browser must see an error, not an empty but clean end.
+            logger.exception("forwarding %s/%s to ADK failed", req.user_id, req.session_id)
+            out.put_nowait(sse_error(f"{type(e).__name__}: {e}"))
+        finally:
+            out.put_nowait(_STREAM_END)
+
+    async def sse_generator():
+        out: asyncio.Queue = asyncio.Queue()
+        _ui_streams[key] = out
+        async with httpx.AsyncClient(timeout=None) as client:
+            task = asyncio.create_task(forward_adk(client, out))
+            try:
+                while True:
+                    item = await out.get()
+                    if item is _STREAM_END:
+                        break
+                    yield item
+                # forward_adk queues its own errors; anything that still escaped
+                # it is reported here instead of dying with the task.
+                await asyncio.wait({task})
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error("forward_adk failed", exc_info=task.exception())
+                    yield sse_error(f"{type(task.exception()).__name__}: {task.exception()}")
+            finally:
+                if _ui_streams.get(key) is out:
+                    del _ui_streams[key]
+                task.cancel()
+                if span is not None:
+                    span.end()
 
     return StreamingResponse(sse_generator(), media_type="text/event-stream")
 
@@ -1 +1,12 @@
-from . import agent
+# The agent graph (and google.adk with it) loads on first access to
+# `agent`, `root_agent` or `app`, so light importers such as main.py
+# (`from my_agent import tracing`) don't pay for it.
+import importlib
+
+
+def __getattr__(name):
+    if name == "agent":
+        return importlib.import_module(".agent", __name__)
+    if name in ("root_agent", "app"):
+        return getattr(importlib.import_module(".agent", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,12 +1,19 @@
 
 from __future__ import annotations
 
-import re
-from typing import Any, Dict
-
 from google.adk.agents.llm_agent import Agent
 from google.adk.tools import agent_tool
 
+from .compaction import compact_history
+from .guard import in_scope, refuse_out_of_scope
+from .model_policy import model_for, record_latency, select_model
+from .prompt_cache import cache_config, check_prefix, record_usage
+from .query_stats import begin_tool_queries, end_tool_queries
+from .results import compact_tool_result, expand_result
+from .router import make_router_callback
+from .startup import warm_up_reply
+from .templating import template_reply
+from .tracing import begin_agent, begin_model, begin_tool, end_agent, end_model, end_tool
 from .tools import (
     search_products,
     get_product_by_part_number,
@@ -28,19 +35,13 @@ from .tools import (
     get_compatible_parts,
     get_compatible_models,
     find_compatible_parts_by_keyword,
+    prefetch_next,
 )
 
-PS_RE = re.compile(r"\bPS\d{5,10}\b", re.IGNORECASE)
-BLOCKED = ["dryer", "washer", "range", "oven", "microwave", "hvac", "furnace", "air conditioner", "stove"]
-
-
-def scope_guard(user_message: str) -> Dict[str, Any]:
-    t = user_message.lower()
-    if any(b in t for b in BLOCKED):
-        return {"status": "blocked", "reason": "I can only help with refrigerator/dishwasher parts and purchases."}
-    return {"status": "ok"}
-
-
+# COMMON_RULES opens every agent's instruction, byte for byte, and no
+# instruction contains state placeholders: the static prefix stays identical
+# across calls so the provider's prefix cache can serve it. Anything per-turn
+# goes into the request contents, never into these strings.
 COMMON_RULES = """
 You are the PartSelect assistant for Refrigerator and Dishwasher parts ONLY.
 
@@ -75,6 +76,8 @@ Responsibilities:
   - list_models(brand if provided)
   - get_compatible_parts(model_number)
   - get_compatible_models(part_number)
+- List results come back summarized (count, top items, handle); the user already sees the full list.
+  Call expand_result(handle, offset) only if you need details that are not in the summary.
 
 Listing rules:
 - If user asks “all models” without category (or a sentence in similar nature): ask “Refrigerator or Dishwasher?” then call list_supported_models.
@@ -93,6 +96,8 @@ Installation rules:
 Compatibility rules:
 - Compatibility and compatible-parts lookups MUST use the model number (model_id/model_number), not the model name.
 - If the user provides a model name or descriptive model text, ask for the exact model number.
+- If a result has corrected_from, the tool matched a mistyped number: name the corrected number in your answer.
+- If a not_found result has did_you_mean, offer those numbers ("Did you mean ...?") instead of asking for the number again.
 
 Do NOT handle:
 - Cart/checkout/shipping/quantity changes.
@@ -142,6 +147,8 @@ Role: Checkout History Specialist.
 Responsibilities:
 - Past checkouts / previous orders: use list_order_history(user_id if available).
 - Use pagination when asked for "more" (increase offset).
+- Results come back summarized (count, recent orders, handle); the user already sees the full list.
+  Call expand_result(handle, offset) only if asked about items inside an order.
 
 Do NOT:
 - Invent order contents (only use tool-provided items).
@@ -182,12 +189,17 @@ Always route through specialist tools. Do not call the underlying domain tools d
 
 
 catalog_agent = Agent(
-    model="gemini-2.5-flash-lite",
+    model=model_for("catalog_specialist"),
     name="catalog_specialist",
     description="Handles product discovery, compatibility checks, installation guidance, and model listings.",
     instruction=CATALOG_INSTRUCTIONS,
+    before_model_callback=[template_reply, check_prefix, select_model, begin_model, compact_history],
+    after_model_callback=[record_usage, record_latency, end_model],
+    before_agent_callback=begin_agent,
+    after_agent_callback=end_agent,
+    before_tool_callback=[begin_tool, begin_tool_queries],
+    after_tool_callback=[end_tool_queries, end_tool, prefetch_next, compact_tool_result],
     tools=[
-        scope_guard,
         search_products,
         get_product_by_part_number,
         check_compatibility,
@@ -198,17 +210,23 @@ catalog_agent = Agent(
         get_compatible_parts,
         get_compatible_models,
         find_compatible_parts_by_keyword,
+        expand_result,
     ],
 )
 
 
 transaction_agent = Agent(
-    model="gemini-2.5-flash-lite",
+    model=model_for("transaction_specialist"),
     name="transaction_specialist",
     description="Handles cart operations, shipping estimates, and checkout.",
     instruction=TRANSACTION_INSTRUCTIONS,
+    before_model_callback=[template_reply, check_prefix, select_model, begin_model, compact_history],
+    after_model_callback=[record_usage, record_latency, end_model],
+    before_agent_callback=begin_agent,
+    after_agent_callback=end_agent,
+    before_tool_callback=[begin_tool, begin_tool_queries],
+    after_tool_callback=[end_tool_queries, end_tool],
     tools=[
-        scope_guard,
         create_or_get_cart,
         add_to_cart,
         set_cart_item_quantity,
@@ -222,13 +240,19 @@ transaction_agent = Agent(
 
 
 history_agent = Agent(
-    model="gemini-2.5-flash-lite",
+    model=model_for("history_specialist"),
     name="history_specialist",
     description="Provides checkout history for the current demo session.",
     instruction=HISTORY_INSTRUCTIONS,
+    before_model_callback=[check_prefix, select_model, begin_model, compact_history],
+    after_model_callback=[record_usage, record_latency, end_model],
+    before_agent_callback=begin_agent,
+    after_agent_callback=end_agent,
+    before_tool_callback=[begin_tool, begin_tool_queries],
+    after_tool_callback=[end_tool_queries, end_tool, compact_tool_result],
     tools=[
-        scope_guard,
         list_order_history,
+        expand_result,
     ],
 )
 
@@ -237,15 +261,42 @@ transaction_tool = agent_tool.AgentTool(agent=transaction_agent)
 history_tool = agent_tool.AgentTool(agent=history_agent)
 
 root_agent = Agent(
-    model="gemini-2.5-flash-lite",
+    model=model_for("partselect_coordinator"),
     name="partselect_coordinator",
     description="Coordinator agent that delegates to catalog, transaction, and history specialists.",
     instruction=COORDINATOR_INSTRUCTIONS,
+    # Out-of-scope turns are refused and confident turns dispatched locally,
+    # both before the coordinator LLM is called; the LLM only routes the rest.
+    # In every agent compact_history comes last, so it only runs for a call
+    # that is actually made.
+    before_model_callback=[
+        warm_up_reply,
+        refuse_out_of_scope,
+        make_router_callback(in_scope),
+        template_reply,
+        check_prefix,
+        select_model,
+        begin_model,
+        compact_history,
+    ],
+    after_model_callback=[record_usage, record_latency, end_model],
+    before_agent_callback=begin_agent,
+    after_agent_callback=end_agent,
+    before_tool_callback=[begin_tool, begin_tool_queries],
+    after_tool_callback=[end_tool_queries, end_tool],
     tools=[
-        scope_guard,
         # Specialist agents as explicit tools (no handoff)
         catalog_tool,
         transaction_tool,
         history_tool,
     ],
 )
+
+
+# Explicit context caching when the installed ADK supports it; `adk api_server`
+# picks up `app` in preference to `root_agent`.
+_cache_config = cache_config()
+if _cache_config is not None:
+    from google.adk.apps import App
+
+    app = App(name="my_agent", root_agent=root_agent, context_cache_config=_cache_config)
@@ -0,0 +1,361 @@
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .metrics import metrics
+from .supabase_client import sb
+
+
+logger = logging.getLogger(__name__)
+
+CATALOG_INDEX_TTL_S = float(os.environ.get("CATALOG_INDEX_TTL_S", "900"))
+# How long a tool waits for the first load before answering without suggestions.
+CATALOG_INDEX_WAIT_S = float(os.environ.get("CATALOG_INDEX_WAIT_S", "2"))
+# Identifiers that just missed in the database are rejected in-process for
+# this long (the set is bounded and cleared whenever the index reloads).
+NEGATIVE_CACHE_TTL_S = float(os.environ.get("NEGATIVE_CACHE_TTL_S", "600"))
+NEGATIVE_CACHE_MAX = int(os.environ.get("NEGATIVE_CACHE_MAX", "10000"))
+# ingest touches this file after a load. The index and the negative cache
+# count as stale once its mtime differs from when they were built.
+CATALOG_STAMP = os.environ.get(
+    "CATALOG_STAMP",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".local", "catalog.stamp"),
+)
+STAMP_CHECK_S = 1.0
+MAX_SUGGESTIONS = 5
+PAGE_SIZE = 1000
+# Candidates scored per lookup; trigrams shared by more keys than this share
+# of the index are too common to narrow anything down and are skipped.
+MAX_SCORED = 200
+COMMON_GRAM_SHARE = 0.05
+
+# kind -> (table, column)
+SOURCES = {
+    "part": ("products", "part_number"),
+    "model": ("appliance_models", "model_number"),
+}
+
+_NON_ALNUM = re.compile(r"[^A-Z0-9]")
+
+
+def normalize(kind: str, value: str) -> str:
+    """Case, dashes, spaces and punctuation don't distinguish identifiers."""
+    key = _NON_ALNUM.sub("", str(value or "").upper())
+    if kind == "part" and key.isdigit():
+        key = "PS" + key
+    return key
+
+
+def _distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (adjacent swaps count once); limit + 1 once over."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _digit_slip(kind: str, a: str, b: str) -> bool:
+    """Part numbers are sequential "PS" + digits: a slipped digit names another real part."""
+    return kind == "part" and a[:2] == b[:2] == "PS" and a[2:].isdigit() and b[2:].isdigit()
+
+
+def grams(key: str) -> List[str]:
+    """Trigrams of `key`, padded with ^ and $ (the snapshot stores the same postings)."""
+    padded = f"^{key}$"
+    return [padded[i : i + 3] for i in range(len(padded) - 2)]
+
+
+class Match:
+    """
+    Outcome of a fuzzy lookup. `resolved` is the canonical identifier when the
+    input maps to exactly one known one (same normalized form, or a single
+    near-match that isn't a part number off by digits); `candidates` are
+    ranked suggestions otherwise.
+    """
+
+    def __init__(self, resolved: Optional[str], candidates: List[str]):
+        self.resolved = resolved
+        self.candidates = candidates
+
+
+class IdIndex:
+    """Normalized identifiers with trigram postings and a sorted key list for prefix lookups."""
+
+    def __init__(self, kind: str, identifiers: Iterable[str]):
+        self.kind = kind
+        self.canonical: Dict[str, str] = {}
+        for ident in identifiers:
+            if ident:
+                self.canonical.setdefault(normalize(kind, ident), ident)
+        self.keys = sorted(self.canonical)
+        self.grams: Dict[str, List[int]] = {}
+        for n, key in enumerate(self.keys):
+            for g in set(grams(key)):
+                self.grams.setdefault(g, []).append(n)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Canonical identifier for a normalized key."""
+        return self.canonical.get(key)
+
+    def _prefixed(self, key: str) -> List[str]:
+        out = []
+        i = bisect.bisect_left(self.keys, key)
+        while i < len(self.keys) and self.keys[i].startswith(key) and len(out) < MAX_SUGGESTIONS:
+            out.append(self.keys[i])
+            i += 1
+        return out
+
+    def _candidates(self, key: str) -> List[str]:
+        """Keys sharing the most uncommon trigrams with `key`, best first."""
+        common = max(50, int(len(self) * COMMON_GRAM_SHARE))
+        shared: Dict[int, int] = {}
+        for g in set(grams(key)):
+            posting = self.grams.get(g)
+            if not posting or len(posting) > common:
+                continue
+            for n in posting:
+                shared[n] = shared.get(n, 0) + 1
+        return [self.keys[n] for n in sorted(shared, key=shared.__getitem__, reverse=True)[:MAX_SCORED]]
+
+    def match(self, value: str) -> Match:
+        key = normalize(self.kind, value)
+        if not key:
+            return Match(None, [])
+        exact = self.lookup(key)
+        if exact is not None:
+            return Match(exact, [])
+        limit = 1 if len(key) < 6 else 2
+        scored = {}
+        for k in self._candidates(key):
+            d = _distance(key, k, limit)
+            if d <= limit:
+                scored[k] = d
+        # Missing suffixes ("WDT780SAEM" for "WDT780SAEM1") are the most common slip.
+        for k in self._prefixed(key) if len(key) >= 5 else []:
+            scored[k] = min(scored.get(k, 1), 1)
+        ranked = sorted(scored, key=lambda k: (scored[k], abs(len(k) - len(key)), k))[:MAX_SUGGESTIONS]
+        candidates = [self.lookup(k) or k for k in ranked]
+        unique_near = ranked and scored[ranked[0]] == 1 and (len(ranked) == 1 or scored[ranked[1]] > 1)
+        # Only suggested, never auto-corrected: PS11752779 is not PS11752778.
+        unique_near = unique_near and not _digit_slip(self.kind, key, ranked[0])
+        if unique_near:
+            return Match(candidates[0], candidates[1:])
+        return Match(None, candidates)
+
+
+class CatalogIndex:
+    def __init__(
+        self,
+        indexes: Dict[str, IdIndex],
+        loaded_at: float,
+        built_at: Optional[float] = None,
+        stamp: float = 0.0,
+        snapshot: Any = None,
+    ):
+        self.indexes = indexes
+        # loaded_at schedules refreshes (a failed one pushes it out); built_at
+        # is when the identifiers were actually read.
+        self.loaded_at = loaded_at
+        self.built_at = loaded_at if built_at is None else built_at
+        # The catalog stamp and the mapped snapshot the identifiers came from.
+        self.stamp = stamp
+        self.snapshot = snapshot
+
+
+_index: Optional[CatalogIndex] = None
+_refresh_lock = threading.Lock()
+_loaded = threading.Event()
+# (kind, identifier as given) -> expiry
+_absent: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+_absent_lock = threading.Lock()
+_absent_stamp = 0.0
+# (checked at, mtime) of CATALOG_STAMP
+_stamp_seen: Tuple[float, float] = (float("-inf"), 0.0)
+
+
+def stamp(max_age_s: float = STAMP_CHECK_S) -> float:
+    """mtime of CATALOG_STAMP (0 if missing), stat'ed at most every `max_age_s`."""
+    global _stamp_seen
+    now = time.monotonic()
+    if now - _stamp_seen[0] >= max_age_s:
+        try:
+            mtime = os.stat(CATALOG_STAMP).st_mtime
+        except OSError:
+            mtime = 0.0
+        _stamp_seen = (now, mtime)
+    return _stamp_seen[1]
+
+
+def _outdated(index: CatalogIndex) -> bool:
+    """The catalog changed after `index` was built: an ingest ran or the snapshot was replaced."""
+    if index.stamp != stamp():
+        return True
+    if index.snapshot is not None:
+        from . import catalog_snapshot
+
+        return catalog_snapshot.client() is not index.snapshot
+    return False
+
+
+def bump() -> None:
+    """Mark the catalog as changed for every process (called by ingest after a load)."""
+    os.makedirs(os.path.dirname(CATALOG_STAMP), exist_ok=True)
+    with open(CATALOG_STAMP, "a", encoding="utf-8"):
+        pass
+    os.utime(CATALOG_STAMP)
+
+
+def _load_ids(table: str, column: str) -> List[str]:
+    ids: List[str] = []
+    start = 0
+    while True:
+        res = sb().table(table).select(column).order(column).range(start, start + PAGE_SIZE - 1).execute()
+        rows = res.data or []
+        ids.extend(r[column] for r in rows if r.get(column))
+        if len(rows) < PAGE_SIZE:
+            return ids
+        start += PAGE_SIZE
+
+
+def _refresh() -> None:
+    global _index
+    t0 = time.perf_counter()
+    try:
+        from . import catalog_snapshot
+
+        # Read before the identifiers, so a load racing an ingest counts as stale.
+        stamped = stamp(0)
+        snap = catalog_snapshot.client()
+        if snap is not None:
+            # Matches run against the mapped snapshot; nothing to load.
+            now = time.monotonic()
+            _index = CatalogIndex(
+                {kind: catalog_snapshot.SnapshotIdIndex(snap, kind) for kind in SOURCES},
+                now,
+                now - catalog_snapshot.age_s(),
+                stamped,
+                snap,
+            )
+        else:
+            _index = CatalogIndex(
+                {kind: IdIndex(kind, _load_ids(table, column)) for kind, (table, column) in SOURCES.items()},
+                time.monotonic(),
+                stamp=stamped,
+            )
+        with _absent_lock:
+            _absent.clear()
+        metrics.observe("catalog_index.load", time.perf_counter() - t0)
+    except Exception:
+        logger.exception("catalog index load failed; keeping the previous index")
+        if _index is not None:
+            # Back off for a full TTL instead of retrying on every miss.
+            _index = CatalogIndex(_index.indexes, time.monotonic(), _index.built_at, _index.stamp, _index.snapshot)
+    finally:
+        _loaded.set()
+        _refresh_lock.release()
+
+
+def _start_refresh() -> None:
+    if _refresh_lock.acquire(blocking=False):
+        # A plain thread: the load isn't charged to whichever tool triggered it.
+        threading.Thread(target=_refresh, name="catalog-index", daemon=True).start()
+
+
+def catalog_index(wait_s: float = CATALOG_INDEX_WAIT_S) -> Optional[CatalogIndex]:
+    """
+    The current index, loading it in the background on first use, when it
+    is older than CATALOG_INDEX_TTL_S and when the catalog changed under it
+    (see _outdated). The first caller waits up to `wait_s`;
+    None means it isn't available (yet).
+    """
+    current = _index
+    if current is None or time.monotonic() - current.loaded_at > CATALOG_INDEX_TTL_S or _outdated(current):
+        _start_refresh()
+    if current is None and wait_s > 0:
+        _loaded.wait(wait_s)
+        current = _index
+    return current
+
+
+def refresh() -> None:
+    """Synchronously rebuild the index (e.g. after an ingest run)."""
+    _refresh_lock.acquire()
+    _refresh()
+
+
+def match(kind: str, value: str) -> Optional[Match]:
+    """Fuzzy lookup of a part ("part") or model ("model") number; None if no index."""
+    index = catalog_index()
+    if index is None:
+        return None
+    result = index.indexes[kind].match(value)
+    metrics.incr(f"catalog_index.{kind}.{'resolved' if result.resolved else 'suggested' if result.candidates else 'miss'}")
+    return result
+
+
+def known_absent(kind: str, value: str) -> bool:
+    """
+    True when `value` is certainly not a known part/model number, so the
+    exact database lookup can be skipped: it missed recently, or a fresh index
+    is loaded and has no identifier with its normalized form. Both are
+    dropped once an ingest bumps the catalog stamp. Never loads the index
+    itself; without one only the recent-miss set answers.
+    """
+    global _absent_stamp
+    raw = str(value or "").strip()
+    if not raw:
+        return False
+    now = time.monotonic()
+    stamped = stamp()
+    with _absent_lock:
+        if stamped != _absent_stamp:
+            # An ingest ran: earlier misses may exist now.
+            _absent.clear()
+            _absent_stamp = stamped
+        expiry = _absent.get((kind, raw))
+        if expiry is not None and expiry <= now:
+            del _absent[(kind, raw)]
+            expiry = None
+    index = _index
+    if expiry is None and (
+        index is None
+        or now - index.built_at > CATALOG_INDEX_TTL_S
+        or _outdated(index)
+        or index.indexes[kind].lookup(normalize(kind, raw)) is not None
+    ):
+        return False
+    metrics.incr(f"catalog_index.{kind}.negative_hit")
+    return True
+
+
+def remember_absent(kind: str, value: str) -> None:
+    """Record that the exact lookup of `value` missed."""
+    raw = str(value or "").strip()
+    if not raw:
+        return
+    with _absent_lock:
+        _absent[(kind, raw)] = time.monotonic() + NEGATIVE_CACHE_TTL_S
+        _absent.move_to_end((kind, raw))
+        while len(_absent) > NEGATIVE_CACHE_MAX:
+            _absent.popitem(last=False)
@@ -0,0 +1,265 @@
+"""
+Read-only catalog snapshot shared by every worker process.
+
+`build()` copies the catalog tables (products, appliance_models,
+product_compatibility, installation_guides, product_prices) from the live
+database into one SQLite file, together with the normalized part/model
+identifiers and their trigram postings that catalog_index would otherwise
+build in memory. The file is written next to its final path and renamed
+into place, so readers never see a partial snapshot.
+
+With CATALOG_SNAPSHOT set to that path, each process opens it immutable and
+memory-mapped (local_db.SqliteClient(read_only=True)): the pages live once
+in the OS page cache however many workers map them, so per-process memory
+stays flat as workers are added. sb() then serves selects on the catalog
+tables from the snapshot (writes still go to the live database),
+catalog_index matches against its identifier tables and pricing reads
+prices from it. A rebuilt file is picked up within SNAPSHOT_CHECK_S.
+
+    cd server
+    python -m my_agent.catalog_snapshot .local/catalog.snapshot.db
+"""
+from __future__ import annotations
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from . import catalog_index, pricing
+from .catalog_index import COMMON_GRAM_SHARE, MAX_SCORED, MAX_SUGGESTIONS, SOURCES, IdIndex, grams, normalize
+from .local_db import SqliteClient
+
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SNAPSHOT = os.environ.get("CATALOG_SNAPSHOT", "")
+# Where serve.py keeps it unless told otherwise.
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".local", "catalog.snapshot.db")
+SNAPSHOT_CHECK_S = float(os.environ.get("SNAPSHOT_CHECK_S", "30"))
+PAGE_SIZE = 1000
+
+# table -> ordering used to page through it
+TABLES = {
+    "products": ("id",),
+    "appliance_models": ("id",),
+    "product_compatibility": ("product_id", "model_id"),
+    "installation_guides": ("id",),
+    "product_prices": ("product_id",),
+}
+
+IDENTIFIER_SCHEMA = """
+create table identifiers (
+    kind text not null,
+    norm text not null,
+    canonical text not null,
+    primary key (kind, norm)
+) without rowid;
+create table identifier_grams (
+    kind text not null,
+    gram text not null,
+    norm text not null,
+    primary key (kind, gram, norm)
+) without rowid;
+create table gram_counts (
+    kind text not null,
+    gram text not null,
+    n integer not null,
+    primary key (kind, gram)
+) without rowid;
+"""
+
+
+# ----------------------------
+# Building
+# ----------------------------
+
+def _pages(table: str, order: Tuple[str, ...]) -> Iterator[List[Dict[str, Any]]]:
+    from .supabase_client import sb_live
+
+    start = 0
+    while True:
+        q = sb_live().table(table).select("*")
+        for column in order:
+            q = q.order(column)
+        rows = q.range(start, start + PAGE_SIZE - 1).execute().data or []
+        if rows:
+            yield rows
+        if len(rows) < PAGE_SIZE:
+            return
+        start += PAGE_SIZE
+
+
+def _identifiers(out: SqliteClient) -> None:
+    conn = out.conn
+    conn.executescript(IDENTIFIER_SCHEMA)
+    for kind, (table, column) in SOURCES.items():
+        canonical: Dict[str, str] = {}
+        for (ident,) in conn.execute(f"select {column} from {table} where {column} is not null order by id"):
+            canonical.setdefault(normalize(kind, ident), ident)
+        conn.executemany(
+            "insert into identifiers (kind, norm, canonical) values (?, ?, ?)",
+            ((kind, norm, ident) for norm, ident in canonical.items()),
+        )
+        counts: Dict[str, int] = {}
+        postings = []
+        for norm in canonical:
+            for g in set(grams(norm)):
+                counts[g] = counts.get(g, 0) + 1
+                postings.append((kind, g, norm))
+        conn.executemany("insert into identifier_grams (kind, gram, norm) values (?, ?, ?)", postings)
+        conn.executemany("insert into gram_counts (kind, gram, n) values (?, ?, ?)", ((kind, g, n) for g, n in counts.items()))
+    conn.commit()
+
+
+def build(path: str = CATALOG_SNAPSHOT) -> Dict[str, int]:
+    """Write a fresh snapshot of the live catalog to `path`; returns row counts."""
+    if not path:
+        raise ValueError("no snapshot path (set CATALOG_SNAPSHOT)")
+    tmp = f"{path}.building-{os.getpid()}"
+    for leftover in (tmp, tmp + "-wal", tmp + "-shm"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    out = SqliteClient(tmp)
+    counts: Dict[str, int] = {}
+    for table, order in TABLES.items():
+        counts[table] = 0
+        try:
+            for rows in _pages(table, order):
+                counts[table] += out.bulk_insert(table, rows, on_conflict=",".join(order))
+        except Exception as e:
+            # Prices are optional (pricing.py); the snapshot keeps an empty table.
+            if table != "product_prices" or not pricing.table_missing(e):
+                raise
+            logger.error("catalog snapshot: %s does not exist; building without prices", table)
+    _identifiers(out)
+    # A single self-contained file: immutable readers never look for a -wal.
+    out.conn.execute("pragma journal_mode=delete")
+    out.conn.execute("analyze")
+    out.conn.execute("vacuum")
+    out.conn.close()
+    os.replace(tmp, path)
+    logger.info("catalog snapshot %s: %s", path, counts)
+    return counts
+
+
+# ----------------------------
+# Reading
+# ----------------------------
+
+_client: Optional[SqliteClient] = None
+_stamp: Optional[Tuple[int, float]] = None
+_checked_at = 0.0
+_catalog_stamp = 0.0
+_lock = threading.Lock()
+
+
+def client() -> Optional[SqliteClient]:
+    """
+    The mapped snapshot, reopened when the file has been replaced; None when
+    off or missing. The file is checked every SNAPSHOT_CHECK_S, and right
+    away once an ingest bumps the catalog stamp.
+    """
+    global _client, _stamp, _checked_at, _catalog_stamp
+    if not CATALOG_SNAPSHOT:
+        return None
+    now = time.monotonic()
+    catalog_stamp = catalog_index.stamp()
+    if _client is not None and now - _checked_at < SNAPSHOT_CHECK_S and catalog_stamp == _catalog_stamp:
+        return _client
+    with _lock:
+        _checked_at = now
+        _catalog_stamp = catalog_stamp
+        try:
+            st = os.stat(CATALOG_SNAPSHOT)
+        except OSError:
+            if _client is None:
+                logger.warning("catalog snapshot %s not found; reading the live database", CATALOG_SNAPSHOT)
+            return _client
+        if _client is None or (st.st_ino, st.st_mtime) != _stamp:
+            _client = SqliteClient(CATALOG_SNAPSHOT, read_only=True)
+            _stamp = (st.st_ino, st.st_mtime)
+        return _client
+
+
+def age_s() -> float:
+    """Seconds since the mapped snapshot was built."""
+    return max(0.0, time.time() - _stamp[1]) if _stamp is not None else float("inf")
+
+
+class SnapshotIdIndex(IdIndex):
+    """IdIndex answering from the snapshot's identifier tables instead of process memory."""
+
+    def __init__(self, snap: SqliteClient, kind: str):
+        self.kind = kind
+        self.snap = snap
+        with snap.lock:
+            self._size = snap.conn.execute("select count(*) from identifiers where kind = ?", (kind,)).fetchone()[0]
+
+    def __len__(self) -> int:
+        return self._size
+
+    def lookup(self, key: str) -> Optional[str]:
+        with self.snap.lock:
+            hit = self.snap.conn.execute(
+                "select canonical from identifiers where kind = ? and norm = ?", (self.kind, key)
+            ).fetchone()
+        return hit[0] if hit else None
+
+    def _prefixed(self, key: str) -> List[str]:
+        with self.snap.lock:
+            rows = self.snap.conn.execute(
+                "select norm from identifiers where kind = ? and norm >= ? and norm < ? order by norm limit ?",
+                (self.kind, key, key + "\x7f", MAX_SUGGESTIONS),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def _candidates(self, key: str) -> List[str]:
+        trigrams = sorted(set(grams(key)))
+        common = max(50, int(len(self) * COMMON_GRAM_SHARE))
+        with self.snap.lock:
+            rows = self.snap.conn.execute(
+                f"select g.norm from identifier_grams g join gram_counts c on c.kind = g.kind and c.gram = g.gram "
+                f"where g.kind = ? and g.gram in ({','.join('?' * len(trigrams))}) and c.n <= ? "
+                f"group by g.norm order by count(*) desc limit ?",
+                (self.kind, *trigrams, common, MAX_SCORED),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+
+class SnapshotPrices(Mapping):
+    """product_id -> unit_price_cents read from the snapshot on demand."""
+
+    def __init__(self, snap: SqliteClient):
+        self.snap = snap
+
+    def __getitem__(self, product_id: str) -> int:
+        with self.snap.lock:
+            hit = self.snap.conn.execute(
+                "select unit_price_cents from product_prices where product_id = ? and unit_price_cents is not null",
+                (str(product_id),),
+            ).fetchone()
+        if hit is None:
+            raise KeyError(product_id)
+        return int(hit[0])
+
+    def __iter__(self) -> Iterator[str]:
+        with self.snap.lock:
+            rows = self.snap.conn.execute("select product_id from product_prices where unit_price_cents is not null").fetchall()
+        return iter(str(r[0]) for r in rows)
+
+    def __len__(self) -> int:
+        with self.snap.lock:
+            return self.snap.conn.execute("select count(*) from product_prices where unit_price_cents is not null").fetchone()[0]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    target = sys.argv[1] if len(sys.argv) > 1 else CATALOG_SNAPSHOT
+    t0 = time.perf_counter()
+    for name, n in build(target).items():
+        print(f"  {name}: {n}")
+    print(f"{target} in {time.perf_counter() - t0:.1f}s")
@@ -0,0 +1,178 @@
+"""
+Session history compaction for model calls.
+
+ADK re-sends every past function call, function response and message on each
+model call, so latency and cost grow with the conversation. This
+before_model_callback rewrites only the outgoing request (the stored session
+is untouched):
+
+- the last COMPACTION_KEEP_TURNS turns are kept verbatim;
+- older turns are folded into one summary message with the key state
+  (last part, model, cart, zip), and their tool payloads are dropped;
+- if the request is still over COMPACTION_TOKEN_BUDGET, tool payloads of the
+  earlier kept turns are replaced by status stubs, then fewer turns are kept.
+  The current turn is never altered.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Any, List
+
+from .metrics import metrics
+
+
+COMPACTION_ENABLED = os.environ.get("COMPACTION_ENABLED", "1") != "0"
+COMPACTION_KEEP_TURNS = int(os.environ.get("COMPACTION_KEEP_TURNS", "4"))
+COMPACTION_TOKEN_BUDGET = int(os.environ.get("COMPACTION_TOKEN_BUDGET", "6000"))
+SUMMARY_USER_CHARS = 160
+SUMMARY_REPLY_CHARS = 200
+
+
+def _part_tokens(part: Any) -> int:
+    if getattr(part, "text", None):
+        return len(part.text) // 4
+    fc = getattr(part, "function_call", None)
+    if fc is not None:
+        return len(json.dumps(fc.args or {}, default=str)) // 4 + 8
+    fr = getattr(part, "function_response", None)
+    if fr is not None:
+        return len(json.dumps(fr.response or {}, default=str)) // 4 + 8
+    return 0
+
+
+def content_tokens(contents: List[Any]) -> int:
+    return sum(_part_tokens(p) for c in contents for p in (c.parts or []))
+
+
+def _starts_turn(content: Any) -> bool:
+    if getattr(content, "role", None) != "user":
+        return False
+    parts = content.parts or []
+    return any(getattr(p, "text", None) for p in parts) and not any(
+        getattr(p, "function_response", None) for p in parts
+    )
+
+
+def split_turns(contents: List[Any]) -> List[List[Any]]:
+    turns: List[List[Any]] = []
+    for c in contents:
+        if _starts_turn(c) or not turns:
+            turns.append([c])
+        else:
+            turns[-1].append(c)
+    return turns
+
+
+def _text(content: Any) -> str:
+    return " ".join(p.text.strip() for p in content.parts or [] if getattr(p, "text", None)).strip()
+
+
+def _clip(text: str, n: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= n else text[: n - 1] + "…"
+
+
+def _summarize(turns: List[List[Any]], state: Any) -> str:
+    lines = ["Summary of the earlier conversation (tool results omitted):"]
+    for turn in turns:
+        user = _text(turn[0]) if _starts_turn(turn[0]) else ""
+        reply = ""
+        tools = []
+        for c in turn[1:]:
+            for p in c.parts or []:
+                fc = getattr(p, "function_call", None)
+                if fc is not None:
+                    tools.append(fc.name)
+            if getattr(c, "role", None) == "model" and _text(c):
+                reply = _text(c)
+        line = f"- User: {_clip(user, SUMMARY_USER_CHARS)}"
+        if tools:
+            line += f" [tools: {', '.join(dict.fromkeys(tools))}]"
+        if reply:
+            line += f" | Assistant: {_clip(reply, SUMMARY_REPLY_CHARS)}"
+        lines.append(line)
+
+    facts = []
+    if state.get("last_part_number"):
+        facts.append(f"last part {state.get('last_part_number')}")
+    compat = state.get("last_compatibility") or {}
+    if compat.get("model_number"):
+        verdict = "compatible" if compat.get("compatible") else "not compatible"
+        facts.append(f"last model {compat['model_number']} ({compat.get('part_number')} {verdict})")
+    if state.get("cart_id"):
+        facts.append(f"cart {state.get('cart_id')}")
+    if state.get("last_zip_code"):
+        facts.append(f"zip {state.get('last_zip_code')}")
+    if facts:
+        lines.append("Key state: " + "; ".join(facts) + ".")
+    return "\n".join(lines)
+
+
+def _stubbed(turn: List[Any]) -> List[Any]:
+    """Copy of `turn` with function response payloads replaced by status stubs."""
+    from google.genai import types
+
+    out = []
+    for c in turn:
+        parts = c.parts or []
+        if not any(getattr(p, "function_response", None) for p in parts):
+            out.append(c)
+            continue
+        new_parts = []
+        for p in parts:
+            fr = getattr(p, "function_response", None)
+            if fr is None:
+                new_parts.append(p)
+                continue
+            status = fr.response.get("status") if isinstance(fr.response, dict) else None
+            new_parts.append(
+                types.Part(
+                    function_response=types.FunctionResponse(
+                        id=getattr(fr, "id", None),
+                        name=fr.name,
+                        response={"status": status, "note": "payload omitted from history"},
+                    )
+                )
+            )
+        out.append(types.Content(role=c.role, parts=new_parts))
+    return out
+
+
+def compact_history(callback_context, llm_request):
+    """before_model_callback (last in the chain): shrink llm_request.contents; never short-circuits."""
+    contents = getattr(llm_request, "contents", None) or []
+    if not COMPACTION_ENABLED or not contents:
+        return None
+    turns = split_turns(contents)
+    keep = min(max(1, COMPACTION_KEEP_TURNS), len(turns))
+    before = content_tokens(contents)
+    if len(turns) <= keep and before <= COMPACTION_TOKEN_BUDGET:
+        return None
+
+    from google.genai import types
+
+    state = callback_context.state
+
+    def build(keep_n: int, stub: bool) -> List[Any]:
+        old, recent = turns[:-keep_n], turns[-keep_n:]
+        out: List[Any] = []
+        if old:
+            out.append(types.Content(role="user", parts=[types.Part(text=_summarize(old, state))]))
+        for turn in recent[:-1]:
+            out.extend(_stubbed(turn) if stub else turn)
+        out.extend(recent[-1])
+        return out
+
+    compacted = build(keep, stub=False)
+    if content_tokens(compacted) > COMPACTION_TOKEN_BUDGET:
+        compacted = build(keep, stub=True)
+    while content_tokens(compacted) > COMPACTION_TOKEN_BUDGET and keep > 1:
+        keep -= 1
+        compacted = build(keep, stub=True)
+
+    after = content_tokens(compacted)
+    llm_request.contents = compacted
+    metrics.incr("compaction.requests")
+    metrics.incr("compaction.tokens_dropped", max(0, before - after))
+    return None
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from .metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+FANOUT_MAX_WORKERS = int(os.environ.get("FANOUT_MAX_WORKERS", "16"))
+
+_pool = ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix="fanout")
+_in_fanout: contextvars.ContextVar[bool] = contextvars.ContextVar("in_fanout", default=False)
+
+
+def _timed(label: str, name: str, fn: Callable[[], Any]) -> tuple[Any, float]:
+    start = time.perf_counter()
+    try:
+        return fn(), time.perf_counter() - start
+    finally:
+        metrics.observe(f"fanout.{label}.{name}", time.perf_counter() - start)
+
+
+def _worker(label: str, name: str, fn: Callable[[], Any]) -> tuple[Any, float]:
+    # Runs inside a copied context, so the flag never leaks back to the caller.
+    _in_fanout.set(True)
+    return _timed(label, name, fn)
+
+
+def fan_out(label: str, **calls: Callable[[], Any]) -> Dict[str, Any]:
+    """
+    Run independent zero-arg callables concurrently and return {name: result}.
+
+    Each call runs in a copy of the caller's context, so context variables
+    follow it onto the pool thread. Per-call
+    timings go to metrics as fanout.<label>.<name>; fanout.<label>.wall and
+    fanout.<label>.serial record what the batch cost versus what running the
+    calls back-to-back would have cost. The first exception is re-raised after
+    every call has finished. Nested fan-outs run inline to avoid starving the
+    pool.
+    """
+    start = time.perf_counter()
+    if _in_fanout.get() or len(calls) < 2:
+        timed = {name: _timed(label, name, fn) for name, fn in calls.items()}
+    else:
+        futures = {
+            name: _pool.submit(contextvars.copy_context().run, _worker, label, name, fn)
+            for name, fn in calls.items()
+        }
+        timed = {}
+        error = None
+        for name, fut in futures.items():
+            try:
+                timed[name] = fut.result()
+            except BaseException as e:
+                error = error or e
+        if error is not None:
+            raise error
+    wall = time.perf_counter() - start
+    serial = sum(t for _, t in timed.values())
+    metrics.observe(f"fanout.{label}.wall", wall)
+    metrics.observe(f"fanout.{label}.serial", serial)
+    logger.debug("fan_out %s: wall=%.1fms serial=%.1fms", label, wall * 1000, serial * 1000)
+    return {name: result for name, (result, _) in timed.items()}
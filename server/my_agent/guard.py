@@ -0,0 +1,87 @@
+"""
+Out-of-scope guard, run before any model call.
+
+Used to be an LLM tool (`scope_guard`), which cost a model -> tool -> model
+round trip just to scan a string. Now the coordinator's before_model_callback
+scores the fresh user message with one compiled, word-bounded regex and
+answers blocked messages with a canned refusal, so no LLM runs at all.
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, Optional
+
+from .metrics import metrics
+
+
+BLOCKED = ["dryer", "washer", "range", "oven", "microwave", "hvac", "furnace", "air conditioner", "stove"]
+IN_SCOPE = ["refrigerator", "fridge", "freezer", "ice maker", "dishwasher"]
+REFUSAL = "I can only help with refrigerator/dishwasher parts and purchases."
+
+
+def _alternation(words) -> str:
+    # Longest first so "air conditioner" wins over any shorter overlap.
+    return "|".join(re.escape(w).replace(r"\ ", r"\s+") for w in sorted(words, key=len, reverse=True))
+
+
+# One pass finds both kinds of mention; \b keeps "dishwasher" from matching "washer".
+_TERMS_RE = re.compile(
+    rf"\b(?:(?P<blocked>{_alternation(BLOCKED)})|(?P<in_scope>{_alternation(IN_SCOPE)}|PS\d{{5,10}}))s?\b",
+    re.IGNORECASE,
+)
+
+
+def score(user_message: str) -> Dict[str, Any]:
+    """
+    Count blocked and in-scope appliance mentions. A message is blocked when it
+    names another appliance more often than a refrigerator/dishwasher (or part).
+    """
+    blocked = []
+    in_scope = 0
+    for m in _TERMS_RE.finditer(user_message or ""):
+        if m.group("blocked"):
+            blocked.append(re.sub(r"\s+", " ", m.group("blocked").lower()))
+        else:
+            in_scope += 1
+    return {"blocked_terms": blocked, "in_scope_hits": in_scope, "score": len(blocked) - in_scope}
+
+
+def scope_guard(user_message: str) -> Dict[str, Any]:
+    s = score(user_message)
+    if s["blocked_terms"] and s["score"] > 0:
+        return {"status": "blocked", "reason": REFUSAL, **s}
+    return {"status": "ok", **s}
+
+
+def in_scope(user_message: str) -> bool:
+    return scope_guard(user_message)["status"] == "ok"
+
+
+def fresh_user_text(llm_request: Any) -> Optional[str]:
+    """The user's message if this model call starts a turn (not a tool follow-up)."""
+    contents = getattr(llm_request, "contents", None) or []
+    if not contents or getattr(contents[-1], "role", None) != "user":
+        return None
+    parts = contents[-1].parts or []
+    if any(getattr(p, "function_response", None) for p in parts):
+        return None
+    return "".join(p.text for p in parts if getattr(p, "text", None)) or None
+
+
+def refuse_out_of_scope(callback_context, llm_request):
+    """before_model_callback: short-circuit blocked messages with REFUSAL."""
+    text = fresh_user_text(llm_request)
+    if text is None:
+        return None
+    metrics.incr("scope_guard.checked")
+    verdict = scope_guard(text)
+    if verdict["status"] == "ok":
+        return None
+    metrics.incr("scope_guard.refused")
+    for term in verdict["blocked_terms"]:
+        metrics.incr(f"scope_guard.term.{term}")
+
+    from google.genai import types
+    from google.adk.models import LlmResponse
+
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=REFUSAL)]))
@@ -0,0 +1,186 @@
+"""
+Order-summary read model for checkout and order history.
+
+One denormalized row per order, written at checkout time, so both history
+views are a single indexed read instead of orders -> order_items fan-out:
+
+    create table order_summaries (
+        order_id uuid primary key references orders(id),
+        user_id text not null,
+        session_id text not null,
+        cart_id uuid not null,
+        checkout_session_id uuid not null,
+        checkout_url text,
+        checkout_status text,
+        status text not null,
+        item_count int not null,
+        subtotal_cents int,
+        items jsonb not null default '[]',
+        created_at timestamptz not null default now()
+    );
+    create index on order_summaries (user_id, created_at desc);
+    create index on order_summaries (session_id, created_at desc);
+
+Pages are not cached in-process: with several workers (serve.py) a cache in
+one would keep serving a first page that a checkout in another had changed,
+and the indexed read is already a single round trip.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+from .supabase_client import sb
+
+
+def summary_row(
+    *,
+    order: Dict[str, Any],
+    user_id: str,
+    session_id: str,
+    checkout_url: str,
+    checkout_status: str,
+    items: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    lines = []
+    subtotal: Optional[int] = 0
+    for it in items:
+        p = it.get("product") or {}
+        qty = int(it.get("quantity") or 0)
+        price = it.get("unit_price_cents")
+        lines.append(
+            {
+                "part_number": p.get("part_number") or "",
+                "name": p.get("name") or "",
+                "quantity": qty,
+                "unit_price_cents": price,
+            }
+        )
+        subtotal = None if subtotal is None or price is None else subtotal + int(price) * qty
+    row = {
+        "order_id": order["id"],
+        "user_id": user_id,
+        "session_id": session_id,
+        "cart_id": order.get("cart_id"),
+        "checkout_session_id": order.get("checkout_session_id"),
+        "checkout_url": checkout_url,
+        "checkout_status": checkout_status,
+        "status": order.get("status") or "created",
+        "item_count": sum(line["quantity"] for line in lines),
+        "subtotal_cents": subtotal,
+        "items": lines,
+    }
+    if order.get("created_at"):
+        row["created_at"] = order["created_at"]
+    return row
+
+
+def record_order(row: Dict[str, Any]) -> None:
+    """Write the summary for a new order."""
+    sb().table("order_summaries").insert(row).execute()
+
+
+def order_page(user_id: str, limit: int, offset: int) -> List[Dict[str, Any]]:
+    res = (
+        sb()
+        .table("order_summaries")
+        .select("order_id,cart_id,checkout_session_id,status,created_at,items")
+        .eq("user_id", user_id)
+        .order("created_at", desc=True)
+        .range(offset, offset + limit - 1)
+        .execute()
+    )
+    return [
+        {
+            "id": r["order_id"],
+            "cart_id": r.get("cart_id"),
+            "checkout_session_id": r.get("checkout_session_id"),
+            "status": r.get("status"),
+            "created_at": r.get("created_at"),
+            "items": r.get("items") or [],
+        }
+        for r in (res.data or [])
+    ]
+
+
+def checkout_page(session_id: str, limit: int, offset: int) -> List[Dict[str, Any]]:
+    res = (
+        sb()
+        .table("order_summaries")
+        .select("checkout_session_id,cart_id,checkout_status,checkout_url,created_at")
+        .eq("session_id", session_id)
+        .order("created_at", desc=True)
+        .range(offset, offset + limit - 1)
+        .execute()
+    )
+    return [
+        {
+            "id": r["checkout_session_id"],
+            "cart_id": r.get("cart_id"),
+            "status": r.get("checkout_status"),
+            "checkout_url": r.get("checkout_url"),
+            "created_at": r.get("created_at"),
+        }
+        for r in (res.data or [])
+    ]
+
+
+def backfill(batch_size: int = 500) -> int:
+    """
+    One-off migration: build summaries for orders placed before the read model
+    existed. Safe to re-run; orders that already have a summary are skipped.
+    """
+    written = 0
+    offset = 0
+    while True:
+        orders = (
+            sb()
+            .table("orders")
+            .select("id,user_id,cart_id,checkout_session_id,status,created_at")
+            .order("created_at")
+            .range(offset, offset + batch_size - 1)
+            .execute()
+        ).data or []
+        if not orders:
+            return written
+        offset += len(orders)
+        ids = [o["id"] for o in orders]
+        have = {
+            r["order_id"]
+            for r in (sb().table("order_summaries").select("order_id").in_("order_id", ids).execute().data or [])
+        }
+        todo = [o for o in orders if o["id"] not in have]
+        if not todo:
+            continue
+        todo_ids = [o["id"] for o in todo]
+        items_by_order: Dict[str, List[Dict[str, Any]]] = {}
+        for it in sb().table("order_items").select("order_id,part_number,name,quantity,unit_price_cents").in_("order_id", todo_ids).execute().data or []:
+            items_by_order.setdefault(it["order_id"], []).append(
+                {"product": {"part_number": it.get("part_number"), "name": it.get("name")}, "quantity": it.get("quantity"), "unit_price_cents": it.get("unit_price_cents")}
+            )
+        sessions = {
+            s["id"]: s
+            for s in (sb().table("checkout_sessions").select("id,status,checkout_url").in_("id", [o["checkout_session_id"] for o in todo]).execute().data or [])
+        }
+        carts = {
+            c["id"]: c["session_id"]
+            for c in (sb().table("carts").select("id,session_id").in_("id", [o["cart_id"] for o in todo]).execute().data or [])
+        }
+        rows = []
+        for o in todo:
+            cs = sessions.get(o["checkout_session_id"]) or {}
+            rows.append(
+                summary_row(
+                    order=o,
+                    user_id=o["user_id"],
+                    session_id=carts.get(o["cart_id"]) or "",
+                    checkout_url=cs.get("checkout_url") or "",
+                    checkout_status=cs.get("status") or "",
+                    items=items_by_order.get(o["id"], []),
+                )
+            )
+        sb().table("order_summaries").insert(rows).execute()
+        written += len(rows)
+
+
+if __name__ == "__main__":
+    print(f"backfilled {backfill()} order summaries")
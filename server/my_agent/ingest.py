@@ -0,0 +1,475 @@
+"""
+Streaming catalog ingestion: CSV / JSONL (optionally .gz) -> Supabase.
+
+    cd server
+    python -m my_agent.ingest products data/products.csv
+    python -m my_agent.ingest product_compatibility data/links.jsonl.gz --delta
+
+Files are read row by row and written in batches (--batch-size) by a small
+thread pool (--concurrency); at most 2 x concurrency batches are in flight,
+so memory stays flat however large the file is.
+
+Per table, rows are normalized and validated (PS numbers, model numbers,
+categories), deduplicated on their natural key within the run (the last
+occurrence wins, as in a delta feed where a later line supersedes an earlier
+one), and upserted on that key:
+
+    products               part_number              part_number, name, category
+    appliance_models       model_number             model_number, brand
+    product_compatibility  product_id, model_id     part_number, model_number
+    installation_guides    product_id, title        part_number, title, steps
+
+Links and guides reference parts/models by number; ids are resolved from the
+database once per run. Upserts need unique constraints on those keys, e.g.
+`create unique index on installation_guides (product_id, title)`.
+
+Delta loads: with --delta, a content hash per key is kept locally
+(INGEST_STATE_DIR) and rows unchanged since the last successful load are
+skipped. A row with `_op` = `delete` deletes its key instead. Deletes are
+batched too: one request per batch for single-column keys, otherwise one per
+value of the key column with fewer distinct values in the batch.
+Rejected rows are written to --rejects (JSONL) with the reason.
+
+After a run that changed rows, running agents are told: the catalog
+snapshot (--snapshot; CATALOG_SNAPSHOT or serve.py's default file when it
+exists) is rebuilt, and the catalog stamp is bumped so every process drops
+its part/model index and remembered misses (catalog_index.bump).
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .supabase_client import sb
+
+
+logger = logging.getLogger(__name__)
+
+INGEST_STATE_DIR = os.environ.get(
+    "INGEST_STATE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".ingest")
+)
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "1000"))
+INGEST_CONCURRENCY = int(os.environ.get("INGEST_CONCURRENCY", "4"))
+INGEST_RETRIES = 3
+PROGRESS_EVERY_S = 5.0
+ID_PAGE_SIZE = 1000
+# Values per in_() filter in a delete, which PostgREST puts in the URL.
+DELETE_CHUNK = 200
+
+PART_RE = re.compile(r"^PS\d{5,10}$")
+MODEL_RE = re.compile(r"^[A-Z0-9][A-Z0-9./-]{2,29}$")
+CATEGORIES = ("refrigerator", "dishwasher")
+
+
+class Invalid(ValueError):
+    pass
+
+
+def normalize_part_number(value: Any) -> str:
+    pn = re.sub(r"[\s-]", "", str(value or "")).upper()
+    if not PART_RE.match(pn):
+        raise Invalid(f"bad part_number {value!r}")
+    return pn
+
+
+def normalize_model_number(value: Any) -> str:
+    mn = re.sub(r"\s", "", str(value or "")).upper()
+    if not MODEL_RE.match(mn):
+        raise Invalid(f"bad model_number {value!r}")
+    return mn
+
+
+def _text(value: Any, field: str, required: bool = True) -> Optional[str]:
+    text = " ".join(str(value or "").split())
+    if required and not text:
+        raise Invalid(f"missing {field}")
+    return text or None
+
+
+# ----------------------------
+# Per-table row handling
+# ----------------------------
+
+class Resolver:
+    """part_number -> product id and model_number -> model id, loaded once per run."""
+
+    def __init__(self) -> None:
+        self._maps: Dict[str, Dict[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, table: str, column: str) -> Dict[str, str]:
+        out: Dict[str, str] = {}
+        start = 0
+        while True:
+            rows = (
+                sb().table(table).select(f"id,{column}").order("id").range(start, start + ID_PAGE_SIZE - 1).execute()
+            ).data or []
+            out.update({r[column]: r["id"] for r in rows})
+            if len(rows) < ID_PAGE_SIZE:
+                return out
+            start += ID_PAGE_SIZE
+
+    def get(self, table: str, column: str, key: str) -> str:
+        with self._lock:
+            if table not in self._maps:
+                self._maps[table] = self._load(table, column)
+        found = self._maps[table].get(key)
+        if found is None:
+            raise Invalid(f"unknown {column} {key}")
+        return found
+
+
+def _product(row: Dict[str, Any], _: Resolver) -> Dict[str, Any]:
+    category = _text(row.get("category"), "category").lower()
+    if category not in CATEGORIES:
+        raise Invalid(f"bad category {row.get('category')!r}")
+    return {
+        "part_number": normalize_part_number(row.get("part_number")),
+        "name": _text(row.get("name"), "name"),
+        "category": category,
+    }
+
+
+def _model(row: Dict[str, Any], _: Resolver) -> Dict[str, Any]:
+    return {
+        "model_number": normalize_model_number(row.get("model_number")),
+        "brand": _text(row.get("brand"), "brand", required=False),
+    }
+
+
+def _link(row: Dict[str, Any], ids: Resolver) -> Dict[str, Any]:
+    return {
+        "product_id": ids.get("products", "part_number", normalize_part_number(row.get("part_number"))),
+        "model_id": ids.get("appliance_models", "model_number", normalize_model_number(row.get("model_number"))),
+    }
+
+
+def _guide(row: Dict[str, Any], ids: Resolver) -> Dict[str, Any]:
+    steps = row.get("steps")
+    if isinstance(steps, str):
+        # CSV: steps separated by "|"; JSONL: a list.
+        steps = [s.strip() for s in steps.split("|") if s.strip()]
+    if not isinstance(steps, list) or not steps:
+        raise Invalid("missing steps")
+    return {
+        "product_id": ids.get("products", "part_number", normalize_part_number(row.get("part_number"))),
+        "title": _text(row.get("title"), "title"),
+        "steps": [str(s) for s in steps],
+    }
+
+
+# table -> (row builder, conflict key columns)
+TABLES: Dict[str, Tuple[Callable[[Dict[str, Any], Resolver], Dict[str, Any]], Tuple[str, ...]]] = {
+    "products": (_product, ("part_number",)),
+    "appliance_models": (_model, ("model_number",)),
+    "product_compatibility": (_link, ("product_id", "model_id")),
+    "installation_guides": (_guide, ("product_id", "title")),
+}
+
+
+# ----------------------------
+# Reading
+# ----------------------------
+
+def _open(path: str) -> io.TextIOBase:
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+
+def read_rows(path: str, fmt: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Yield one dict per input row without reading the whole file."""
+    base = path[:-3] if path.endswith(".gz") else path
+    fmt = fmt or ("jsonl" if base.endswith((".jsonl", ".ndjson")) else "csv")
+    with _open(path) as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+            return
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"_invalid": f"line {n}: {e}"}
+
+
+# ----------------------------
+# Delta state
+# ----------------------------
+
+class DeltaState:
+    """Content hash per key from the last successful load of a table."""
+
+    def __init__(self, table: str, directory: str = INGEST_STATE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, f"{table}.sqlite"), check_same_thread=False)
+        self._conn.execute("create table if not exists hashes (key text primary key, hash text not null)")
+        self._lock = threading.Lock()
+
+    def unchanged(self, key: str, digest: str) -> bool:
+        with self._lock:
+            hit = self._conn.execute("select hash from hashes where key = ?", (key,)).fetchone()
+        return hit is not None and hit[0] == digest
+
+    def commit(self, pairs: List[Tuple[str, Optional[str]]]) -> None:
+        with self._lock:
+            self._conn.executemany("delete from hashes where key = ?", [(k,) for k, d in pairs if d is None])
+            self._conn.executemany(
+                "insert into hashes (key, hash) values (?, ?) on conflict (key) do update set hash = excluded.hash",
+                [(k, d) for k, d in pairs if d is not None],
+            )
+            self._conn.commit()
+
+
+# ----------------------------
+# Loading
+# ----------------------------
+
+class Stats:
+    FIELDS = ("read", "valid", "rejected", "duplicate", "unchanged", "upserted", "deleted", "failed", "batches")
+
+    def __init__(self) -> None:
+        self.counts = {f: 0 for f in self.FIELDS}
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, field: str, n: int = 1) -> None:
+        with self._lock:
+            self.counts[field] += n
+
+    def line(self) -> str:
+        elapsed = max(1e-6, time.monotonic() - self.started)
+        c = self.counts
+        return (
+            f"read={c['read']} valid={c['valid']} rejected={c['rejected']} dup={c['duplicate']} "
+            f"unchanged={c['unchanged']} upserted={c['upserted']} deleted={c['deleted']} failed={c['failed']} "
+            f"({c['read'] / elapsed:,.0f} rows/s read, {(c['upserted'] + c['deleted']) / elapsed:,.0f} rows/s written)"
+        )
+
+
+# (op, key, row, content digest); op is "upsert" or "delete".
+Item = Tuple[str, str, Dict[str, Any], Optional[str]]
+
+
+def _with_retries(fn: Callable[[], Any]) -> Any:
+    for attempt in range(INGEST_RETRIES):
+        try:
+            return fn()
+        except Exception:
+            if attempt == INGEST_RETRIES - 1:
+                raise
+            time.sleep(0.5 * 2**attempt)
+
+
+class Loader:
+    def __init__(
+        self,
+        table: str,
+        *,
+        batch_size: int = INGEST_BATCH_SIZE,
+        concurrency: int = INGEST_CONCURRENCY,
+        delta: bool = False,
+        rejects: Optional[str] = None,
+        dry_run: bool = False,
+    ):
+        if table not in TABLES:
+            raise ValueError(f"unknown table {table!r}; expected one of {', '.join(TABLES)}")
+        self.table = table
+        self.build, self.key = TABLES[table]
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
+        self.delta = DeltaState(table) if delta else None
+        self.dry_run = dry_run
+        self.stats = Stats()
+        self.ids = Resolver()
+        self._rejects = open(rejects, "a", encoding="utf-8") if rejects else None
+        # 8-byte key digest -> number of the batch that last queued the key.
+        self._seen: Dict[bytes, int] = {}
+        self._slots = threading.BoundedSemaphore(self.concurrency * 2)
+
+    def _reject(self, row: Dict[str, Any], reason: str) -> None:
+        self.stats.add("rejected")
+        if self._rejects is not None:
+            self._rejects.write(json.dumps({"reason": reason, "row": row}, default=str) + "\n")
+
+    def _key_of(self, row: Dict[str, Any]) -> str:
+        return "|".join(str(row[k]) for k in self.key)
+
+    def _prepare(self, raw: Dict[str, Any]) -> Optional[Tuple[bytes, Item]]:
+        """(key digest, (op, key, row, content digest)) or None if the row is dropped."""
+        self.stats.add("read")
+        if "_invalid" in raw:
+            self._reject(raw, raw["_invalid"])
+            return None
+        op = str(raw.get("_op") or "upsert").lower()
+        try:
+            row = self.build(raw, self.ids)
+        except Invalid as e:
+            self._reject(raw, str(e))
+            return None
+        key = self._key_of(row)
+        # 8-byte digests keep the dedupe map small for millions of keys.
+        seen_id = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        self.stats.add("valid")
+        if op == "delete":
+            return seen_id, ("delete", key, row, None)
+        digest = hashlib.blake2b(json.dumps(row, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+        # A key already queued this run must be written again even if this
+        # version matches the last load: the queued one would win otherwise.
+        if self.delta is not None and seen_id not in self._seen and self.delta.unchanged(key, digest):
+            self.stats.add("unchanged")
+            return None
+        return seen_id, ("upsert", key, row, digest)
+
+    def _delete(self, rows: List[Dict[str, Any]]) -> None:
+        # Match the key column with the most distinct values via in_(), one
+        # request per combination of the others (e.g. per product or model).
+        last = max(self.key, key=lambda k: len({row[k] for row in rows}))
+        lead = [k for k in self.key if k != last]
+        groups: Dict[Tuple[Any, ...], List[Any]] = {}
+        for row in rows:
+            groups.setdefault(tuple(row[k] for k in lead), []).append(row[last])
+        for values, matches in groups.items():
+            for i in range(0, len(matches), DELETE_CHUNK):
+                chunk = matches[i : i + DELETE_CHUNK]
+
+                def delete(values=values, chunk=chunk):
+                    q = sb().table(self.table).delete()
+                    for k, v in zip(lead, values):
+                        q = q.eq(k, v)
+                    return q.in_(last, chunk).execute()
+
+                _with_retries(delete)
+
+    def _write(self, batch: List[Item]) -> None:
+        try:
+            upserts = [row for op, _, row, _ in batch if op == "upsert"]
+            deletes = [row for op, _, row, _ in batch if op == "delete"]
+            if not self.dry_run:
+                if upserts:
+                    _with_retries(
+                        lambda: sb().table(self.table).upsert(upserts, on_conflict=",".join(self.key)).execute()
+                    )
+                if deletes:
+                    self._delete(deletes)
+                if self.delta is not None:
+                    self.delta.commit([(key, digest) for _, key, _, digest in batch])
+            self.stats.add("upserted", len(upserts))
+            self.stats.add("deleted", len(deletes))
+            self.stats.add("batches")
+        except Exception as e:
+            self.stats.add("failed", len(batch))
+            logger.error("batch of %d %s rows failed: %s", len(batch), self.table, e)
+        finally:
+            self._slots.release()
+
+    def run(self, rows: Iterator[Dict[str, Any]]) -> Dict[str, int]:
+        last_report = time.monotonic()
+        in_flight: Dict[int, Future] = {}
+        number = 0
+        # Keyed by digest so a later occurrence in the same batch replaces the earlier one.
+        batch: Dict[bytes, Item] = {}
+        # Earlier batches holding a key this batch overrides; they must land first.
+        after: set = set()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f"ingest-{self.table}") as pool:
+
+            def submit() -> None:
+                nonlocal number, batch, after
+                for n in after:
+                    if n in in_flight:
+                        in_flight[n].result()
+                # Blocks while 2 x concurrency batches are in flight.
+                self._slots.acquire()
+                in_flight[number] = pool.submit(self._write, list(batch.values()))
+                for n in [n for n, f in in_flight.items() if f.done()]:
+                    del in_flight[n]
+                number += 1
+                batch, after = {}, set()
+
+            for raw in rows:
+                prepared = self._prepare(raw)
+                if prepared is not None:
+                    seen_id, item = prepared
+                    previous = self._seen.get(seen_id)
+                    if previous is not None:
+                        self.stats.add("duplicate")
+                        if previous != number:
+                            after.add(previous)
+                    self._seen[seen_id] = number
+                    batch.pop(seen_id, None)
+                    batch[seen_id] = item
+                if len(batch) >= self.batch_size:
+                    submit()
+                if time.monotonic() - last_report >= PROGRESS_EVERY_S:
+                    logger.info("%s: %s", self.table, self.stats.line())
+                    last_report = time.monotonic()
+            if batch:
+                submit()
+        if self._rejects is not None:
+            self._rejects.close()
+        logger.info("%s done: %s", self.table, self.stats.line())
+        return dict(self.stats.counts)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Stream a CSV/JSONL file into a catalog table.")
+    parser.add_argument("table", choices=sorted(TABLES))
+    parser.add_argument("path", help="input file (.csv, .jsonl, optionally .gz) or - for stdin")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file extension")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=INGEST_CONCURRENCY)
+    parser.add_argument("--delta", action="store_true", help="skip rows unchanged since the last load")
+    parser.add_argument("--rejects", help="append rejected rows here as JSONL")
+    parser.add_argument("--dry-run", action="store_true", help="validate and count only")
+    parser.add_argument("--snapshot", help="catalog snapshot to rebuild afterwards (default: the one in use, if any)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    loader = Loader(
+        args.table,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+        delta=args.delta,
+        rejects=args.rejects,
+        dry_run=args.dry_run,
+    )
+    counts = loader.run(read_rows(args.path, args.format))
+    print(json.dumps(counts))
+    if not args.dry_run and (counts["upserted"] or counts["deleted"]):
+        publish(args.snapshot)
+    return 1 if counts["failed"] else 0
+
+
+def publish(snapshot: Optional[str] = None) -> None:
+    """Make freshly loaded rows visible to running agents."""
+    from . import catalog_index, catalog_snapshot
+
+    path = snapshot or catalog_snapshot.CATALOG_SNAPSHOT
+    if not path and os.path.exists(catalog_snapshot.DEFAULT_PATH):
+        path = catalog_snapshot.DEFAULT_PATH
+    if path:
+        catalog_snapshot.build(path)
+    # After the rebuild, so processes that reload on the stamp see the new file.
+    catalog_index.bump()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
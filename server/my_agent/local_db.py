@@ -0,0 +1,420 @@
+"""
+SQLite stand-in for the Supabase tables, for offline runs and perf work.
+
+SqliteClient implements the slice of the PostgREST query builder the tools
+use (select / insert / upsert / update / delete with eq, neq, in_, ilike,
+or_, gt/gte/lt/lte, order, range, limit) by translating each chain into one
+SQL statement. The schema mirrors the Supabase tables; json/jsonb columns are
+stored as text and decoded on read.
+
+Select it with PS_DATA_BACKEND=sqlite (PS_SQLITE_PATH, default
+server/.local/partselect.db); sb() then returns this client. Create an empty
+database with `python -m my_agent.local_db [path]`.
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import urllib.parse
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+PS_SQLITE_PATH = os.environ.get(
+    "PS_SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".local", "partselect.db"),
+)
+
+SCHEMA = """
+create table if not exists products (
+    id text primary key,
+    part_number text not null unique,
+    name text,
+    category text
+);
+create index if not exists products_category on products (category);
+
+create table if not exists appliance_models (
+    id text primary key,
+    model_number text not null unique,
+    brand text
+);
+create index if not exists appliance_models_brand on appliance_models (brand, model_number);
+
+create table if not exists product_compatibility (
+    product_id text not null,
+    model_id text not null,
+    primary key (product_id, model_id)
+);
+create index if not exists product_compatibility_model on product_compatibility (model_id);
+
+create table if not exists installation_guides (
+    id text primary key,
+    product_id text not null,
+    title text,
+    steps text
+);
+create index if not exists installation_guides_product on installation_guides (product_id);
+create unique index if not exists installation_guides_title on installation_guides (product_id, title);
+
+create table if not exists product_prices (
+    product_id text primary key,
+    unit_price_cents integer
+);
+
+create table if not exists carts (
+    id text primary key,
+    session_id text not null,
+    status text not null default 'open',
+    created_at text
+);
+create index if not exists carts_session on carts (session_id, status);
+
+create table if not exists cart_items (
+    id text primary key,
+    cart_id text not null,
+    product_id text not null,
+    quantity integer not null,
+    unit_price_cents integer,
+    created_at text
+);
+create index if not exists cart_items_cart on cart_items (cart_id, product_id);
+
+create table if not exists shipping_estimates (
+    id text primary key,
+    cart_id text,
+    zip_code text,
+    estimate_json text,
+    created_at text
+);
+
+create table if not exists checkout_sessions (
+    id text primary key,
+    cart_id text,
+    status text,
+    checkout_url text,
+    created_at text
+);
+
+create table if not exists orders (
+    id text primary key,
+    user_id text,
+    cart_id text,
+    checkout_session_id text,
+    status text,
+    created_at text
+);
+create index if not exists orders_user on orders (user_id, created_at);
+
+create table if not exists order_items (
+    id text primary key,
+    order_id text not null,
+    product_id text,
+    part_number text,
+    name text,
+    quantity integer,
+    unit_price_cents integer,
+    created_at text
+);
+create index if not exists order_items_order on order_items (order_id);
+
+create table if not exists order_summaries (
+    order_id text primary key,
+    user_id text not null,
+    session_id text not null,
+    cart_id text not null,
+    checkout_session_id text not null,
+    checkout_url text,
+    checkout_status text,
+    status text not null,
+    item_count integer not null,
+    subtotal_cents integer,
+    items text not null default '[]',
+    created_at text
+);
+create index if not exists order_summaries_user on order_summaries (user_id, created_at);
+create index if not exists order_summaries_session on order_summaries (session_id, created_at);
+"""
+
+# Upper bound for read-only maps; SQLite caps it at its compile-time maximum.
+MMAP_SIZE = 1 << 31
+
+# Columns holding json/jsonb in Postgres.
+JSON_COLUMNS = {
+    "installation_guides": {"steps"},
+    "shipping_estimates": {"estimate_json"},
+    "order_summaries": {"items"},
+}
+# Tables whose rows get a generated id / created_at when the insert has none.
+NO_ID_TABLES = {"product_compatibility", "product_prices", "order_summaries"}
+NO_CREATED_AT_TABLES = {"products", "appliance_models", "product_compatibility", "installation_guides", "product_prices"}
+
+_IDENT_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _ident(name: str) -> str:
+    name = name.strip()
+    if not _IDENT_RE.match(name):
+        raise ValueError(f"invalid identifier: {name!r}")
+    return f'"{name}"'
+
+
+class Result:
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+        self.count = len(data)
+
+
+class SqliteQuery:
+    def __init__(self, client: "SqliteClient", table: str):
+        self.client = client
+        self.table = table
+        self.op = "select"
+        self.columns = "*"
+        self.payload: Any = None
+        self.on_conflict = "id"
+        self.where: List[str] = []
+        self.params: List[Any] = []
+        self.orders: List[str] = []
+        self.offset = 0
+        self.count: Optional[int] = None
+
+    # --- operations ---
+    def select(self, columns: str = "*", **_: Any) -> "SqliteQuery":
+        self.op = "select"
+        self.columns = "*" if columns.strip() == "*" else ",".join(_ident(c) for c in columns.split(",") if c.strip())
+        return self
+
+    def insert(self, rows: Any, **_: Any) -> "SqliteQuery":
+        self.op, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows: Any, on_conflict: str = "id", **_: Any) -> "SqliteQuery":
+        self.op, self.payload, self.on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def update(self, values: Dict[str, Any], **_: Any) -> "SqliteQuery":
+        self.op, self.payload = "update", values
+        return self
+
+    def delete(self, **_: Any) -> "SqliteQuery":
+        self.op = "delete"
+        return self
+
+    # --- filters and modifiers ---
+    def _cmp(self, column: str, sql_op: str, value: Any) -> "SqliteQuery":
+        self.where.append(f"{_ident(column)} {sql_op} ?")
+        self.params.append(_to_sql(value))
+        return self
+
+    def eq(self, column: str, value: Any) -> "SqliteQuery":
+        return self._cmp(column, "=", value)
+
+    def neq(self, column: str, value: Any) -> "SqliteQuery":
+        return self._cmp(column, "!=", value)
+
+    def gt(self, column: str, value: Any) -> "SqliteQuery":
+        return self._cmp(column, ">", value)
+
+    def gte(self, column: str, value: Any) -> "SqliteQuery":
+        return self._cmp(column, ">=", value)
+
+    def lt(self, column: str, value: Any) -> "SqliteQuery":
+        return self._cmp(column, "<", value)
+
+    def lte(self, column: str, value: Any) -> "SqliteQuery":
+        return self._cmp(column, "<=", value)
+
+    def ilike(self, column: str, pattern: str) -> "SqliteQuery":
+        # SQLite's LIKE is case-insensitive for ASCII, like ILIKE.
+        return self._cmp(column, "like", pattern)
+
+    def in_(self, column: str, values: Iterable[Any]) -> "SqliteQuery":
+        vals = [_to_sql(v) for v in values]
+        if not vals:
+            self.where.append("0 = 1")
+            return self
+        self.where.append(f"{_ident(column)} in ({','.join('?' * len(vals))})")
+        self.params.extend(vals)
+        return self
+
+    def or_(self, expr: str) -> "SqliteQuery":
+        clauses = []
+        for clause in expr.split(","):
+            column, op, value = clause.split(".", 2)
+            sql_op = {"ilike": "like", "like": "like", "eq": "="}.get(op)
+            if sql_op is None:
+                raise ValueError(f"unsupported or_ operator: {op}")
+            clauses.append(f"{_ident(column)} {sql_op} ?")
+            self.params.append(value)
+        self.where.append("(" + " or ".join(clauses) + ")")
+        return self
+
+    def order(self, column: str, desc: bool = False, **_: Any) -> "SqliteQuery":
+        self.orders.append(f"{_ident(column)} {'desc' if desc else 'asc'}")
+        return self
+
+    def range(self, start: int, end: int) -> "SqliteQuery":
+        self.offset, self.count = int(start), int(end) - int(start) + 1
+        return self
+
+    def limit(self, n: int) -> "SqliteQuery":
+        self.count = int(n)
+        return self
+
+    # --- execution ---
+    def execute(self) -> Result:
+        with self.client.lock:
+            return Result(getattr(self, f"_{self.op}")(self.client.conn))
+
+    def _where_sql(self) -> str:
+        return (" where " + " and ".join(self.where)) if self.where else ""
+
+    def _select(self, conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+        sql = f"select {self.columns} from {_ident(self.table)}{self._where_sql()}"
+        if self.orders:
+            sql += " order by " + ", ".join(self.orders)
+        if self.count is not None or self.offset:
+            sql += f" limit {self.count if self.count is not None else -1} offset {self.offset}"
+        return self._rows(conn.execute(sql, self.params))
+
+    def _rows(self, cur: sqlite3.Cursor) -> List[Dict[str, Any]]:
+        names = [d[0] for d in cur.description or []]
+        json_cols = JSON_COLUMNS.get(self.table, set())
+        out = []
+        for values in cur.fetchall():
+            row = dict(zip(names, values))
+            for c in json_cols & row.keys():
+                if isinstance(row[c], str):
+                    row[c] = json.loads(row[c])
+            out.append(row)
+        return out
+
+    def _prepared(self) -> List[Dict[str, Any]]:
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        now = datetime.now(timezone.utc).isoformat()
+        out = []
+        for r in rows:
+            r = dict(r)
+            if self.table not in NO_ID_TABLES:
+                r.setdefault("id", str(uuid.uuid4()))
+            if self.table not in NO_CREATED_AT_TABLES:
+                r.setdefault("created_at", now)
+            out.append(r)
+        return out
+
+    def _write(self, conn: sqlite3.Connection, rows: List[Dict[str, Any]], conflict: str) -> List[Dict[str, Any]]:
+        if not rows:
+            return []
+        columns = sorted({k for r in rows for k in r})
+        sql = (
+            f"insert into {_ident(self.table)} ({','.join(_ident(c) for c in columns)}) "
+            f"values ({','.join('?' * len(columns))}){conflict}"
+        )
+        conn.executemany(sql, [[_to_sql(r.get(c)) for c in columns] for r in rows])
+        conn.commit()
+        return rows
+
+    def _insert(self, conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+        return self._write(conn, self._prepared(), "")
+
+    def _upsert(self, conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+        rows = self._prepared()
+        keys = [_ident(k) for k in self.on_conflict.split(",")]
+        columns = sorted({k for r in rows for k in r} - {k.strip() for k in self.on_conflict.split(",")} - {"id"})
+        action = (
+            "do update set " + ", ".join(f"{_ident(c)} = excluded.{_ident(c)}" for c in columns)
+            if columns
+            else "do nothing"
+        )
+        return self._write(conn, rows, f" on conflict ({','.join(keys)}) {action}")
+
+    def _update(self, conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+        where = self._where_sql()
+        rowids = [r[0] for r in conn.execute(f"select rowid from {_ident(self.table)}{where}", self.params)]
+        if not rowids:
+            return []
+        sets = ", ".join(f"{_ident(c)} = ?" for c in self.payload)
+        marks = ",".join("?" * len(rowids))
+        conn.execute(
+            f"update {_ident(self.table)} set {sets} where rowid in ({marks})",
+            [_to_sql(v) for v in self.payload.values()] + rowids,
+        )
+        conn.commit()
+        return self._rows(conn.execute(f"select * from {_ident(self.table)} where rowid in ({marks})", rowids))
+
+    def _delete(self, conn: sqlite3.Connection) -> List[Dict[str, Any]]:
+        where = self._where_sql()
+        deleted = self._rows(conn.execute(f"select * from {_ident(self.table)}{where}", self.params))
+        conn.execute(f"delete from {_ident(self.table)}{where}", self.params)
+        conn.commit()
+        return deleted
+
+
+def _to_sql(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+class SqliteClient:
+    """
+    Thread-safe: one connection, statements serialized by a lock (fan_out uses threads).
+    read_only opens an existing file immutable and memory-mapped, so processes
+    reading the same file share its pages (see catalog_snapshot.py).
+    """
+
+    def __init__(self, path: str = PS_SQLITE_PATH, read_only: bool = False):
+        self.path = path
+        self.lock = threading.RLock()
+        if read_only:
+            uri = "file:" + urllib.parse.quote(os.path.abspath(path)) + "?mode=ro&immutable=1"
+            self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self.conn.execute(f"pragma mmap_size={MMAP_SIZE}")
+            return
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("pragma journal_mode=wal")
+        self.conn.execute("pragma synchronous=normal")
+        self.conn.executescript(SCHEMA)
+
+    def table(self, name: str) -> SqliteQuery:
+        _ident(name)
+        return SqliteQuery(self, name)
+
+    def bulk_insert(self, table: str, rows: Sequence[Dict[str, Any]], on_conflict: Optional[str] = None) -> int:
+        """Fast path for loaders: one executemany, no rows returned."""
+        q = SqliteQuery(self, table)
+        q.payload = list(rows)
+        with self.lock:
+            if on_conflict:
+                q.on_conflict = on_conflict
+                q._upsert(self.conn)
+            else:
+                q._insert(self.conn)
+        return len(rows)
+
+
+def connect(path: Optional[str] = None) -> SqliteClient:
+    return SqliteClient(path or PS_SQLITE_PATH)
+
+
+def table_counts(client: SqliteClient) -> List[Tuple[str, int]]:
+    with client.lock:
+        names = [r[0] for r in client.conn.execute("select name from sqlite_master where type = 'table' order by name")]
+        return [(n, client.conn.execute(f"select count(*) from {_ident(n)}").fetchone()[0]) for n in names]
+
+
+if __name__ == "__main__":
+    db = connect(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(db.path)
+    for name, n in table_counts(db):
+        print(f"  {name}: {n}")
@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict
+
+
+class Metrics:
+    """
+    Process-local counters and timing summaries. Cheap enough to call on every
+    query; read with snapshot() (e.g. from a debug hook or a benchmark).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._timings: Dict[str, Dict[str, float]] = {}
+
+    def incr(self, name: str, n: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            t = self._timings.get(name)
+            if t is None:
+                t = self._timings[name] = {"count": 0, "total_s": 0.0, "max_s": 0.0}
+            t["count"] += 1
+            t["total_s"] += seconds
+            if seconds > t["max_s"]:
+                t["max_s"] = seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "timings": {k: dict(v) for k, v in self._timings.items()},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._timings.clear()
+
+
+metrics = Metrics()
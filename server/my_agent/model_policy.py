@@ -0,0 +1,178 @@
+"""
+Model-tier policy: which model each agent calls, per turn.
+
+Two tiers, both configurable:
+- fast (MODEL_FAST): routing, lookups, cart work and anything templated;
+- strong (MODEL_STRONG): only troubleshooting and long installation
+  explanations, and only for agents allowed to use it.
+
+MODEL_TIERS sets each agent's policy as `agent=fast|strong|auto`
+(comma separated); `auto` picks per turn. The turn's tier is decided on its
+first model call and kept for the tool follow-ups of the same invocation,
+unless the latency budget (MODEL_TURN_BUDGET_MS) would be blown: with the
+strong model's observed latency (EWMA), the rest of the turn must still fit,
+otherwise the call falls back to the fast tier.
+
+MODEL_BACKEND=stub swaps every agent's model for the deterministic StubLlm
+(see stub_llm.py), so routing cost can be measured offline.
+"""
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from .guard import fresh_user_text
+from .metrics import metrics
+
+
+FAST = "fast"
+STRONG = "strong"
+AUTO = "auto"
+
+MODEL_FAST = os.environ.get("MODEL_FAST", "gemini-2.5-flash-lite")
+MODEL_STRONG = os.environ.get("MODEL_STRONG", "gemini-2.5-flash")
+MODEL_BACKEND = os.environ.get("MODEL_BACKEND", "gemini")
+MODEL_TURN_BUDGET_MS = float(os.environ.get("MODEL_TURN_BUDGET_MS", "8000"))
+# Model calls left in a typical specialist turn: tool call, then the answer.
+CALLS_PER_TURN = 2
+EWMA_ALPHA = 0.3
+
+DEFAULT_TIERS = {
+    "partselect_coordinator": FAST,
+    "catalog_specialist": AUTO,
+    "transaction_specialist": FAST,
+    "history_specialist": FAST,
+}
+
+
+def _parse_tiers(raw: Optional[str]) -> Dict[str, str]:
+    tiers = dict(DEFAULT_TIERS)
+    for item in (raw or "").split(","):
+        agent, _, tier = item.partition("=")
+        if agent.strip() and tier.strip() in (FAST, STRONG, AUTO):
+            tiers[agent.strip()] = tier.strip()
+    return tiers
+
+
+AGENT_TIERS = _parse_tiers(os.environ.get("MODEL_TIERS"))
+
+TROUBLESHOOT_RE = re.compile(
+    r"\b(troubleshoot\w*|not (working|cooling|draining|cleaning|dispensing|making ice)|"
+    r"(won'?t|doesn'?t|does not|will not|isn'?t) (work|start|drain|cool|run|spin|fill|turn on)|"
+    r"leak\w*|noise|noisy|broken|stopped|error code|diagnos\w*)\b",
+    re.IGNORECASE,
+)
+INSTALL_RE = re.compile(r"\b(install|installation|installing|replace|replacing)\b", re.IGNORECASE)
+LONG_ANSWER_RE = re.compile(
+    r"\b(full|all the|detailed|in detail|step[- ]by[- ]step|walk me through|explain)\b",
+    re.IGNORECASE,
+)
+
+
+def turn_tier(text: str) -> str:
+    """Tier a turn's text needs, ignoring agent policy and budget."""
+    text = text or ""
+    if TROUBLESHOOT_RE.search(text):
+        return STRONG
+    if INSTALL_RE.search(text) and LONG_ANSWER_RE.search(text):
+        return STRONG
+    return FAST
+
+
+def model_name(tier: str) -> str:
+    return MODEL_STRONG if tier == STRONG else MODEL_FAST
+
+
+class LatencyTracker:
+    """EWMA of model-call latency per model name."""
+
+    def __init__(self, alpha: float = EWMA_ALPHA):
+        self.alpha = alpha
+        self._ewma: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, ms: float) -> None:
+        with self._lock:
+            prev = self._ewma.get(model)
+            self._ewma[model] = ms if prev is None else prev + self.alpha * (ms - prev)
+
+    def estimate_ms(self, model: str) -> Optional[float]:
+        with self._lock:
+            return self._ewma.get(model)
+
+
+latency = LatencyTracker()
+
+# (invocation_id, agent) -> {"tier", "started"}; a specialist turn is one invocation.
+_turns: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+# (invocation_id, agent) -> (model, t0) for the call in flight.
+_inflight: Dict[Tuple[str, str], Tuple[str, float]] = {}
+_MAX_TRACKED = 1024
+_lock = threading.Lock()
+
+
+def _turn(key: Tuple[str, str], llm_request: Any) -> Dict[str, Any]:
+    with _lock:
+        turn = _turns.get(key)
+        if turn is None:
+            policy = AGENT_TIERS.get(key[1], FAST)
+            tier = turn_tier(fresh_user_text(llm_request) or "") if policy == AUTO else policy
+            turn = _turns[key] = {"tier": tier, "started": time.monotonic()}
+            while len(_turns) > _MAX_TRACKED:
+                _turns.popitem(last=False)
+        return turn
+
+
+def choose_tier(tier: str, elapsed_ms: float, calls_left: int = CALLS_PER_TURN) -> str:
+    """Keep `tier` only if its expected remaining latency fits the turn budget."""
+    if tier != STRONG:
+        return tier
+    per_call = latency.estimate_ms(MODEL_STRONG)
+    if per_call is None:
+        return tier
+    return tier if elapsed_ms + per_call * calls_left <= MODEL_TURN_BUDGET_MS else FAST
+
+
+def select_model(callback_context, llm_request):
+    """before_model_callback (after the ones that short-circuit): set llm_request.model; never short-circuits."""
+    key = (callback_context.invocation_id, callback_context.agent_name)
+    turn = _turn(key, llm_request)
+    elapsed_ms = (time.monotonic() - turn["started"]) * 1000
+    calls_left = CALLS_PER_TURN if fresh_user_text(llm_request) is not None else 1
+    tier = choose_tier(turn["tier"], elapsed_ms, calls_left)
+    if tier != turn["tier"]:
+        metrics.incr("model_policy.budget_fallback")
+    model = model_name(tier)
+    llm_request.model = model
+    metrics.incr(f"model_policy.{callback_context.agent_name}.{tier}")
+    with _lock:
+        _inflight[key] = (model, time.monotonic())
+    return None
+
+
+def record_latency(callback_context, llm_response):
+    """after_model_callback: feed the per-model latency EWMA."""
+    if getattr(llm_response, "partial", False):
+        return None
+    key = (callback_context.invocation_id, callback_context.agent_name)
+    with _lock:
+        hit = _inflight.pop(key, None)
+    if hit is not None:
+        model, t0 = hit
+        ms = (time.monotonic() - t0) * 1000
+        latency.observe(model, ms)
+        metrics.observe(f"model_latency.{model}", ms / 1000)
+    return None
+
+
+def model_for(agent_name: str) -> Any:
+    """The `model` to construct an agent with; select_model retargets each call."""
+    if MODEL_BACKEND == "stub":
+        from .stub_llm import stub_llm
+
+        return stub_llm()
+    return model_name(STRONG if AGENT_TIERS.get(agent_name) == STRONG else FAST)
@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from .metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# "0" turns prefetching off (the offline benchmark does, to keep query counts exact).
+PREFETCH = os.environ.get("PREFETCH", "1") != "0"
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", "2"))
+# Per-process budget: jobs queued or running at once, and jobs started per minute.
+PREFETCH_MAX_PENDING = int(os.environ.get("PREFETCH_MAX_PENDING", "8"))
+PREFETCH_PER_MIN = float(os.environ.get("PREFETCH_PER_MIN", "120"))
+PREFETCH_TTL_S = float(os.environ.get("PREFETCH_TTL_S", "120"))
+# A session with no tool call for this long gets its pending jobs cancelled
+# and its prefetched results dropped.
+PREFETCH_IDLE_S = float(os.environ.get("PREFETCH_IDLE_S", "90"))
+# How long a tool waits on a prefetch that is already running rather than
+# issuing the same query again.
+PREFETCH_JOIN_S = float(os.environ.get("PREFETCH_JOIN_S", "1.0"))
+
+
+class _Entry:
+    def __init__(self, future: Future, expires_at: float):
+        self.future = future
+        self.expires_at = expires_at
+
+
+class Prefetcher:
+    """
+    Speculative loads for what a session is likely to ask next, run on a small
+    pool and kept per session until taken, expired or the session goes idle.
+    The pool threads don't inherit the tool's context, so prefetch queries are
+    never charged to the tool that triggered them.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._entries: Dict[str, Dict[Hashable, _Entry]] = {}
+        self._last_seen: Dict[str, float] = {}
+        self._pending = 0
+        self._tokens = PREFETCH_PER_MIN
+        self._refilled_at = time.monotonic()
+
+    def _take_token(self, now: float) -> bool:
+        self._tokens = min(PREFETCH_PER_MIN, self._tokens + (now - self._refilled_at) * PREFETCH_PER_MIN / 60.0)
+        self._refilled_at = now
+        if self._tokens < 1 or self._pending >= PREFETCH_MAX_PENDING:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _sweep(self, now: float) -> None:
+        for session_id, seen in list(self._last_seen.items()):
+            if now - seen <= PREFETCH_IDLE_S:
+                entries = self._entries.get(session_id) or {}
+                for key in [k for k, e in entries.items() if e.expires_at <= now]:
+                    del entries[key]
+                continue
+            for entry in self._entries.pop(session_id, {}).values():
+                if entry.future.cancel():
+                    metrics.incr("prefetch.cancelled")
+            del self._last_seen[session_id]
+
+    def _done(self, future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+        if not future.cancelled() and future.exception() is not None:
+            metrics.incr("prefetch.failed")
+            logger.debug("prefetch failed: %s", future.exception())
+
+    def touch(self, session_id: str) -> None:
+        with self._lock:
+            self._last_seen[session_id] = time.monotonic()
+
+    def schedule(self, session_id: str, key: Hashable, fn: Callable[[], Any]) -> bool:
+        """Start loading `key` for the session unless it is already there or the budget is spent."""
+        if not PREFETCH:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            self._last_seen[session_id] = now
+            entries = self._entries.setdefault(session_id, {})
+            current = entries.get(key)
+            if current is not None and current.expires_at > now and not current.future.cancelled():
+                return False
+            if not self._take_token(now):
+                metrics.incr("prefetch.over_budget")
+                return False
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+            self._pending += 1
+            future = self._pool.submit(fn)
+            entries[key] = _Entry(future, now + PREFETCH_TTL_S)
+        future.add_done_callback(self._done)
+        metrics.incr("prefetch.scheduled")
+        return True
+
+    def take(self, session_id: str, key: Hashable, keep: bool = True) -> Tuple[bool, Any]:
+        """
+        (True, value) when `key` was prefetched for the session, waiting up to
+        PREFETCH_JOIN_S if the load is running; (False, None) otherwise, after
+        cancelling a load that hasn't started. keep=False removes the entry so
+        the value is served once.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            self._last_seen[session_id] = now
+            entries = self._entries.get(session_id) or {}
+            entry = entries.get(key) if keep else entries.pop(key, None)
+            if entry is not None and (entry.expires_at <= now or entry.future.cancel()):
+                entries.pop(key, None)
+                entry = None
+        name = key[0] if isinstance(key, tuple) else key
+        if entry is None:
+            metrics.incr(f"prefetch.{name}.miss")
+            return False, None
+        try:
+            value = entry.future.result(timeout=PREFETCH_JOIN_S)
+        except Exception:
+            metrics.incr(f"prefetch.{name}.miss")
+            return False, None
+        metrics.incr(f"prefetch.{name}.hit")
+        return True, value
+
+    def forget(self, session_id: str, key: Hashable) -> None:
+        with self._lock:
+            entry = (self._entries.get(session_id) or {}).pop(key, None)
+        if entry is not None:
+            entry.future.cancel()
+
+
+prefetcher = Prefetcher()
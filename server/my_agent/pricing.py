@@ -0,0 +1,182 @@
+"""
+Cart pricing from an in-process price list.
+
+Prices come from PRICE_TABLE (default product_prices), one row per product:
+
+    create table product_prices (
+        product_id uuid primary key references products(id),
+        unit_price_cents int
+    );
+
+A product without a price there is priced from the unit_price_cents stored on
+its cart line, if any, and otherwise counted as unpriced. A missing table is
+treated as an empty one: it is logged as an error once, the catalog snapshot
+is built without prices, and the load is retried quietly every PRICE_TTL_S
+until the table appears.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+from . import shipping
+from .supabase_client import sb
+
+
+logger = logging.getLogger(__name__)
+
+PRICE_TABLE = os.environ.get("PRICE_TABLE", "product_prices")
+PRICE_TTL_S = float(os.environ.get("PRICE_TTL_S", "300"))
+TAX_RATE_BPS = int(os.environ.get("TAX_RATE_BPS", "0"))  # basis points, 825 = 8.25%
+PAGE_SIZE = 1000
+
+
+class PriceList:
+    def __init__(self, prices: Mapping[str, int], loaded_at: float):
+        self.prices = prices
+        self.loaded_at = loaded_at
+
+
+_price_list: Optional[PriceList] = None
+_refresh_lock = threading.Lock()
+_missing_reported = False
+
+# How PostgREST / Postgres / SQLite report a table that isn't there.
+_MISSING_TABLE_MARKERS = ("pgrst205", "42p01", "could not find the table", "does not exist", "no such table")
+
+
+def table_missing(e: Exception) -> bool:
+    """`e` says the table doesn't exist (also used by catalog_snapshot.build)."""
+    text = str(e).lower()
+    return any(marker in text for marker in _MISSING_TABLE_MARKERS)
+
+
+def _load() -> PriceList:
+    from . import catalog_snapshot
+
+    snap = catalog_snapshot.client()
+    if snap is not None and PRICE_TABLE == "product_prices":
+        # Looked up in the mapped snapshot per product instead of copied into every worker.
+        return PriceList(catalog_snapshot.SnapshotPrices(snap), time.monotonic())
+    prices: Dict[str, int] = {}
+    start = 0
+    while True:
+        res = (
+            sb()
+            .table(PRICE_TABLE)
+            .select("product_id,unit_price_cents")
+            .range(start, start + PAGE_SIZE - 1)
+            .execute()
+        )
+        rows = res.data or []
+        for r in rows:
+            if r.get("unit_price_cents") is not None:
+                prices[str(r["product_id"])] = int(r["unit_price_cents"])
+        if len(rows) < PAGE_SIZE:
+            break
+        start += PAGE_SIZE
+    return PriceList(prices, time.monotonic())
+
+
+def _refresh_locked() -> None:
+    global _price_list, _missing_reported
+    try:
+        _price_list = _load()
+    except Exception as e:
+        if not table_missing(e):
+            logger.exception("price list refresh from %s failed; keeping previous prices", PRICE_TABLE)
+        elif not _missing_reported:
+            _missing_reported = True
+            logger.error(
+                "price table %s does not exist (DDL in my_agent/pricing.py); pricing carts from stored line prices", PRICE_TABLE
+            )
+        else:
+            logger.debug("price table %s still missing", PRICE_TABLE)
+        if _price_list is None:
+            _price_list = PriceList({}, time.monotonic())
+        else:
+            # Back off for a full TTL instead of retrying on every request.
+            _price_list = PriceList(_price_list.prices, time.monotonic())
+
+
+def _refresh_in_background() -> None:
+    try:
+        _refresh_locked()
+    finally:
+        _refresh_lock.release()
+
+
+def price_list() -> PriceList:
+    """
+    Return the cached price list without stampeding the price table.
+    The first caller loads it (others wait for that single load); once stale,
+    exactly one caller starts a background refresh and everyone keeps
+    reading the previous list until it lands.
+    """
+    current = _price_list
+    if current is None:
+        with _refresh_lock:
+            if _price_list is None:
+                _refresh_locked()
+        return _price_list  # type: ignore[return-value]
+    if time.monotonic() - current.loaded_at > PRICE_TTL_S and _refresh_lock.acquire(blocking=False):
+        threading.Thread(target=_refresh_in_background, name="price-refresh", daemon=True).start()
+    return current
+
+
+def refresh() -> None:
+    """Synchronously reload the price list (e.g. after a price import)."""
+    with _refresh_lock:
+        _refresh_locked()
+
+
+def unit_price(product_id: Any) -> Optional[int]:
+    if product_id is None:
+        return None
+    return price_list().prices.get(str(product_id))
+
+
+def cart_totals(cart_id: str, lines: Iterable[Dict[str, Any]], zip_code: str = "") -> Dict[str, Any]:
+    """
+    Price every line, then subtotal, tax and cheapest shipping in one pass.
+    Each line needs product_id and quantity; a stored unit_price_cents is used
+    only when the price list has no entry for the product. Lines are annotated
+    in place with unit_price_cents and line_total_cents.
+    """
+    prices = price_list().prices
+    subtotal = 0
+    unpriced = 0
+    counts = []
+    for line in lines:
+        qty = int(line.get("quantity") or 0)
+        pid = line.get("product_id")
+        price = prices.get(str(pid)) if pid is not None else None
+        if price is None:
+            price = line.get("unit_price_cents")
+        line["unit_price_cents"] = price
+        if price is None:
+            unpriced += qty
+            line["line_total_cents"] = None
+        else:
+            line["line_total_cents"] = price * qty
+            subtotal += price * qty
+        if pid is not None:
+            counts.append({"product_id": pid, "quantity": qty})
+
+    version = shipping.cart_version(counts)
+    shipping_cents = None
+    if version:
+        options = shipping.estimate(cart_id, version, zip_code)["options"]
+        shipping_cents = min(o["cost_cents"] for o in options) if options else None
+    tax = (subtotal * TAX_RATE_BPS + 5000) // 10000
+    return {
+        "subtotal_cents": subtotal,
+        "tax_cents": tax,
+        "shipping_cents": shipping_cents,
+        "total_cents": subtotal + tax + (shipping_cents or 0),
+        "unpriced_items": unpriced,
+        "zip_code": zip_code or None,
+    }
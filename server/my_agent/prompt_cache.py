@@ -0,0 +1,96 @@
+"""
+Prompt-prefix caching support and accounting.
+
+Every agent's request starts with the same static prefix: COMMON_RULES, then
+the role instructions, the ADK identity line and the tool declarations. All
+dynamic content (router context, compaction summaries, tool results) is kept
+in `contents`, after that prefix, so Gemini's prefix caching can reuse it from
+the second call in a process onward.
+
+- check_prefix (before_model_callback) fingerprints the static prefix per agent
+  and counts changes. A non-zero prompt_cache.<agent>.prefix_changes means
+  something dynamic leaked into the instructions and broke caching.
+- record_usage (after_model_callback) accumulates cached vs uncached input
+  tokens per agent from the response usage metadata.
+- cache_config() returns an explicit ADK context-cache config when the
+  installed ADK supports it (PROMPT_CACHE=0 disables it).
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from .metrics import metrics
+
+
+PROMPT_CACHE_ENABLED = os.environ.get("PROMPT_CACHE", "1") != "0"
+PROMPT_CACHE_TTL_S = int(os.environ.get("PROMPT_CACHE_TTL_S", "1800"))
+PROMPT_CACHE_MIN_TOKENS = int(os.environ.get("PROMPT_CACHE_MIN_TOKENS", "0"))
+
+_prefixes: Dict[str, str] = {}
+_lock = threading.Lock()
+
+
+def _prefix_fingerprint(llm_request: Any) -> str:
+    config = getattr(llm_request, "config", None)
+    system = getattr(config, "system_instruction", None) if config is not None else None
+    tools = list((getattr(llm_request, "tools_dict", None) or {}).keys())
+    h = hashlib.sha1(str(system).encode("utf-8"))
+    h.update("\0".join(tools).encode("utf-8"))
+    return h.hexdigest()
+
+
+def check_prefix(callback_context, llm_request):
+    """before_model_callback: count static-prefix changes per agent; never short-circuits."""
+    agent = callback_context.agent_name
+    fp = _prefix_fingerprint(llm_request)
+    with _lock:
+        previous = _prefixes.get(agent)
+        _prefixes[agent] = fp
+    if previous is not None and previous != fp:
+        metrics.incr(f"prompt_cache.{agent}.prefix_changes")
+    return None
+
+
+def record_usage(callback_context, llm_response):
+    """after_model_callback: accumulate cached vs uncached input tokens per agent."""
+    usage = getattr(llm_response, "usage_metadata", None)
+    # Streaming chunks repeat the running usage; count the final response only.
+    if usage is None or getattr(llm_response, "partial", False):
+        return None
+    agent = callback_context.agent_name
+    prompt = int(getattr(usage, "prompt_token_count", None) or 0)
+    cached = int(getattr(usage, "cached_content_token_count", None) or 0)
+    output = int(getattr(usage, "candidates_token_count", None) or 0)
+    metrics.incr(f"prompt_cache.{agent}.calls")
+    metrics.incr(f"prompt_cache.{agent}.cached_tokens", cached)
+    metrics.incr(f"prompt_cache.{agent}.uncached_tokens", max(0, prompt - cached))
+    metrics.incr(f"prompt_cache.{agent}.output_tokens", output)
+    return None
+
+
+def usage_report() -> Dict[str, Dict[str, float]]:
+    """Per-agent token accounting with the cached share of input tokens."""
+    report: Dict[str, Dict[str, float]] = {}
+    for name, value in metrics.snapshot()["counters"].items():
+        if not name.startswith("prompt_cache."):
+            continue
+        _, agent, field = name.split(".", 2)
+        report.setdefault(agent, {})[field] = value
+    for row in report.values():
+        total = row.get("cached_tokens", 0) + row.get("uncached_tokens", 0)
+        row["cached_ratio"] = (row.get("cached_tokens", 0) / total) if total else 0.0
+    return report
+
+
+def cache_config() -> Optional[Any]:
+    """Explicit context caching for the app, if this ADK version has it."""
+    if not PROMPT_CACHE_ENABLED:
+        return None
+    try:
+        from google.adk.agents.context_cache_config import ContextCacheConfig
+    except ImportError:
+        return None
+    return ContextCacheConfig(ttl_seconds=PROMPT_CACHE_TTL_S, min_tokens=PROMPT_CACHE_MIN_TOKENS)
@@ -0,0 +1,143 @@
+"""
+Per-tool accounting of Supabase queries.
+
+Every execute() through supabase_client.sb() is counted and timed by table
+and operation (metrics db.<table>.<op>) and attributed to the tool invocation
+running it: before_tool_callback opens a QueryLog in a contextvar, so queries
+from fan_out workers count too, and after_tool_callback closes it.
+
+When a tool call finishes:
+- the same query shape (table, op, filter columns) issued DB_N_PLUS_ONE_MIN
+  or more times is logged as an N+1 pattern;
+- more queries than the tool's budget (DB_QUERY_BUDGET, overridden per tool
+  by DB_QUERY_BUDGETS="tool=n,...") is logged as over budget.
+Queries slower than DB_SLOW_QUERY_MS are logged as they finish. With
+DB_STRICT_BUDGETS=1 (tests, benchmarks) the query that exceeds the budget
+raises QueryBudgetExceeded instead.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+DB_SLOW_QUERY_MS = float(os.environ.get("DB_SLOW_QUERY_MS", "300"))
+DB_N_PLUS_ONE_MIN = int(os.environ.get("DB_N_PLUS_ONE_MIN", "3"))
+DB_QUERY_BUDGET = int(os.environ.get("DB_QUERY_BUDGET", "12"))
+DB_STRICT_BUDGETS = os.environ.get("DB_STRICT_BUDGETS", "0") == "1"
+UNATTRIBUTED = "-"
+
+
+def _parse_budgets(raw: Optional[str]) -> Dict[str, int]:
+    budgets: Dict[str, int] = {}
+    for item in (raw or "").split(","):
+        tool, _, n = item.partition("=")
+        if tool.strip() and n.strip().isdigit():
+            budgets[tool.strip()] = int(n)
+    return budgets
+
+
+DB_QUERY_BUDGETS = _parse_budgets(os.environ.get("DB_QUERY_BUDGETS"))
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+def budget_for(tool: str) -> int:
+    return DB_QUERY_BUDGETS.get(tool, DB_QUERY_BUDGET)
+
+
+class QueryLog:
+    """Queries issued by one tool invocation."""
+
+    def __init__(self, tool: str):
+        self.tool = tool
+        self.shapes: Counter = Counter()
+        self.total_ms = 0.0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    @property
+    def count(self) -> int:
+        return sum(self.shapes.values())
+
+    def add(self, shape: Tuple[str, str, str], ms: float, rows: int) -> int:
+        with self._lock:
+            self.shapes[shape] += 1
+            self.total_ms += ms
+            self.rows += rows
+            return sum(self.shapes.values())
+
+
+_current: ContextVar[Optional[QueryLog]] = ContextVar("ps_query_log", default=None)
+_open: Dict[str, Tuple[QueryLog, Optional[QueryLog]]] = {}
+_open_lock = threading.Lock()
+_MAX_OPEN = 4096
+
+
+def current_tool() -> str:
+    log = _current.get()
+    return log.tool if log is not None else UNATTRIBUTED
+
+
+def record(table: str, op: str, filters: List[str], ms: float, rows: int) -> None:
+    """Called by the sb() wrapper after every execute()."""
+    log = _current.get()
+    tool = log.tool if log is not None else UNATTRIBUTED
+    metrics.incr(f"db.queries.{table}.{op}")
+    metrics.incr(f"db.rows.{table}", rows)
+    metrics.observe(f"db.{table}.{op}", ms / 1000)
+    metrics.incr(f"db.tool.{tool}.queries")
+    if ms >= DB_SLOW_QUERY_MS:
+        metrics.incr(f"db.slow.{table}.{op}")
+        logger.warning("slow query: %s %s [%s] %.0fms rows=%d tool=%s", op, table, ",".join(filters), ms, rows, tool)
+    if log is None:
+        return
+    n = log.add((table, op, ",".join(filters)), ms, rows)
+    if DB_STRICT_BUDGETS and n > budget_for(tool):
+        raise QueryBudgetExceeded(f"{tool} issued {n} queries (budget {budget_for(tool)}); last: {op} {table}")
+
+
+def _key(tool, tool_context) -> str:
+    return str(getattr(tool_context, "function_call_id", None) or id(tool_context))
+
+
+def begin_tool_queries(tool, args, tool_context):
+    """before_tool_callback: attribute queries to this tool call."""
+    log = QueryLog(getattr(tool, "name", "?"))
+    previous = _current.get()
+    _current.set(log)
+    with _open_lock:
+        _open[_key(tool, tool_context)] = (log, previous)
+        while len(_open) > _MAX_OPEN:
+            _open.pop(next(iter(_open)))
+    return None
+
+
+def end_tool_queries(tool, args, tool_context, tool_response):
+    """after_tool_callback: flag N+1 patterns and budget overruns for this call."""
+    with _open_lock:
+        hit = _open.pop(_key(tool, tool_context), None)
+    if hit is None:
+        return None
+    log, previous = hit
+    _current.set(previous)
+
+    metrics.observe(f"db.tool.{log.tool}", log.total_ms / 1000)
+    for (table, op, filters), n in log.shapes.items():
+        if n >= DB_N_PLUS_ONE_MIN:
+            metrics.incr(f"db.n_plus_one.{log.tool}.{table}")
+            logger.warning("N+1 in %s: %d x %s %s [%s]", log.tool, n, op, table, filters)
+    if log.count > budget_for(log.tool):
+        metrics.incr(f"db.over_budget.{log.tool}")
+        logger.warning("%s issued %d queries (budget %d)", log.tool, log.count, budget_for(log.tool))
+    return None
@@ -0,0 +1,243 @@
+"""
+Compact LLM-facing tool results.
+
+List tools return full rows (up to 50-200 items, whole guide `steps`) and
+also put them in state_delta["ui"] for the widget. The model only needs to
+know what came back, so an after_tool_callback swaps the function response
+for a summary: counts, the top few identifiers and a handle. The full rows
+stay in an in-process store under that handle; expand_result(handle) pages
+through them if the model really needs more. With RESULT_STORE_PATH set
+(serve.py sets it for its workers) the store is a SQLite file instead, so a
+handle made in one worker expands in any other.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from .metrics import metrics
+
+
+COMPACT_TOOL_RESULTS = os.environ.get("COMPACT_TOOL_RESULTS", "1") != "0"
+RESULT_STORE_SIZE = int(os.environ.get("RESULT_STORE_SIZE", "512"))
+RESULT_STORE_TTL_S = float(os.environ.get("RESULT_STORE_TTL_S", "1800"))
+RESULT_STORE_PATH = os.environ.get("RESULT_STORE_PATH", "")
+TOP_N = 5
+
+
+def approx_tokens(obj: Any) -> int:
+    """Roughly 4 characters per token for JSON; good enough to compare payloads."""
+    return len(json.dumps(obj, default=str, separators=(",", ":"))) // 4
+
+
+class ResultStore:
+    def __init__(self, size: int = RESULT_STORE_SIZE, ttl_s: float = RESULT_STORE_TTL_S):
+        self.size = size
+        self.ttl_s = ttl_s
+        self._items: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, kind: str, items: List[Any]) -> str:
+        handle = f"{kind}:{uuid.uuid4().hex[:10]}"
+        with self._lock:
+            self._items[handle] = (time.monotonic(), items)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return handle
+
+    def get(self, handle: str) -> Optional[List[Any]]:
+        with self._lock:
+            hit = self._items.get(handle)
+            if hit is None:
+                return None
+            if time.monotonic() - hit[0] > self.ttl_s:
+                del self._items[handle]
+                return None
+            self._items.move_to_end(handle)
+            return hit[1]
+
+
+class SharedResultStore:
+    """ResultStore over a SQLite file that several processes open at once."""
+
+    def __init__(self, path: str, size: int = RESULT_STORE_SIZE, ttl_s: float = RESULT_STORE_TTL_S):
+        self.size = size
+        self.ttl_s = ttl_s
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # timeout is the busy wait while another worker holds the write lock.
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("pragma journal_mode=wal")
+        self._conn.execute(
+            "create table if not exists results (handle text primary key, stored_at real not null, items text not null)"
+        )
+        self._lock = threading.Lock()
+
+    def put(self, kind: str, items: List[Any]) -> str:
+        handle = f"{kind}:{uuid.uuid4().hex[:10]}"
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "insert into results (handle, stored_at, items) values (?, ?, ?)",
+                (handle, now, json.dumps(items, default=str)),
+            )
+            self._conn.execute("delete from results where stored_at < ?", (now - self.ttl_s,))
+            self._conn.execute(
+                "delete from results where handle not in (select handle from results order by stored_at desc limit ?)",
+                (self.size,),
+            )
+        return handle
+
+    def get(self, handle: str) -> Optional[List[Any]]:
+        with self._lock:
+            hit = self._conn.execute("select stored_at, items from results where handle = ?", (handle,)).fetchone()
+        if hit is None or time.time() - hit[0] > self.ttl_s:
+            return None
+        return json.loads(hit[1])
+
+
+store = SharedResultStore(RESULT_STORE_PATH) if RESULT_STORE_PATH else ResultStore()
+
+
+def _part_label(p: Dict[str, Any]) -> str:
+    name = p.get("name")
+    return f"{p.get('part_number')}: {name}" if name else str(p.get("part_number"))
+
+
+def _model_label(m: Dict[str, Any]) -> str:
+    brand = m.get("brand")
+    return f"{m.get('model_number')} ({brand})" if brand else str(m.get("model_number"))
+
+
+def _listing(kind: str, items: List[Dict[str, Any]], label: Callable[[Dict[str, Any]], str], top_n: int = TOP_N) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"count": len(items), "top": [label(i) for i in items[:top_n]]}
+    if len(items) > top_n:
+        out["handle"] = store.put(kind, items)
+    return out
+
+
+def _paging(r: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: r[k] for k in ("limit", "offset", "next_offset", "has_more", "category") if k in r}
+
+
+def _notes(r: Dict[str, Any]) -> Dict[str, Any]:
+    # The model has to name a corrected identifier, so it survives compaction.
+    return {k: r[k] for k in ("corrected_from",) if k in r}
+
+
+def _compatible_parts(r: Dict[str, Any]) -> Dict[str, Any]:
+    model = r.get("model") or {}
+    return {
+        "status": r["status"],
+        "model": {"model_number": model.get("model_number"), "brand": model.get("brand")},
+        **_listing("parts", r.get("parts") or [], _part_label),
+        **_notes(r),
+    }
+
+
+def _compatible_models(r: Dict[str, Any]) -> Dict[str, Any]:
+    part = r.get("part") or {}
+    return {
+        "status": r["status"],
+        "part": {"part_number": part.get("part_number"), "name": part.get("name")},
+        **_listing("models", r.get("models") or [], _model_label),
+        **_notes(r),
+    }
+
+
+def _model_list(r: Dict[str, Any]) -> Dict[str, Any]:
+    return {"status": r["status"], **_paging(r), **_listing("models", r.get("items") or [], _model_label)}
+
+
+def _product_list(r: Dict[str, Any]) -> Dict[str, Any]:
+    # Names matter for "do you have a ..." questions, so keep a longer top list.
+    out = {"status": r["status"], **_paging(r), **_listing("parts", r.get("items") or [], _part_label, top_n=10)}
+    if r.get("keyword"):
+        out["keyword"] = r["keyword"]
+    return out
+
+
+def _guides(r: Dict[str, Any]) -> Dict[str, Any]:
+    part = r.get("part") or {}
+    guides = r.get("guides") or []
+    return {
+        "status": r["status"],
+        "part": {"part_number": part.get("part_number"), "name": part.get("name")},
+        "guides": [{"title": g.get("title"), "step_count": len(g.get("steps") or [])} for g in guides],
+        "handle": store.put("guides", guides),
+        "note": "The full steps are already shown to the user.",
+        **_notes(r),
+    }
+
+
+def _orders(r: Dict[str, Any]) -> Dict[str, Any]:
+    orders = r.get("items") or []
+    summary = [
+        {
+            "id": o.get("id"),
+            "created_at": o.get("created_at"),
+            "status": o.get("status"),
+            "item_count": sum(int(i.get("quantity") or 0) for i in o.get("items") or []),
+        }
+        for o in orders[:TOP_N]
+    ]
+    out = {"status": r["status"], **_paging(r), "count": len(orders), "orders": summary}
+    if len(orders) > TOP_N or any(o.get("items") for o in orders):
+        out["handle"] = store.put("orders", orders)
+    return out
+
+
+COMPACTORS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "get_compatible_parts": _compatible_parts,
+    "get_compatible_models": _compatible_models,
+    "list_supported_models": _model_list,
+    "list_models": _model_list,
+    "list_products": _product_list,
+    "search_products": _product_list,
+    "find_compatible_parts_by_keyword": _product_list,
+    "get_installation_guide": _guides,
+    "list_order_history": _orders,
+}
+
+
+def compact_tool_result(tool, args, tool_context, tool_response):
+    """after_tool_callback: replace list-heavy results with a compact summary."""
+    name = getattr(tool, "name", "")
+    compactor = COMPACTORS.get(name)
+    if not COMPACT_TOOL_RESULTS or compactor is None:
+        return None
+    if not isinstance(tool_response, dict) or tool_response.get("status") != "ok":
+        return None
+    compact = compactor(tool_response)
+    full_tokens = approx_tokens(tool_response)
+    compact_tokens = approx_tokens(compact)
+    metrics.incr(f"tokens.full.{name}", full_tokens)
+    metrics.incr(f"tokens.compact.{name}", compact_tokens)
+    metrics.incr("tokens.saved", full_tokens - compact_tokens)
+    return compact
+
+
+def expand_result(handle: str, offset: int = 0, limit: int = 10) -> Dict[str, Any]:
+    """
+    Page through the full rows behind a `handle` from an earlier summarized result.
+    Only needed when the user wants details beyond the summary; the UI already shows the list.
+    """
+    items = store.get((handle or "").strip())
+    if items is None:
+        return {"status": "not_found", "reason": "expired_handle", "handle": handle}
+    offset = max(0, int(offset))
+    limit = max(1, min(int(limit), 25))
+    page = items[offset : offset + limit]
+    return {
+        "status": "ok",
+        "handle": handle,
+        "items": page,
+        "offset": offset,
+        "next_offset": offset + len(page),
+        "has_more": offset + len(page) < len(items),
+    }
@@ -0,0 +1,355 @@
+"""
+Local intent router for the coordinator.
+
+Most turns are unambiguous ("add PS123 to my cart", "how do I install
+PS456"), yet each one costs a coordinator LLM call to pick a specialist and a
+second one to restate the specialist's answer. The router classifies the
+user message in-process and, when confident, answers the coordinator's model
+call itself with a function call to the right specialist, then passes the
+specialist's reply through verbatim.
+
+Mixed-domain turns become a plan of stages: independent specialists in a
+stage are called together (ADK runs parallel function calls concurrently),
+and a dependent stage ("...and if so add it") waits for the one before it.
+Their replies and UI payloads are merged. Low-confidence turns fall through
+to the coordinator LLM unchanged.
+"""
+from __future__ import annotations
+
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from .guard import fresh_user_text
+from .metrics import metrics
+
+
+ROUTER_ENABLED = os.environ.get("ROUTER_ENABLED", "1") != "0"
+ROUTER_MIN_CONFIDENCE = float(os.environ.get("ROUTER_MIN_CONFIDENCE", "0.8"))
+
+CATALOG = "catalog_specialist"
+TRANSACTION = "transaction_specialist"
+HISTORY = "history_specialist"
+SPECIALISTS = (CATALOG, TRANSACTION, HISTORY)
+DOMAIN_LABELS = {
+    CATALOG: "product, compatibility or installation",
+    TRANSACTION: "cart, shipping or checkout",
+    HISTORY: "order history",
+}
+CONDITION_MET_TEXT = {
+    "compatible": "Compatibility has already been confirmed.",
+}
+SKIPPED_TEXT = {
+    "compatible": "I did not add it to your cart because it is not confirmed compatible with that model.",
+}
+
+# Routing priorities mirror COORDINATOR_INSTRUCTIONS.
+HISTORY_RE = re.compile(
+    r"\b(order history|checkout history|purchase history|past (orders?|checkouts?|purchases)|"
+    r"previous (orders?|checkouts?|purchases)|my orders|last orders?|orders? i (placed|made))\b",
+    re.IGNORECASE,
+)
+INSTALL_RE = re.compile(r"\b(install|installation|installing|instructions?)\b", re.IGNORECASE)
+TRANSACTION_RE = re.compile(
+    r"\b(add|buy|purchase|cart|remove|delete|quantity|qty|shipping|ship|checkout|check out|"
+    r"make (that|it)|change (that |it )?to|set (the )?quantity|take off|another one)\b",
+    re.IGNORECASE,
+)
+COMPAT_RE = re.compile(r"\b(compatib\w*|fits?|work with)\b", re.IGNORECASE)
+CONDITIONAL_RE = re.compile(
+    r"\b(if (so|yes|it (is|does)|it'?s (compatible|a fit)|compatible|it fits)|only if|assuming (it|that))\b",
+    re.IGNORECASE,
+)
+PS_RE = re.compile(r"\bPS\d{5,10}\b", re.IGNORECASE)
+MODEL_RE = re.compile(r"\b(?=[A-Z0-9-]*\d)(?=[A-Z0-9-]*[A-Z])[A-Z0-9-]{6,}\b", re.IGNORECASE)
+TOKEN_RE = re.compile(r"[a-z]+")
+
+
+def _tokens(text: str) -> List[str]:
+    return TOKEN_RE.findall(MODEL_RE.sub(" modeltoken ", PS_RE.sub(" pstoken ", text)).lower())
+
+
+# ----------------------------
+# Classifier
+# ----------------------------
+
+# Seed utterances; extend with ROUTER_TRAINING_FILE (lines of "<specialist>\t<utterance>").
+TRAINING_DATA = [
+    (CATALOG, "do you have a water filter for my fridge"),
+    (CATALOG, "show me dishwasher parts"),
+    (CATALOG, "what parts do you sell for refrigerators"),
+    (CATALOG, "tell me about PS11752778"),
+    (CATALOG, "what is this part"),
+    (CATALOG, "my ice maker is not working"),
+    (CATALOG, "the dishwasher is leaking from the door"),
+    (CATALOG, "fridge is not cooling how do i fix it"),
+    (CATALOG, "which models do you support"),
+    (CATALOG, "list whirlpool models"),
+    (CATALOG, "find a door gasket for WDT780SAEM1"),
+    (CATALOG, "what parts work with model WRS325SDHZ"),
+    (CATALOG, "looking for a replacement rack wheel"),
+    (CATALOG, "next page of models"),
+    (CATALOG, "refrigerator"),
+    (CATALOG, "dishwasher"),
+    (TRANSACTION, "i want two of those"),
+    (TRANSACTION, "put it in my basket"),
+    (TRANSACTION, "what's in my basket"),
+    (TRANSACTION, "how much is delivery to 10001"),
+    (TRANSACTION, "deliver to zip 94107"),
+    (TRANSACTION, "i'm ready to pay"),
+    (TRANSACTION, "proceed to payment"),
+    (TRANSACTION, "actually make it three"),
+    (TRANSACTION, "no it should be two not three"),
+    (TRANSACTION, "get rid of the filter"),
+    (TRANSACTION, "one more please"),
+    (HISTORY, "what did i order before"),
+    (HISTORY, "show my previous purchases"),
+    (HISTORY, "what have i bought"),
+    (HISTORY, "older orders please"),
+    (HISTORY, "did my last order go through"),
+]
+
+
+class NaiveBayes:
+    """Multinomial naive Bayes over word tokens, with add-one smoothing."""
+
+    def __init__(self, examples: List[tuple]):
+        self.labels = sorted({label for label, _ in examples})
+        self.doc_counts = Counter(label for label, _ in examples)
+        self.word_counts: Dict[str, Counter] = {label: Counter() for label in self.labels}
+        for label, text in examples:
+            self.word_counts[label].update(_tokens(text))
+        self.vocab = set().union(*self.word_counts.values()) if self.word_counts else set()
+        self.totals = {label: sum(c.values()) for label, c in self.word_counts.items()}
+
+    def predict(self, text: str) -> Dict[str, float]:
+        toks = [t for t in _tokens(text) if t in self.vocab]
+        if not toks:
+            return {}
+        n_docs = sum(self.doc_counts.values())
+        v = len(self.vocab)
+        logp = {}
+        for label in self.labels:
+            lp = math.log(self.doc_counts[label] / n_docs)
+            denom = self.totals[label] + v
+            for t in toks:
+                lp += math.log((self.word_counts[label][t] + 1) / denom)
+            logp[label] = lp
+        m = max(logp.values())
+        z = sum(math.exp(lp - m) for lp in logp.values())
+        return {label: math.exp(lp - m) / z for label, lp in logp.items()}
+
+
+def _training_examples() -> List[tuple]:
+    examples = list(TRAINING_DATA)
+    path = os.environ.get("ROUTER_TRAINING_FILE")
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                label, _, text = line.rstrip("\n").partition("\t")
+                if label in SPECIALISTS and text.strip():
+                    examples.append((label, text.strip()))
+    return examples
+
+
+_classifier = NaiveBayes(_training_examples())
+
+
+# ----------------------------
+# Routing
+# ----------------------------
+
+def classify(message: str) -> Dict[str, Any]:
+    """
+    Return {"agent", "confidence", "domains", "source"}.
+    `agent` is None when the turn should go to the coordinator LLM.
+    """
+    text = message or ""
+    history = bool(HISTORY_RE.search(text))
+    # "checkout history" must not count as a checkout request.
+    stripped = HISTORY_RE.sub(" ", text)
+    install = bool(INSTALL_RE.search(stripped))
+    transaction = bool(TRANSACTION_RE.search(stripped))
+    compat = bool(COMPAT_RE.search(stripped))
+
+    domains = []
+    if install or compat:
+        domains.append(CATALOG)
+    if transaction:
+        domains.append(TRANSACTION)
+    if history:
+        domains.append(HISTORY)
+
+    if len(domains) > 1:
+        return {"agent": None, "confidence": 0.0, "domains": domains, "source": "rules"}
+    if domains:
+        return {"agent": domains[0], "confidence": 0.95, "domains": domains, "source": "rules"}
+
+    probs = _classifier.predict(text)
+    if not probs:
+        return {"agent": None, "confidence": 0.0, "domains": [], "source": "classifier"}
+    best = max(probs, key=probs.get)
+    # Bare part/model numbers are catalog lookups unless something else won clearly.
+    if PS_RE.search(text) and probs[best] < ROUTER_MIN_CONFIDENCE:
+        best = CATALOG
+        probs[CATALOG] = ROUTER_MIN_CONFIDENCE
+    confident = probs[best] >= ROUTER_MIN_CONFIDENCE
+    return {
+        "agent": best if confident else None,
+        "confidence": probs[best],
+        "domains": [best],
+        "source": "classifier",
+    }
+
+
+def _specialist_results(llm_request: Any) -> List[tuple]:
+    contents = getattr(llm_request, "contents", None) or []
+    if not contents:
+        return []
+    out = []
+    for p in contents[-1].parts or []:
+        fr = getattr(p, "function_response", None)
+        if fr is not None and fr.name in SPECIALISTS:
+            out.append((fr.name, fr.response or {}))
+    return out
+
+
+def _request_with_context(text: str, llm_request: Any, state: Any) -> str:
+    """
+    Specialists run in a fresh sub-session and only see the request string.
+    The coordinator LLM would restate follow-ups ("make it three",
+    "refrigerator") with context; do the same with what we already know.
+    """
+    context = []
+    last_part = state.get("last_part_number")
+    if isinstance(last_part, str) and last_part.strip():
+        context.append(f"Most recent part number: {last_part.strip()}.")
+    for content in reversed((getattr(llm_request, "contents", None) or [])[:-1]):
+        if getattr(content, "role", None) != "model":
+            continue
+        prev = "".join(p.text for p in content.parts or [] if getattr(p, "text", None)).strip()
+        if prev:
+            context.append(f"Previous assistant message: {prev[:400]}")
+            break
+    if not context:
+        return text
+    return f"{text}\n\n(Context: {' '.join(context)})"
+
+
+def plan_turn(message: str) -> Optional[Dict[str, Any]]:
+    """
+    Turn a message into specialist stages, or None for the coordinator LLM.
+
+    Calls within a stage are independent and run concurrently. A later stage
+    only runs when its `condition` holds, e.g. "is PS123 compatible with
+    WDT780 and if so add two" checks compatibility first and adds only if
+    compatible. Without such a dependency, mixed turns are one parallel stage.
+    """
+    route = classify(message)
+    if route["agent"] is not None:
+        return {"stages": [[route["agent"]]], "condition": None, "mixed": False}
+    domains = route["domains"]
+    if route["source"] != "rules" or len(domains) < 2:
+        return None
+    if CATALOG in domains and TRANSACTION in domains and CONDITIONAL_RE.search(message or ""):
+        rest = [d for d in domains if d != TRANSACTION]
+        return {"stages": [rest, [TRANSACTION]], "condition": "compatible", "mixed": True}
+    return {"stages": [domains], "condition": None, "mixed": True}
+
+
+def _condition_holds(condition: Optional[str], state: Any) -> bool:
+    if condition is None:
+        return True
+    if condition == "compatible":
+        last = state.get("last_compatibility") or {}
+        return last.get("compatible") is True
+    return False
+
+
+def _merged_ui(state: Any, agents: List[str]) -> Optional[Dict[str, Any]]:
+    payloads = []
+    for agent in agents:
+        payload = state.get(f"ui_{agent}")
+        if payload:
+            payloads.append(payload)
+            state[f"ui_{agent}"] = None
+    if len(payloads) < 2:
+        return None
+    return {"type": "multi", "items": payloads}
+
+
+def make_router_callback(in_scope: Callable[[str], bool]):
+    """
+    Build the coordinator's before_model_callback.
+
+    On a fresh user turn it answers the model call with function calls to the
+    planned specialists; as results come back it either issues the next stage
+    or answers with the specialists' text, so the coordinator LLM never runs.
+    """
+    from google.genai import types
+    from google.adk.models import LlmResponse
+
+    def _calls(agents: List[str], request: str, mixed: bool, note: str = "") -> LlmResponse:
+        parts = []
+        for agent in agents:
+            req = request
+            if mixed:
+                req = f"{request}\n\n(Only handle the {DOMAIN_LABELS[agent]} part of this request; another specialist handles the rest. {note})".replace(" )", ")")
+            parts.append(types.Part(function_call=types.FunctionCall(name=agent, args={"request": req})))
+        return LlmResponse(content=types.Content(role="model", parts=parts))
+
+    def route_turn(callback_context, llm_request) -> Optional[LlmResponse]:
+        if not ROUTER_ENABLED:
+            return None
+        state = callback_context.state
+
+        results = _specialist_results(llm_request)
+        if results:
+            plan = state.get("ps_route_plan")
+            if not plan:
+                return None
+            texts = plan["texts"] + [str(r.get("result") or "").strip() for _, r in results]
+            called = plan["called"] + [name for name, _ in results]
+            stage = plan["stage"] + 1
+            if stage < len(plan["stages"]):
+                if _condition_holds(plan["condition"], state):
+                    state["ps_route_plan"] = {**plan, "stage": stage, "texts": texts, "called": called}
+                    metrics.incr("router.llm_calls_saved")
+                    note = CONDITION_MET_TEXT.get(plan["condition"], "")
+                    return _calls(plan["stages"][stage], plan["request"], plan["mixed"], note)
+                texts.append(SKIPPED_TEXT.get(plan["condition"], ""))
+            state["ps_route_plan"] = None
+            text = "\n\n".join(t for t in texts if t).strip()
+            if not text:
+                # Nothing to pass through; let the coordinator write the reply.
+                return None
+            merged = _merged_ui(state, called)
+            if merged is not None:
+                state["ui"] = merged
+            metrics.incr("router.llm_calls_saved")
+            return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+        text = fresh_user_text(llm_request)
+        if not text:
+            return None
+        # A fresh turn; drop any plan left behind by an interrupted one.
+        state["ps_route_plan"] = None
+        if not in_scope(text):
+            return None
+        plan = plan_turn(text)
+        if plan is None:
+            metrics.incr("router.fallback_llm")
+            return None
+        first = plan["stages"][0]
+        metrics.incr("router.mixed" if plan["mixed"] else f"router.local.{first[0]}")
+        metrics.incr("router.llm_calls_saved")
+        request = _request_with_context(text, llm_request, state)
+        state["last_compatibility"] = None
+        for agent in SPECIALISTS:
+            state[f"ui_{agent}"] = None
+        state["ps_route_plan"] = {**plan, "stage": 0, "request": request, "texts": [], "called": []}
+        return _calls(first, request, plan["mixed"])
+
+    return route_turn
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+# ----------------------------
+# Rate tables
+# ----------------------------
+
+class RateTable(ABC):
+    """
+    Turns a shipment summary into shipping options.
+    Subclasses should precompute everything they can in __init__ so that
+    `options()` stays a handful of dict lookups and arithmetic.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def options(self, shipment: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """[{"service", "eta_days", "cost_cents", ...}] for `shipment` (zip_code, total_items, lines)."""
+
+
+class FlatRateTable(RateTable):
+    """Base fee plus a per-item surcharge, regardless of destination."""
+
+    name = "flat"
+
+    def __init__(self, services: Optional[List[Dict[str, Any]]] = None):
+        self.services = services or [
+            {"service": "Standard", "eta_days": "4-7", "base_cents": 799, "per_item_cents": 50},
+            {"service": "Expedited", "eta_days": "2-3", "base_cents": 1499, "per_item_cents": 75},
+        ]
+
+    def options(self, shipment: Dict[str, Any]) -> List[Dict[str, Any]]:
+        qty = int(shipment.get("total_items") or 0)
+        return [
+            {"service": s["service"], "eta_days": s["eta_days"], "cost_cents": s["base_cents"] + s["per_item_cents"] * qty}
+            for s in self.services
+        ]
+
+
+class WeightZoneRateTable(RateTable):
+    """
+    Zone (first digit of the zip code) x weight pricing.
+    `zones` maps a zip prefix digit to a zone number; `services` carry a per-zone
+    base fee and a per-started-kilogram fee.
+    """
+
+    name = "weight_zone"
+
+    def __init__(
+        self,
+        origin_zone: int = 5,
+        default_item_weight_g: int = 450,
+        weights_g: Optional[Dict[Any, int]] = None,
+        services: Optional[List[Dict[str, Any]]] = None,
+    ):
+        self.default_item_weight_g = int(default_item_weight_g)
+        self.weights_g = {str(k): int(v) for k, v in (weights_g or {}).items()}
+        # Distance from the origin zone, computed once for every zip prefix.
+        self.zones = {str(d): abs(d - origin_zone) + 1 for d in range(10)}
+        self.services = services or [
+            {"service": "Standard", "eta_days": "4-7", "base_cents": [699, 749, 799, 849, 899, 949, 999, 1049, 1099, 1149], "per_kg_cents": 120},
+            {"service": "Expedited", "eta_days": "2-3", "base_cents": [1299, 1399, 1499, 1599, 1699, 1799, 1899, 1999, 2099, 2199], "per_kg_cents": 220},
+        ]
+
+    def zone_for(self, zip_code: str) -> int:
+        return self.zones.get((zip_code or "0")[:1], len(self.zones))
+
+    def options(self, shipment: Dict[str, Any]) -> List[Dict[str, Any]]:
+        zone = self.zone_for(shipment.get("zip_code") or "")
+        grams = 0
+        for product_id, qty in shipment.get("lines") or ():
+            grams += self.weights_g.get(product_id, self.default_item_weight_g) * qty
+        kg = max(1, -(-grams // 1000))
+        out = []
+        for s in self.services:
+            base = s["base_cents"][min(zone, len(s["base_cents"])) - 1]
+            out.append({"service": s["service"], "eta_days": s["eta_days"], "cost_cents": base + s["per_kg_cents"] * kg, "zone": zone})
+        return out
+
+
+RATE_TABLES = {
+    FlatRateTable.name: FlatRateTable,
+    WeightZoneRateTable.name: WeightZoneRateTable,
+}
+
+# JSON object of constructor arguments for the selected table, e.g. for
+# weight_zone: {"origin_zone": 9, "weights_g": {"<product id>": 1200}, "services": [...]}
+SHIPPING_RATE_CONFIG = os.environ.get("SHIPPING_RATE_CONFIG", "")
+
+_rate_table: Optional[RateTable] = None
+
+
+def _rate_config() -> Dict[str, Any]:
+    if not SHIPPING_RATE_CONFIG:
+        return {}
+    with open(SHIPPING_RATE_CONFIG, encoding="utf-8") as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError(f"{SHIPPING_RATE_CONFIG}: expected a JSON object of rate table arguments")
+    return config
+
+
+def rate_table() -> RateTable:
+    global _rate_table
+    if _rate_table is None:
+        name = os.environ.get("SHIPPING_RATE_TABLE", FlatRateTable.name).strip().lower()
+        _rate_table = RATE_TABLES.get(name, FlatRateTable)(**_rate_config())
+    return _rate_table
+
+
+def set_rate_table(table: RateTable) -> None:
+    """Swap the active rate table; memoized estimates priced by the old one are dropped."""
+    global _rate_table
+    _rate_table = table
+    with _lock:
+        _estimates.clear()
+
+
+# ----------------------------
+# Memoized estimates
+# ----------------------------
+
+ESTIMATE_CACHE_SIZE = int(os.environ.get("SHIPPING_ESTIMATE_CACHE_SIZE", "1024"))
+
+_estimates: "OrderedDict[Tuple[str, Tuple[Tuple[Any, int], ...], str], Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def cart_version(lines: Iterable[Dict[str, Any]]) -> Tuple[Tuple[Any, int], ...]:
+    """
+    Content version of a cart: sorted (product_id, quantity) pairs.
+    Any add/set/remove changes it, so it is safe to share across processes.
+    """
+    return tuple(sorted((str(r["product_id"]), int(r.get("quantity") or 0)) for r in lines))
+
+
+def estimate(cart_id: str, version: Tuple[Tuple[Any, int], ...], zip_code: str) -> Dict[str, Any]:
+    key = (str(cart_id), version, zip_code)
+    with _lock:
+        hit = _estimates.get(key)
+        if hit is not None:
+            _estimates.move_to_end(key)
+            return hit
+
+    total_qty = sum(qty for _, qty in version)
+    shipment = {"zip_code": zip_code, "total_items": total_qty, "lines": version}
+    result = {"zip_code": zip_code, "total_items": total_qty, "options": rate_table().options(shipment)}
+
+    with _lock:
+        _estimates[key] = result
+        while len(_estimates) > ESTIMATE_CACHE_SIZE:
+            _estimates.popitem(last=False)
+    return result
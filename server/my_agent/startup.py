@@ -0,0 +1,201 @@
+"""
+Cold start: import profiling and the warm-up phase.
+
+The ADK api_server imports the agent package on the first /run, and the
+first request after that would also pay for the Supabase client and every
+cold cache. main.py primes the agent process at startup with a /run whose
+state carries WARMUP_KEY. The coordinator's `warm_up_reply` callback answers
+it without calling the model, after `warm_up()` has:
+
+- created the Supabase client and made one round trip (connection opened),
+- loaded the price list and the part/model number index,
+- cached install guides for the parts most often added to carts recently,
+- replayed write-behind ops spilled by earlier processes.
+
+main.py's /ready flips once that run has returned "ready"; a "degraded"
+reply names the failed steps and keeps it not ready.
+
+    cd server
+    python -m my_agent.startup --profile      # slowest imports of my_agent.agent
+    python -m my_agent.startup --warm         # run the warm-up here, print step timings
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+WARMUP_KEY = "ps_warmup"
+WARMUP_POPULAR_GUIDES = int(os.environ.get("WARMUP_POPULAR_GUIDES", "20"))
+# Recent cart lines scanned to find the popular parts.
+WARMUP_CART_SAMPLE = 1000
+
+_lock = threading.Lock()
+_report: Optional[Dict[str, Any]] = None
+
+
+def _client() -> None:
+    from .supabase_client import sb
+
+    sb().table("products").select("id").limit(1).execute()
+
+
+def _prices() -> None:
+    from . import pricing
+
+    pricing.refresh()
+
+
+def _catalog_index() -> None:
+    from . import catalog_index
+
+    catalog_index.refresh()
+
+
+def _popular_guides() -> None:
+    from .supabase_client import sb
+    from .tools import warm_guides
+
+    recent = (
+        sb()
+        .table("cart_items")
+        .select("product_id")
+        .order("created_at", desc=True)
+        .limit(WARMUP_CART_SAMPLE)
+        .execute()
+    ).data or []
+    popular = [pid for pid, _ in Counter(r["product_id"] for r in recent if r.get("product_id")).most_common(WARMUP_POPULAR_GUIDES)]
+    warm_guides(popular)
+
+
+def _spilled_writes() -> None:
+    from .write_behind import write_behind
+
+    write_behind.replay_spill()
+
+
+STEPS: List[Tuple[str, Callable[[], None]]] = [
+    ("client", _client),
+    ("prices", _prices),
+    ("catalog_index", _catalog_index),
+    ("popular_guides", _popular_guides),
+    ("spilled_writes", _spilled_writes),
+]
+
+
+def warm_up() -> Dict[str, Any]:
+    """
+    Run every warm-up step once per process (later calls return the same
+    report). A failing step is logged and reported; the rest still run.
+    """
+    global _report
+    with _lock:
+        if _report is not None:
+            return _report
+        t0 = time.perf_counter()
+        steps: Dict[str, Any] = {}
+        for name, step in STEPS:
+            s0 = time.perf_counter()
+            try:
+                step()
+                steps[name] = {"ok": True}
+            except Exception as e:
+                logger.exception("warm-up step %s failed", name)
+                steps[name] = {"ok": False, "error": str(e)}
+            steps[name]["ms"] = round((time.perf_counter() - s0) * 1000, 1)
+            metrics.observe(f"startup.{name}", time.perf_counter() - s0)
+        _report = {"ok": all(s["ok"] for s in steps.values()), "ms": round((time.perf_counter() - t0) * 1000, 1), "steps": steps}
+        logger.info("warm-up done in %.0fms: %s", _report["ms"], {k: v["ms"] for k, v in steps.items()})
+        return _report
+
+
+def warm_up_reply(callback_context, llm_request):
+    """before_model_callback (coordinator): answer main.py's priming run without the model."""
+    try:
+        if not callback_context.state.get(WARMUP_KEY):
+            return None
+    except Exception:
+        return None
+    report = warm_up()
+
+    from google.genai import types
+    from google.adk.models import LlmResponse
+
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=reply_text(report))]))
+
+
+def reply_text(report: Dict[str, Any]) -> str:
+    """"ready", or "degraded: <failed step>, ..." (read back by main.py)."""
+    if report["ok"]:
+        return "ready"
+    return "degraded: " + ", ".join(name for name, step in report["steps"].items() if not step["ok"])
+
+
+def failed_steps(reply: str) -> Optional[List[str]]:
+    """The steps a warm-up reply names as failed; None when it isn't a warm-up reply."""
+    status, _, steps = (reply or "").strip().partition(":")
+    if status == "ready":
+        return []
+    if status == "degraded":
+        return [s.strip() for s in steps.split(",") if s.strip()]
+    return None
+
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_imports(module: str = "my_agent.agent", top: int = 25) -> List[Tuple[int, int, str]]:
+    """(cumulative us, self us, module) for the slowest imports of `module`, in a fresh interpreter."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"import {module} failed")
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if m:
+            rows.append((int(m.group(2)), int(m.group(1)), m.group(4)))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Profile the agent's imports or run its warm-up phase.")
+    parser.add_argument("--profile", action="store_true", help="list the slowest imports")
+    parser.add_argument("--module", default="my_agent.agent")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--warm", action="store_true", help="run the warm-up steps and print their timings")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        print(f"{'cumulative ms':>13} {'self ms':>8}  module")
+        for cumulative, own, name in profile_imports(args.module, args.top):
+            print(f"{cumulative / 1000:>13.1f} {own / 1000:>8.1f}  {name}")
+    if args.warm:
+        logging.basicConfig(level=logging.INFO)
+        report = warm_up()
+        for name, step in report["steps"].items():
+            print(f"{name:<16} {step['ms']:>8.1f} ms  {'ok' if step['ok'] else step['error']}")
+        print(f"{'total':<16} {report['ms']:>8.1f} ms")
+        return 0 if report["ok"] else 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
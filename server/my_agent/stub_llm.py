@@ -0,0 +1,210 @@
+"""
+Deterministic stand-in for Gemini, for offline runs of the real agent graph.
+
+StubLlm answers from simple rules instead of a network call:
+- the coordinator calls the specialist router.classify picks (catalog when
+  unsure) with the user's text as the request;
+- specialists pick one tool from the user's own words in the request (part/
+  model numbers, cart and shipping words; router-appended context only fills
+  in a missing part number) and call it with extracted arguments;
+- once function responses come back it answers with a short text built from
+  them (a specialist result is passed through as-is).
+
+Each call is logged with the requested model name (as set by model_policy)
+and approximate input/output tokens, and may sleep STUB_LATENCY_MS
+(`model=ms,...`) to mimic tier latency.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import re
+import threading
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.genai import types
+
+from .router import CATALOG, MODEL_RE, PS_RE, SPECIALISTS, classify
+
+
+ZIP_RE = re.compile(r"\b\d{5}\b")
+QTY_RE = re.compile(r"\b(\d{1,2})\b(?!\d)")
+
+
+def _parse_latency(raw: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for item in raw.split(","):
+        model, _, ms = item.partition("=")
+        try:
+            out[model.strip()] = float(ms)
+        except ValueError:
+            continue
+    return out
+
+
+STUB_LATENCY_MS = _parse_latency(os.environ.get("STUB_LATENCY_MS", ""))
+
+_calls: List[Dict[str, Any]] = []
+_calls_lock = threading.Lock()
+
+
+def calls() -> List[Dict[str, Any]]:
+    with _calls_lock:
+        return list(_calls)
+
+
+def reset_calls() -> None:
+    with _calls_lock:
+        _calls.clear()
+
+
+def _approx_tokens(obj: Any) -> int:
+    return len(obj if isinstance(obj, str) else json.dumps(obj, default=str)) // 4
+
+
+def _request_tokens(llm_request: LlmRequest) -> int:
+    config = getattr(llm_request, "config", None)
+    system = getattr(config, "system_instruction", None) or ""
+    n = _approx_tokens(str(system))
+    for c in llm_request.contents or []:
+        for p in c.parts or []:
+            if getattr(p, "text", None):
+                n += _approx_tokens(p.text)
+            elif getattr(p, "function_call", None) is not None:
+                n += _approx_tokens(p.function_call.args or {}) + 8
+            elif getattr(p, "function_response", None) is not None:
+                n += _approx_tokens(p.function_response.response or {}) + 8
+    return n
+
+
+def _split_request(text: str) -> Tuple[str, str]:
+    """The user's own words and the "(Context: ...)" / "(Only handle ...)" notes the router appends."""
+    own, _, notes = text.partition("\n\n(")
+    return own, notes
+
+
+def _specialist_call(text: str, tools: List[str]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    # Intent comes from the user's own words only: injected context such as
+    # "Previous assistant message: add_to_cart: ok." must not pick the tool.
+    # The context may still supply the part number for "add another one".
+    own, notes = _split_request(text)
+    lower = own.lower()
+    own_pn = PS_RE.search(own)
+    pn = own_pn or PS_RE.search(notes)
+    mn = MODEL_RE.search(PS_RE.sub(" ", own))
+    zip_code = ZIP_RE.search(PS_RE.sub(" ", own))
+    qty = QTY_RE.search(PS_RE.sub(" ", own))
+
+    candidates: List[Tuple[str, Dict[str, Any]]] = []
+    if pn and any(w in lower for w in ("add", "buy", "another")):
+        candidates.append(("add_to_cart", {"session_id": "", "part_number": pn.group(0), "quantity": int(qty.group(1)) if qty else 1}))
+    if pn and any(w in lower for w in ("remove", "delete")):
+        candidates.append(("remove_from_cart", {"session_id": "", "part_number": pn.group(0)}))
+    if zip_code and "ship" in lower:
+        candidates.append(("estimate_shipping", {"session_id": "", "zip_code": zip_code.group(0)}))
+    if "checkout" in lower or "check out" in lower:
+        candidates.append(("create_checkout_session", {"session_id": ""}))
+    if "cart" in lower:
+        candidates.append(("get_cart", {"session_id": ""}))
+    if any(w in lower for w in ("history", "orders", "previous", "past")):
+        candidates.append(("list_order_history", {}))
+    if own_pn and mn:
+        candidates.append(("check_compatibility", {"part_number": own_pn.group(0), "model_number": mn.group(0)}))
+    if "install" in lower:
+        candidates.append(("get_installation_guide", {"part_number": pn.group(0) if pn else None}))
+    if mn and "part" in lower:
+        candidates.append(("get_compatible_parts", {"model_number": mn.group(0)}))
+    if own_pn:
+        candidates.append(("get_product_by_part_number", {"part_number": own_pn.group(0)}))
+    if "refrigerator" in lower or "dishwasher" in lower or "fridge" in lower:
+        category = "dishwasher" if "dishwasher" in lower else "refrigerator"
+        candidates.append(("list_products", {"category": category}))
+    candidates.append(("search_products", {"query": own[:80]}))
+
+    for name, args in candidates:
+        if name in tools:
+            return name, args
+    return None
+
+
+def _reply_text(responses: List[Any]) -> str:
+    texts = []
+    for fr in responses:
+        r = fr.response if isinstance(fr.response, dict) else {}
+        if fr.name in SPECIALISTS:
+            texts.append(str(r.get("result") or "").strip())
+        else:
+            corrected = ", ".join(str(v) for v in (r.get("corrected_from") or {}).values())
+            texts.append(f"{fr.name}: {r.get('status', 'done')}{f' (corrected from {corrected})' if corrected else ''}.")
+    return " ".join(t for t in texts if t) or "Done."
+
+
+class StubLlm(BaseLlm):
+    """BaseLlm that plays a plausible, deterministic agent turn."""
+
+    @classmethod
+    def supported_models(cls) -> List[str]:
+        return [r"stub.*"]
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        model = llm_request.model or self.model
+        tools = list((getattr(llm_request, "tools_dict", None) or {}).keys())
+        last = (llm_request.contents or [None])[-1]
+        parts = (last.parts or []) if last is not None else []
+        responses = [p.function_response for p in parts if getattr(p, "function_response", None)]
+
+        if responses:
+            part = types.Part(text=_reply_text(responses))
+        else:
+            text = "".join(p.text for p in parts if getattr(p, "text", None))
+            call = None
+            specialists = [t for t in tools if t in SPECIALISTS]
+            if specialists:
+                agent = classify(text).get("agent") or CATALOG
+                if agent in specialists:
+                    call = (agent, {"request": text})
+            elif tools:
+                call = _specialist_call(text, tools)
+            if call:
+                part = types.Part(function_call=types.FunctionCall(name=call[0], args=call[1]))
+            else:
+                part = types.Part(text="Could you tell me the part or model number?")
+
+        delay_ms = STUB_LATENCY_MS.get(model, 0.0)
+        if delay_ms:
+            await asyncio.sleep(delay_ms / 1000)
+
+        prompt_tokens = _request_tokens(llm_request)
+        output_tokens = _approx_tokens(part.text or "") if part.text else _approx_tokens(part.function_call.args or {}) + 8
+        with _calls_lock:
+            _calls.append(
+                {
+                    "model": model,
+                    "tools": len(tools),
+                    "function_call": part.function_call.name if part.function_call else None,
+                    "input_tokens": prompt_tokens,
+                    "output_tokens": output_tokens,
+                }
+            )
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[part]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=output_tokens,
+                total_token_count=prompt_tokens + output_tokens,
+            ),
+        )
+
+
+_stub: Optional[StubLlm] = None
+
+
+def stub_llm() -> StubLlm:
+    global _stub
+    if _stub is None:
+        _stub = StubLlm(model="stub")
+    return _stub
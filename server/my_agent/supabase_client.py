@@ -1,16 +1,124 @@
 from __future__ import annotations
 import os
-from typing import Optional
-from supabase import create_client, Client
+import time
+from typing import TYPE_CHECKING, Any, List, Optional
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+from . import query_stats, tracing
 
 _sb: Optional[Client] = None
 
+# "supabase" (default) or "sqlite" for the local stand-in in local_db.py.
+PS_DATA_BACKEND = os.environ.get("PS_DATA_BACKEND", "supabase")
+
+OPERATIONS = ("select", "insert", "update", "delete", "upsert")
+# Filters whose first argument is a column; they make up a query's shape.
+COLUMN_FILTERS = ("eq", "neq", "in_", "ilike", "like", "gt", "gte", "lt", "lte", "is_", "order")
+
+
+class _Query:
+    """
+    Chains like the PostgREST builder it wraps. execute() runs inside a span and
+    is counted, timed and attributed to the current tool by query_stats.
+    """
+
+    def __init__(self, table: str, builder: Any):
+        self._table = table
+        self._builder = builder
+        self._op = "select"
+        self._filters: List[str] = []
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        def chained(*args: Any, **kwargs: Any) -> "_Query":
+            if name in OPERATIONS:
+                self._op = name
+            elif name in COLUMN_FILTERS and args:
+                self._filters.append(f"{name}:{args[0]}")
+            elif name == "or_":
+                self._filters.append("or")
+            self._builder = attr(*args, **kwargs)
+            return self
+
+        return chained
+
+    def execute(self) -> Any:
+        with tracing.span(f"db {self._op} {self._table}", table=self._table, op=self._op) as s:
+            t0 = time.perf_counter()
+            res = self._builder.execute()
+            rows = len(getattr(res, "data", None) or [])
+            if s is not None:
+                s.set(rows=rows, tool=query_stats.current_tool())
+        query_stats.record(self._table, self._op, self._filters, (time.perf_counter() - t0) * 1000, rows)
+        return res
+
+
+class _SnapshotFirst:
+    """
+    Builder for a catalog table while a snapshot is mapped: chains that start
+    with select() run on the snapshot, writes on the live client.
+    """
+
+    def __init__(self, snapshot: Any, live: Any):
+        self._snapshot = snapshot
+        self._live = live
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._live() if name in OPERATIONS and name != "select" else self._snapshot, name)
+
+
+class _Client:
+    def __init__(self, client: Any, snapshot_reads: bool = False):
+        self._client = client
+        self._snapshot_reads = snapshot_reads
+
+    def table(self, name: str) -> _Query:
+        if self._snapshot_reads:
+            from . import catalog_snapshot
+
+            snap = catalog_snapshot.client() if name in catalog_snapshot.TABLES else None
+            if snap is not None:
+                return _Query(name, _SnapshotFirst(snap.table(name), lambda: self._client.table(name)))
+        return _Query(name, self._client.table(name))
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+def _connect() -> Any:
+    if PS_DATA_BACKEND == "sqlite":
+        from .local_db import connect
+
+        return connect()
+    url = os.environ.get("SUPABASE_URL")
+    key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in environment.")
+    from supabase import create_client
+
+    return create_client(url, key)
+
+
 def sb() -> Client:
+    """The shared client; catalog reads come from the mapped snapshot when CATALOG_SNAPSHOT is set."""
     global _sb
     if _sb is None:
-        url = os.environ.get("SUPABASE_URL")
-        key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
-        if not url or not key:
-            raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY in environment.")
-        _sb = create_client(url, key)
+        _sb = _Client(_connect(), snapshot_reads=bool(os.environ.get("CATALOG_SNAPSHOT")))
     return _sb
+
+
+def sb_live() -> Client:
+    """sb() without snapshot reads, for code that must see the live tables (snapshot builds)."""
+    client = sb()
+    return _Client(client._client) if client._snapshot_reads else client
+
+
+def set_client(client: Optional[Client]) -> None:
+    """Make sb() return `client` (e.g. an offline fake for benchmarks); None resets it."""
+    global _sb
+    _sb = _Client(client, snapshot_reads=bool(os.environ.get("CATALOG_SNAPSHOT"))) if client is not None else None
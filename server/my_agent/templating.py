@@ -0,0 +1,145 @@
+"""
+Templated replies for tools whose answer is fully determined by their result.
+
+After check_compatibility, get_cart, estimate_shipping or
+create_checkout_session the agent used to spend one more LLM generation just
+to say "Compatible" or "You have 3 items". With templating on, the
+before_model_callback sees that every function response in the pending model
+call comes from an opted-in tool, renders the reply itself and returns it as
+the model response, ending the agent turn without an LLM call.
+
+Opt-in is per tool: TEMPLATED_TOOLS (comma separated) overrides the default
+set, and an empty value turns templating off.
+"""
+from __future__ import annotations
+
+import os
+from typing import Any, Callable, Dict, Optional
+
+from .metrics import metrics
+
+
+def _money(cents: Any) -> str:
+    return f"${int(cents) / 100:,.2f}" if isinstance(cents, (int, float)) else "n/a"
+
+
+def _corrected(r: Dict[str, Any]) -> str:
+    given = ", ".join(str(v) for v in (r.get("corrected_from") or {}).values())
+    return f" (matched from {given})" if given else ""
+
+
+def _double_check(r: Dict[str, Any]) -> str:
+    options = [str(o) for o in (r.get("did_you_mean") or [])[:3]]
+    if not options:
+        return "Could you double-check it?"
+    listed = ", ".join(options[:-1]) + " or " + options[-1] if len(options) > 1 else options[0]
+    return f"Did you mean {listed}?"
+
+
+def _compatibility(r: Dict[str, Any]) -> Optional[str]:
+    if r.get("status") == "ok":
+        pn = (r.get("part") or {}).get("part_number")
+        mn = (r.get("model") or {}).get("model_number")
+        if r.get("compatible"):
+            return f"Compatible: {pn} fits model {mn}{_corrected(r)}."
+        return f"Not compatible: {pn} does not fit model {mn}{_corrected(r)}."
+    if r.get("reason") == "unknown_part_number":
+        return f"I couldn't find part number {r.get('part_number')}. {_double_check(r)}"
+    if r.get("reason") == "unknown_model_number":
+        return f"I couldn't find model number {r.get('model_number')}. {_double_check(r)}"
+    return None
+
+
+def _cart(r: Dict[str, Any]) -> Optional[str]:
+    if r.get("status") != "ok":
+        return None
+    from .tools import _cart_ui_payload
+
+    return _cart_ui_payload(r)["replace_text"]
+
+
+def _shipping(r: Dict[str, Any]) -> Optional[str]:
+    if r.get("status") == "error" and r.get("error") == "cart is empty":
+        return "Your cart is empty, so there's nothing to ship yet."
+    if r.get("status") != "ok":
+        return None
+    est = r.get("estimate") or {}
+    options = "; ".join(
+        f"{o.get('service')} ({o.get('eta_days')} days) {_money(o.get('cost_cents'))}" for o in est.get("options") or []
+    )
+    return f"Shipping to {est.get('zip_code')}: {options}."
+
+
+def _checkout(r: Dict[str, Any]) -> Optional[str]:
+    if r.get("status") == "error" and r.get("error") == "cart is empty":
+        return "Your cart is empty, so there's nothing to check out yet."
+    if r.get("status") != "ok" or not r.get("checkout_url"):
+        return None
+    return f"Your checkout is ready: {r['checkout_url']}"
+
+
+TEMPLATES: Dict[str, Callable[[Dict[str, Any]], Optional[str]]] = {
+    "check_compatibility": _compatibility,
+    "get_cart": _cart,
+    "estimate_shipping": _shipping,
+    "create_checkout_session": _checkout,
+}
+
+_enabled_env = os.environ.get("TEMPLATED_TOOLS")
+ENABLED_TOOLS = (
+    set(TEMPLATES)
+    if _enabled_env is None
+    else {name.strip() for name in _enabled_env.split(",") if name.strip() in TEMPLATES}
+)
+
+
+def _function_responses(llm_request: Any) -> list:
+    contents = getattr(llm_request, "contents", None) or []
+    if not contents:
+        return []
+    return [p.function_response for p in contents[-1].parts or [] if getattr(p, "function_response", None)]
+
+
+def template_reply(callback_context, llm_request):
+    """
+    before_model_callback for agents whose tools may be templated.
+
+    - Specialists: every pending function response is from an opted-in tool
+      and each renders -> reply with the rendered text.
+    - Coordinator: the only pending response is a specialist whose result is
+      the templated reply it just produced -> pass it through unchanged.
+    """
+    responses = _function_responses(llm_request)
+    if not responses:
+        return None
+    state = callback_context.state
+
+    texts = []
+    for fr in responses:
+        if fr.name not in ENABLED_TOOLS:
+            texts = []
+            break
+        text = TEMPLATES[fr.name](fr.response or {})
+        if not text:
+            texts = []
+            break
+        texts.append(text)
+
+    if not texts and len(responses) == 1:
+        templated = state.get("ps_templated_reply")
+        result = str((responses[0].response or {}).get("result") or "").strip()
+        if templated and result == templated:
+            texts = [templated]
+
+    if not texts:
+        return None
+    reply = " ".join(texts)
+    state["ps_templated_reply"] = reply
+    metrics.incr("templating.llm_calls_saved")
+    for fr in responses:
+        metrics.incr(f"templating.tool.{fr.name}")
+
+    from google.genai import types
+    from google.adk.models import LlmResponse
+
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=reply)]))
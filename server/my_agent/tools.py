@@ -1,15 +1,27 @@
 from __future__ import annotations
 
 import os
-from typing import Any, Dict, Optional
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
 
 from google.adk.tools import ToolContext
 
+from . import catalog_index, history, pricing, shipping
+from .fanout import fan_out
+from .prefetch import prefetcher
 from .supabase_client import sb
+from .ui_channel import ui_channel
+from .write_behind import write_behind
 
 
 DEFAULT_SESSION_ID = os.environ.get("DEFAULT_SESSION_ID", "dev")
 DEFAULT_USER_ID = os.environ.get("DEFAULT_USER_ID", "web_user")
+GUIDE_CACHE_TTL_S = float(os.environ.get("GUIDE_CACHE_TTL_S", "600"))
+GUIDE_CACHE_MAX = int(os.environ.get("GUIDE_CACHE_MAX", "2048"))
+# A prefetched open-cart id is only dropped by a checkout in the same process;
+# serve.py turns this off when another worker could check the cart out.
+PREFETCH_CART = os.environ.get("PREFETCH_CART", "1") != "0"
 
 def _sid(session_id: Optional[str], tool_context: Optional[ToolContext] = None) -> str:
     """
@@ -64,6 +76,20 @@ def _emit_ui(tool_context: Optional[ToolContext], payload: Dict[str, Any]) -> No
         return
     try:
         tool_context.actions.state_delta["ui"] = payload
+        # Parallel specialists overwrite each other's "ui"; the router merges these.
+        tool_context.actions.state_delta[f"ui_{tool_context.agent_name}"] = payload
+    except Exception:
+        pass
+    # Push to the open SSE now instead of waiting for the specialist to finish.
+    sid = _sid(None, tool_context)
+    ui_channel.publish(_uid(None, tool_context=tool_context, session_id=sid), sid, payload)
+
+
+def _remember_zip(tool_context: Optional[ToolContext], zip_code: str) -> None:
+    if tool_context is None or not zip_code:
+        return
+    try:
+        tool_context.actions.state_delta["last_zip_code"] = zip_code
     except Exception:
         pass
 
@@ -113,22 +139,68 @@ def search_products(
     return {"status": "ok", "items": items}
 
 
+def _lookup_one(table: str, columns: str, column: str, value: str) -> Optional[Dict[str, Any]]:
+    res = sb().table(table).select(columns).eq(column, value).limit(1).execute()
+    return res.data[0] if res.data else None
+
+
+def _resolve_miss(
+    kind: str, table: str, columns: str, column: str, value: str, allow_fuzzy: bool = True
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """
+    After an exact lookup missed: re-fetch under the identifier the catalog
+    index resolves `value` to, or return ranked "did you mean" candidates.
+    Without `allow_fuzzy` only a normalization (case, dashes, a missing "PS")
+    is followed; a near-match is offered as a candidate instead.
+    """
+    found = catalog_index.match(kind, value)
+    if found is None:
+        return None, {}
+    candidates = list(found.candidates)
+    if found.resolved and found.resolved != value:
+        corrected = catalog_index.normalize(kind, found.resolved) != catalog_index.normalize(kind, value)
+        if allow_fuzzy or not corrected:
+            row = _lookup_one(table, columns, column, found.resolved)
+            if row is not None:
+                return row, {"corrected_from": {column: value}} if corrected else {}
+        if corrected:
+            candidates.insert(0, found.resolved)
+    if candidates:
+        return None, {"did_you_mean": candidates}
+    return None, {}
+
+
+def _find(
+    kind: str, table: str, columns: str, column: str, value: str, allow_fuzzy: bool = True
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """Exact lookup unless `value` is known to be absent, then _resolve_miss; misses are remembered."""
+    row = None if catalog_index.known_absent(kind, value) else _lookup_one(table, columns, column, value)
+    note: Dict[str, Any] = {}
+    if row is None:
+        row, note = _resolve_miss(kind, table, columns, column, value, allow_fuzzy)
+        if row is None:
+            catalog_index.remember_absent(kind, value)
+    return row, note
+
+
 def get_product_by_part_number(
     part_number: str,
     tool_context: Optional[ToolContext] = None,
 ) -> Dict[str, Any]:
+    return _product_by_part_number(part_number, tool_context)
+
+
+def _product_by_part_number(
+    part_number: str,
+    tool_context: Optional[ToolContext] = None,
+    allow_fuzzy: bool = True,
+) -> Dict[str, Any]:
+    # Cart writes pass allow_fuzzy=False: they must never act on a part the
+    # user didn't name, so a typo comes back as not_found + did_you_mean.
     pn = part_number.strip()
-    res = (
-        sb()
-        .table("products")
-        .select("id,part_number,name,category")
-        .eq("part_number", pn)
-        .limit(1)
-        .execute()
-    )
-    if not res.data:
-        return {"status": "not_found", "part_number": pn}
-    product = res.data[0]
+    product, note = _find("part", "products", "id,part_number,name,category", "part_number", pn, allow_fuzzy)
+    if product is None:
+        return {"status": "not_found", "part_number": pn, **note}
     _remember_part(tool_context, product.get("part_number"))
     _emit_ui(
         tool_context,
@@ -137,7 +209,7 @@ def get_product_by_part_number(
             "product": product,
         },
     )
-    return {"status": "ok", "product": product}
+    return {"status": "ok", "product": product, **note}
 
 
 # ----------------------------
@@ -152,20 +224,24 @@ def check_compatibility(
     pn = part_number.strip()
     mn = model_number.strip()
 
-    prod = sb().table("products").select("id,part_number,name,category").eq("part_number", pn).limit(1).execute()
-    if not prod.data:
-        return {"status": "not_found", "reason": "unknown_part_number", "part_number": pn}
-
-    model = sb().table("appliance_models").select("id,model_number,brand").eq("model_number", mn).limit(1).execute()
-    if not model.data:
-        return {"status": "not_found", "reason": "unknown_model_number", "model_number": mn}
+    found = fan_out(
+        "check_compatibility",
+        prod=lambda: _find("part", "products", "id,part_number,name,category", "part_number", pn),
+        model=lambda: _find("model", "appliance_models", "id,model_number,brand", "model_number", mn),
+    )
+    (part, part_note), (model, model_note) = found["prod"], found["model"]
+    if part is None:
+        return {"status": "not_found", "reason": "unknown_part_number", "part_number": pn, **part_note}
+    if model is None:
+        return {"status": "not_found", "reason": "unknown_model_number", "model_number": mn, **model_note}
+    corrected = {**part_note.get("corrected_from", {}), **model_note.get("corrected_from", {})}
 
     link = (
         sb()
         .table("product_compatibility")
         .select("product_id,model_id")
-        .eq("product_id", prod.data[0]["id"])
-        .eq("model_id", model.data[0]["id"])
+        .eq("product_id", part["id"])
+        .eq("model_id", model["id"])
         .limit(1)
         .execute()
     )
@@ -173,19 +249,27 @@ def check_compatibility(
     result = {
         "status": "ok",
         "compatible": bool(link.data),
-        "part": prod.data[0],
-        "model": model.data[0],
+        "part": part,
+        "model": model,
     }
-    _remember_part(tool_context, prod.data[0].get("part_number"))
+    if corrected:
+        result["corrected_from"] = corrected
+    _remember_part(tool_context, part.get("part_number"))
+    if tool_context is not None:
+        tool_context.actions.state_delta["last_compatibility"] = {
+            "part_number": part["part_number"],
+            "model_number": model["model_number"],
+            "compatible": bool(link.data),
+        }
     _emit_ui(
         tool_context,
         {
             "type": "compatibility",
-            "part_number": prod.data[0]["part_number"],
-            "model_number": model.data[0]["model_number"],
+            "part_number": part["part_number"],
+            "model_number": model["model_number"],
             "compatible": bool(link.data),
-            "part": prod.data[0],
-            "model": model.data[0],
+            "part": part,
+            "model": model,
         },
     )
     return result
@@ -201,29 +285,16 @@ def get_compatible_models(
         return prod
 
     product_id = prod["product"]["id"]
+    note = {"corrected_from": prod["corrected_from"]} if "corrected_from" in prod else {}
 
-    links = (
-        sb()
-        .table("product_compatibility")
-        .select("model_id")
-        .eq("product_id", product_id)
-        .limit(limit)
-        .execute()
-    )
-
-    model_ids = [r["model_id"] for r in (links.data or [])]
-    if not model_ids:
-        return {"status": "ok", "part": prod["product"], "models": []}
-
-    models = (
-        sb()
-        .table("appliance_models")
-        .select("model_number,brand")
-        .in_("id", model_ids)
-        .execute()
-    )
+    hit, models_list = (False, None)
+    if tool_context is not None:
+        hit, models_list = prefetcher.take(_sid(None, tool_context), ("models", product_id, limit))
+    if not hit:
+        models_list = _models_for(product_id, limit)
+    if not models_list:
+        return {"status": "ok", "part": prod["product"], "models": [], **note}
 
-    models_list = models.data or []
     _emit_ui(
         tool_context,
         {
@@ -232,7 +303,7 @@ def get_compatible_models(
             "models": models_list,
         },
     )
-    return {"status": "ok", "part": prod["product"], "models": models_list}
+    return {"status": "ok", "part": prod["product"], "models": models_list, **note}
 
 
 def get_compatible_parts(
@@ -242,19 +313,11 @@ def get_compatible_parts(
 ) -> Dict[str, Any]:
     mn = model_number.strip()
 
-    model = (
-        sb()
-        .table("appliance_models")
-        .select("id,model_number,brand")
-        .eq("model_number", mn)
-        .limit(1)
-        .execute()
-    )
-
-    if not model.data:
-        return {"status": "not_found", "reason": "unknown_model_number", "model_number": mn}
+    model, note = _find("model", "appliance_models", "id,model_number,brand", "model_number", mn)
+    if model is None:
+        return {"status": "not_found", "reason": "unknown_model_number", "model_number": mn, **note}
 
-    model_id = model.data[0]["id"]
+    model_id = model["id"]
 
     links = (
         sb()
@@ -267,7 +330,7 @@ def get_compatible_parts(
 
     product_ids = [r["product_id"] for r in (links.data or [])]
     if not product_ids:
-        return {"status": "ok", "model": model.data[0], "parts": []}
+        return {"status": "ok", "model": model, "parts": [], **note}
 
     parts = (
         sb()
@@ -282,12 +345,12 @@ def get_compatible_parts(
         tool_context,
         {
             "type": "compatibility",
-            "model": model.data[0],
-            "model_number": model.data[0].get("model_number"),
+            "model": model,
+            "model_number": model.get("model_number"),
             "items": parts_list,
         },
     )
-    return {"status": "ok", "model": model.data[0], "parts": parts_list}
+    return {"status": "ok", "model": model, "parts": parts_list, **note}
 
 
 def find_compatible_parts_by_keyword(
@@ -335,6 +398,113 @@ def find_compatible_parts_by_keyword(
     }
 
 
+# ----------------------------
+# Prefetch
+# ----------------------------
+
+# product_id -> (loaded_at, guides); filled by lookups and by the startup warm-up.
+_guide_cache: Dict[str, Tuple[float, list]] = {}
+_guide_cache_lock = threading.Lock()
+
+
+def _cache_guides(product_id: str, guides: list, now: float) -> None:
+    with _guide_cache_lock:
+        _guide_cache.pop(product_id, None)
+        _guide_cache[product_id] = (now, guides)
+        while len(_guide_cache) > GUIDE_CACHE_MAX:
+            _guide_cache.pop(next(iter(_guide_cache)))
+
+
+def _guides_for(product_id: str) -> list:
+    cached = _guide_cache.get(product_id)
+    if cached is not None and time.monotonic() - cached[0] <= GUIDE_CACHE_TTL_S:
+        return list(cached[1])
+    res = (
+        sb()
+        .table("installation_guides")
+        .select("id,title,steps,product_id")
+        .eq("product_id", product_id)
+        .limit(5)
+        .execute()
+    )
+    _cache_guides(product_id, res.data or [], time.monotonic())
+    return list(res.data or [])
+
+
+def warm_guides(product_ids: list) -> None:
+    """Load the guides of several products with one query."""
+    if not product_ids:
+        return
+    res = (
+        sb()
+        .table("installation_guides")
+        .select("id,title,steps,product_id")
+        .in_("product_id", product_ids)
+        .execute()
+    )
+    by_product: Dict[str, list] = {pid: [] for pid in product_ids}
+    for g in res.data or []:
+        if len(by_product.setdefault(g["product_id"], [])) < 5:
+            by_product[g["product_id"]].append(g)
+    now = time.monotonic()
+    for pid, guides in by_product.items():
+        _cache_guides(pid, guides, now)
+
+
+def _models_for(product_id: str, limit: int) -> list:
+    links = (
+        sb()
+        .table("product_compatibility")
+        .select("model_id")
+        .eq("product_id", product_id)
+        .limit(limit)
+        .execute()
+    )
+    model_ids = [r["model_id"] for r in (links.data or [])]
+    if not model_ids:
+        return []
+    models = (
+        sb()
+        .table("appliance_models")
+        .select("model_number,brand")
+        .in_("id", model_ids)
+        .execute()
+    )
+    return models.data or []
+
+
+def _open_cart_id(session_id: str) -> Optional[str]:
+    existing = (
+        sb()
+        .table("carts")
+        .select("id,status,session_id")
+        .eq("session_id", session_id)
+        .eq("status", "open")
+        .limit(1)
+        .execute()
+    )
+    return existing.data[0]["id"] if existing.data else None
+
+
+def prefetch_next(tool, args, tool_context, tool_response):
+    """
+    after_tool_callback: start loading what usually comes next. A product
+    lookup is followed by install steps or compatible models, a fit check by
+    adding to the cart. Never changes the tool response.
+    """
+    if not isinstance(tool_response, dict) or tool_response.get("status") != "ok":
+        return None
+    sid = _sid(None, tool_context)
+    prefetcher.touch(sid)
+    if tool.name == "get_product_by_part_number":
+        product_id = tool_response["product"]["id"]
+        prefetcher.schedule(sid, ("guides", product_id), lambda: _guides_for(product_id))
+        prefetcher.schedule(sid, ("models", product_id, 50), lambda: _models_for(product_id, 50))
+    elif tool.name == "check_compatibility" and tool_response.get("compatible") and PREFETCH_CART:
+        prefetcher.schedule(sid, ("cart",), lambda: _open_cart_id(sid))
+    return None
+
+
 # ----------------------------
 # Installation guides
 # ----------------------------
@@ -366,16 +536,14 @@ def get_installation_guide(
     prod = get_product_by_part_number(pn, tool_context=tool_context)
     if prod["status"] != "ok":
         return prod
+    note = {"corrected_from": prod["corrected_from"]} if "corrected_from" in prod else {}
 
-    guides = (
-        sb()
-        .table("installation_guides")
-        .select("id,title,steps,product_id")
-        .eq("product_id", prod["product"]["id"])
-        .limit(5)
-        .execute()
-    )
-    if not guides.data:
+    hit, guides_list = (False, None)
+    if tool_context is not None:
+        hit, guides_list = prefetcher.take(_sid(None, tool_context), ("guides", prod["product"]["id"]))
+    if not hit:
+        guides_list = _guides_for(prod["product"]["id"])
+    if not guides_list:
         _emit_ui(
             tool_context,
             {
@@ -385,19 +553,18 @@ def get_installation_guide(
                 "replace_text": f"I couldn't find an installation guide for {part_number.strip()}.",
             },
         )
-        return {"status": "not_found", "reason": "no_installation_guide", "part_number": pn}
+        return {"status": "not_found", "reason": "no_installation_guide", "part_number": pn, **note}
 
-    guides_list = guides.data
     _emit_ui(
         tool_context,
         {
             "type": "installation_guides",
             "part": prod["product"],
             "guides": guides_list,
-            "replace_text": f"Here is the installation guide for {pn}.",
+            "replace_text": f"Here is the installation guide for {prod['product']['part_number']}.",
         },
     )
-    return {"status": "ok", "part": prod["product"], "guides": guides_list}
+    return {"status": "ok", "part": prod["product"], "guides": guides_list, **note}
 
 
 # ----------------------------
@@ -419,34 +586,45 @@ def _cart_ui_payload(cart_state: Dict[str, Any]) -> Dict[str, Any]:
                 "category": p.get("category"),
                 "quantity": qty,
                 "unit_price_cents": it.get("unit_price_cents"),
+                "line_total_cents": it.get("line_total_cents"),
             }
         )
+    totals = cart_state.get("totals") or {}
     replace_text = (
         "Your cart is empty."
         if total_qty == 0
         else f"You have {total_qty} item{'s' if total_qty != 1 else ''} in your cart."
     )
+    if total_qty and totals.get("subtotal_cents") and not totals.get("unpriced_items"):
+        replace_text += f" Subtotal: ${totals['subtotal_cents'] / 100:,.2f}."
     return {
         "type": "cart",
         "cart_id": cart_state.get("cart_id"),
         "items": items,
+        "totals": totals,
         "replace_text": replace_text,
     }
 
+def _cart_and_product(session_id: str, part_number: str, tool_context: Optional[ToolContext]) -> Dict[str, Any]:
+    # The open-cart lookup and the product lookup don't depend on each other.
+    return fan_out(
+        "cart_and_product",
+        cart=lambda: create_or_get_cart(session_id, tool_context=tool_context),
+        prod=lambda: _product_by_part_number(part_number, allow_fuzzy=False),
+    )
+
+
 def create_or_get_cart(session_id: str, tool_context: Optional[ToolContext] = None) -> Dict[str, Any]:
     sid = _sid(session_id, tool_context)
 
-    existing = (
-        sb()
-        .table("carts")
-        .select("id,status,session_id")
-        .eq("session_id", sid)
-        .eq("status", "open")
-        .limit(1)
-        .execute()
-    )
-    if existing.data:
-        return {"status": "ok", "cart_id": existing.data[0]["id"], "created": False, "session_id": sid}
+    hit, cart_id = (False, None)
+    if tool_context is not None:
+        # Served once: the cart may be checked out or created after this.
+        hit, cart_id = prefetcher.take(sid, ("cart",), keep=False)
+    if not hit:
+        cart_id = _open_cart_id(sid)
+    if cart_id is not None:
+        return {"status": "ok", "cart_id": cart_id, "created": False, "session_id": sid}
 
     created = sb().table("carts").insert({"session_id": sid, "status": "open"}).execute()
     return {"status": "ok", "cart_id": created.data[0]["id"], "created": True, "session_id": sid}
@@ -462,12 +640,12 @@ def add_to_cart(
     INCREMENT behavior: adds `quantity` more units to cart.
     """
     session_id = _sid(session_id, tool_context)
-    cart = create_or_get_cart(session_id, tool_context=tool_context)
+    found = _cart_and_product(session_id, part_number, tool_context)
+    cart, prod = found["cart"], found["prod"]
     if cart["status"] != "ok":
         return cart
     cart_id = cart["cart_id"]
 
-    prod = get_product_by_part_number(part_number)
     if prod["status"] != "ok":
         return prod
     product = prod["product"]
@@ -495,16 +673,14 @@ def add_to_cart(
             "action": "incremented",
             "item": {"part_number": product["part_number"], "name": product["name"], "quantity": upd.data[0]["quantity"]},
         }
-        cart_state = get_cart(session_id, tool_context=tool_context)
-        if cart_state.get("status") == "ok":
-            _emit_ui(tool_context, _cart_ui_payload(cart_state))
+        get_cart(session_id, tool_context=tool_context)
         return result
 
     ins = sb().table("cart_items").insert({
         "cart_id": cart_id,
         "product_id": product["id"],
         "quantity": qty,
-        "unit_price_cents": None,
+        "unit_price_cents": pricing.unit_price(product["id"]),
     }).execute()
 
     result = {
@@ -513,9 +689,7 @@ def add_to_cart(
         "action": "inserted",
         "item": {"part_number": product["part_number"], "name": product["name"], "quantity": ins.data[0]["quantity"]},
     }
-    cart_state = get_cart(session_id, tool_context=tool_context)
-    if cart_state.get("status") == "ok":
-        _emit_ui(tool_context, _cart_ui_payload(cart_state))
+    get_cart(session_id, tool_context=tool_context)
     return result
 
 
@@ -529,12 +703,12 @@ def set_cart_item_quantity(
     SET behavior: sets absolute quantity (must be > 0).
     """
     session_id = _sid(session_id, tool_context)
-    cart = create_or_get_cart(session_id, tool_context=tool_context)
+    found = _cart_and_product(session_id, part_number, tool_context)
+    cart, prod = found["cart"], found["prod"]
     if cart["status"] != "ok":
         return cart
     cart_id = cart["cart_id"]
 
-    prod = get_product_by_part_number(part_number)
     if prod["status"] != "ok":
         return prod
     product = prod["product"]
@@ -561,16 +735,14 @@ def set_cart_item_quantity(
             "action": "set_quantity",
             "item": {"part_number": product["part_number"], "name": product["name"], "quantity": upd.data[0]["quantity"]},
         }
-        cart_state = get_cart(session_id, tool_context=tool_context)
-        if cart_state.get("status") == "ok":
-            _emit_ui(tool_context, _cart_ui_payload(cart_state))
+        get_cart(session_id, tool_context=tool_context)
         return result
 
     ins = sb().table("cart_items").insert({
         "cart_id": cart_id,
         "product_id": product["id"],
         "quantity": qty,
-        "unit_price_cents": None,
+        "unit_price_cents": pricing.unit_price(product["id"]),
     }).execute()
 
     result = {
@@ -579,9 +751,7 @@ def set_cart_item_quantity(
         "action": "inserted_with_quantity",
         "item": {"part_number": product["part_number"], "name": product["name"], "quantity": ins.data[0]["quantity"]},
     }
-    cart_state = get_cart(session_id, tool_context=tool_context)
-    if cart_state.get("status") == "ok":
-        _emit_ui(tool_context, _cart_ui_payload(cart_state))
+    get_cart(session_id, tool_context=tool_context)
     return result
 
 
@@ -594,12 +764,12 @@ def remove_from_cart(
     Remove item entirely (delete row). This is the correct "set to 0" behavior.
     """
     session_id = _sid(session_id, tool_context)
-    cart = create_or_get_cart(session_id, tool_context=tool_context)
+    found = _cart_and_product(session_id, part_number, tool_context)
+    cart, prod = found["cart"], found["prod"]
     if cart["status"] != "ok":
         return cart
     cart_id = cart["cart_id"]
 
-    prod = get_product_by_part_number(part_number)
     if prod["status"] != "ok":
         return prod
     product = prod["product"]
@@ -615,16 +785,12 @@ def remove_from_cart(
     )
     if not cur.data:
         result = {"status": "ok", "cart_id": cart_id, "action": "no_op", "message": "Item not in cart."}
-        cart_state = get_cart(session_id, tool_context=tool_context)
-        if cart_state.get("status") == "ok":
-            _emit_ui(tool_context, _cart_ui_payload(cart_state))
+        get_cart(session_id, tool_context=tool_context)
         return result
 
     sb().table("cart_items").delete().eq("id", cur.data[0]["id"]).execute()
     result = {"status": "ok", "cart_id": cart_id, "action": "removed", "item": {"part_number": product["part_number"], "name": product["name"]}}
-    cart_state = get_cart(session_id, tool_context=tool_context)
-    if cart_state.get("status") == "ok":
-        _emit_ui(tool_context, _cart_ui_payload(cart_state))
+    get_cart(session_id, tool_context=tool_context)
     return result
 
 
@@ -638,12 +804,12 @@ def decrement_cart_item(
     Remove `quantity` units. If result <= 0, delete row.
     """
     session_id = _sid(session_id, tool_context)
-    cart = create_or_get_cart(session_id, tool_context=tool_context)
+    found = _cart_and_product(session_id, part_number, tool_context)
+    cart, prod = found["cart"], found["prod"]
     if cart["status"] != "ok":
         return cart
     cart_id = cart["cart_id"]
 
-    prod = get_product_by_part_number(part_number)
     if prod["status"] != "ok":
         return prod
     product = prod["product"]
@@ -663,9 +829,7 @@ def decrement_cart_item(
     )
     if not cur.data:
         result = {"status": "ok", "cart_id": cart_id, "action": "no_op", "message": "Item not in cart."}
-        cart_state = get_cart(session_id, tool_context=tool_context)
-        if cart_state.get("status") == "ok":
-            _emit_ui(tool_context, _cart_ui_payload(cart_state))
+        get_cart(session_id, tool_context=tool_context)
         return result
 
     current_qty = int(cur.data[0]["quantity"])
@@ -674,16 +838,12 @@ def decrement_cart_item(
     if new_qty <= 0:
         sb().table("cart_items").delete().eq("id", cur.data[0]["id"]).execute()
         result = {"status": "ok", "cart_id": cart_id, "action": "removed", "item": {"part_number": product["part_number"], "name": product["name"]}}
-        cart_state = get_cart(session_id, tool_context=tool_context)
-        if cart_state.get("status") == "ok":
-            _emit_ui(tool_context, _cart_ui_payload(cart_state))
+        get_cart(session_id, tool_context=tool_context)
         return result
 
     upd = sb().table("cart_items").update({"quantity": new_qty}).eq("id", cur.data[0]["id"]).execute()
     result = {"status": "ok", "cart_id": cart_id, "action": "decremented", "item": {"part_number": product["part_number"], "name": product["name"], "quantity": upd.data[0]["quantity"]}}
-    cart_state = get_cart(session_id, tool_context=tool_context)
-    if cart_state.get("status") == "ok":
-        _emit_ui(tool_context, _cart_ui_payload(cart_state))
+    get_cart(session_id, tool_context=tool_context)
     return result
 
 
@@ -713,12 +873,23 @@ def get_cart(session_id: str, tool_context: Optional[ToolContext] = None) -> Dic
     for it in (items.data or []):
         p = products_by_id.get(it["product_id"], {})
         hydrated.append({
+            "product_id": it["product_id"],
             "quantity": it["quantity"],
             "unit_price_cents": it.get("unit_price_cents"),
             "product": p,
         })
 
-    result = {"status": "ok", "cart_id": cart_id, "items": hydrated}
+    # Prices come from the in-process price list, so this adds no per-line queries.
+    zip_code = ""
+    if tool_context is not None:
+        zip_code = str(tool_context.state.get("last_zip_code") or "")
+    totals = pricing.cart_totals(cart_id, hydrated, zip_code)
+
+    result = {"status": "ok", "cart_id": cart_id, "items": hydrated, "totals": totals}
+    if tool_context is not None:
+        tool_context.actions.state_delta["cart_id"] = cart_id
+    # The cart mutators call get_cart afterwards for exactly this card; they
+    # don't emit it again (each emit is also a post to the UI channel).
     _emit_ui(tool_context, _cart_ui_payload(result))
     return result
 
@@ -729,26 +900,33 @@ def estimate_shipping(
     tool_context: Optional[ToolContext] = None,
 ) -> Dict[str, Any]:
     session_id = _sid(session_id, tool_context)
-    cart_state = get_cart(session_id, tool_context=tool_context)
-    if cart_state["status"] != "ok":
-        return cart_state
+    cart = create_or_get_cart(session_id, tool_context=tool_context)
+    if cart["status"] != "ok":
+        return cart
+    cart_id = cart["cart_id"]
 
-    cart_id = cart_state["cart_id"]
-    total_qty = sum(int(i["quantity"]) for i in cart_state["items"])
-    if total_qty == 0:
+    # Only (product_id, quantity) matter for shipping; no product hydration needed.
+    lines = (
+        sb()
+        .table("cart_items")
+        .select("product_id,quantity")
+        .eq("cart_id", cart_id)
+        .execute()
+    )
+    version = shipping.cart_version(lines.data or [])
+    if sum(qty for _, qty in version) == 0:
         return {"status": "error", "error": "cart is empty", "cart_id": cart_id}
 
-    options = [
-        {"service": "Standard", "eta_days": "4-7", "cost_cents": 799 + 50 * total_qty},
-        {"service": "Expedited", "eta_days": "2-3", "cost_cents": 1499 + 75 * total_qty},
-    ]
-    estimate = {"zip_code": zip_code.strip(), "total_items": total_qty, "options": options}
+    zc = zip_code.strip()
+    estimate = shipping.estimate(cart_id, version, zc)
+    _remember_zip(tool_context, zc)
 
-    sb().table("shipping_estimates").insert({
+    # Audit trail only; never block the answer on it.
+    write_behind.insert("shipping_estimates", {
         "cart_id": cart_id,
-        "zip_code": zip_code.strip(),
+        "zip_code": zc,
         "estimate_json": estimate,
-    }).execute()
+    })
 
     result = {"status": "ok", "cart_id": cart_id, "estimate": estimate}
     _emit_ui(
@@ -784,7 +962,7 @@ def create_checkout_session(
     session_uuid = created.data[0]["id"]
     checkout_url = f"{base_url}/checkout?session={session_uuid}"
 
-    sb().table("checkout_sessions").update({"checkout_url": checkout_url, "status": "handed_off"}).eq("id", session_uuid).execute()
+    write_behind.update("checkout_sessions", {"checkout_url": checkout_url, "status": "handed_off"}, {"id": session_uuid})
     # Create order + order items snapshot for history
     order = (
         sb()
@@ -801,25 +979,36 @@ def create_checkout_session(
     )
     order_id = order.data[0]["id"]
 
-    items = cart_state.get("items") or []
-    if items:
-        order_items = []
-        for it in items:
-            p = it.get("product") or {}
-            order_items.append(
-                {
-                    "order_id": order_id,
-                    "product_id": p.get("id"),
-                    "part_number": p.get("part_number") or "",
-                    "name": p.get("name") or "",
-                    "quantity": int(it.get("quantity") or 0),
-                    "unit_price_cents": it.get("unit_price_cents"),
-                }
-            )
-        sb().table("order_items").insert(order_items).execute()
+    # The snapshot is only read by order history, so it can trail the checkout link.
+    # get_cart priced every line from the current price list; that is the price we snapshot.
+    for it in cart_state.get("items") or []:
+        p = it.get("product") or {}
+        write_behind.insert(
+            "order_items",
+            {
+                "order_id": order_id,
+                "product_id": p.get("id"),
+                "part_number": p.get("part_number") or "",
+                "name": p.get("name") or "",
+                "quantity": int(it.get("quantity") or 0),
+                "unit_price_cents": it.get("unit_price_cents"),
+            },
+        )
+    # The history views read this denormalized summary; it must land before we answer.
+    history.record_order(
+        history.summary_row(
+            order=order.data[0],
+            user_id=user_id,
+            session_id=session_id,
+            checkout_url=checkout_url,
+            checkout_status="handed_off",
+            items=cart_state.get("items") or [],
+        )
+    )
     # Finalize cart: mark it non-open and clear items so a new cart starts empty.
     sb().table("cart_items").delete().eq("cart_id", cart_id).execute()
     sb().table("carts").update({"status": "finalized"}).eq("id", cart_id).execute()
+    prefetcher.forget(session_id, ("cart",))
 
     result = {
         "status": "ok",
@@ -853,34 +1042,7 @@ def list_checkout_history(
     limit = max(1, min(int(limit), 50))
     offset = max(0, int(offset))
 
-    carts = (
-        sb()
-        .table("carts")
-        .select("id")
-        .eq("session_id", session_id)
-        .execute()
-    )
-    cart_ids = [c["id"] for c in (carts.data or [])]
-    if not cart_ids:
-        return {
-            "status": "ok",
-            "items": [],
-            "limit": limit,
-            "offset": offset,
-            "next_offset": offset,
-            "has_more": False,
-        }
-
-    res = (
-        sb()
-        .table("checkout_sessions")
-        .select("id,cart_id,status,checkout_url,created_at")
-        .in_("cart_id", cart_ids)
-        .order("created_at", desc=True)
-        .range(offset, offset + limit - 1)
-        .execute()
-    )
-    items = res.data or []
+    items = history.checkout_page(session_id, limit, offset)
     return {
         "status": "ok",
         "items": items,
@@ -905,39 +1067,7 @@ def list_order_history(
     limit = max(1, min(int(limit), 50))
     offset = max(0, int(offset))
 
-    orders_res = (
-        sb()
-        .table("orders")
-        .select("id,cart_id,checkout_session_id,status,created_at")
-        .eq("user_id", uid)
-        .order("created_at", desc=True)
-        .range(offset, offset + limit - 1)
-        .execute()
-    )
-    orders = orders_res.data or []
-    order_ids = [o["id"] for o in orders]
-
-    items_by_order: Dict[str, list[Dict[str, Any]]] = {}
-    if order_ids:
-        items_res = (
-            sb()
-            .table("order_items")
-            .select("order_id,part_number,name,quantity,unit_price_cents")
-            .in_("order_id", order_ids)
-            .execute()
-        )
-        for item in items_res.data or []:
-            items_by_order.setdefault(item["order_id"], []).append(item)
-
-    hydrated = []
-    for order in orders:
-        hydrated.append(
-            {
-                **order,
-                "items": items_by_order.get(order["id"], []),
-            }
-        )
-
+    hydrated = history.order_page(uid, limit, offset)
     result = {
         "status": "ok",
         "user_id": uid,
@@ -947,13 +1077,14 @@ def list_order_history(
         "next_offset": offset + len(hydrated),
         "has_more": len(hydrated) == limit,
     }
+
     _emit_ui(
         tool_context,
         {
             "type": "order_history",
-            "orders": hydrated,
+            "orders": result["items"],
             "offset": offset,
-            "has_more": len(hydrated) == limit,
+            "has_more": result["has_more"],
         },
     )
     return result
@@ -972,23 +1103,26 @@ def list_products(
 
     if cat in ("", "all", "both", "any", "all categories", "refrigerator and dishwasher", "dishwasher and refrigerator", "refrigerator/dishwasher", "dishwasher/refrigerator"):
         per_cat = max(1, (limit + 1) // 2)
-        fr = (
-            sb()
-            .table("products")
-            .select("id,part_number,name,category")
-            .eq("category", "refrigerator")
-            .limit(per_cat)
-            .execute()
-        )
-        dw = (
-            sb()
-            .table("products")
-            .select("id,part_number,name,category")
-            .eq("category", "dishwasher")
-            .limit(per_cat)
-            .execute()
+        both = fan_out(
+            "list_products",
+            fr=lambda: (
+                sb()
+                .table("products")
+                .select("id,part_number,name,category")
+                .eq("category", "refrigerator")
+                .limit(per_cat)
+                .execute()
+            ),
+            dw=lambda: (
+                sb()
+                .table("products")
+                .select("id,part_number,name,category")
+                .eq("category", "dishwasher")
+                .limit(per_cat)
+                .execute()
+            ),
         )
-        items = (fr.data or []) + (dw.data or [])
+        items = (both["fr"].data or []) + (both["dw"].data or [])
         payload = {
             "status": "ok",
             "items": items[:limit],
@@ -0,0 +1,302 @@
+"""
+Lightweight span tracing: proxy -> agents -> tools -> PostgREST calls.
+
+A trace starts in main.py, which passes a W3C-style traceparent to the agent
+process in state_delta["ps_traceparent"]. On the ADK side, callbacks open
+spans for each agent run, model call and tool call, and the instrumented
+Supabase client (supabase_client.sb) opens one per execute(). The current
+span lives in a contextvar, so nested AgentTool runs, parallel tool calls and
+fan_out workers all parent correctly.
+
+Sampling is decided once per trace (TRACE_SAMPLE_RATE, default 5%); an
+unsampled trace creates no span objects at all. Finished spans are written by
+a background thread as OTLP-shaped JSON lines to TRACE_FILE.
+"""
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.05"))
+TRACE_FILE = os.environ.get(
+    "TRACE_FILE", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".traces", "spans.jsonl")
+)
+TRACE_FILE_MAX_BYTES = int(os.environ.get("TRACE_FILE_MAX_MB", "50")) * 1024 * 1024
+TRACE_SERVICE = os.environ.get("TRACE_SERVICE", "partselect-agent")
+TRACEPARENT_KEY = "ps_traceparent"
+
+# (trace_id, span_id, sampled) of the innermost open span in this context.
+SpanContext = Tuple[str, str, bool]
+_current: ContextVar[Optional[SpanContext]] = ContextVar("ps_trace_current", default=None)
+
+
+def _hex(nbytes: int) -> str:
+    return random.getrandbits(nbytes * 8).to_bytes(nbytes, "big").hex()
+
+
+def format_traceparent(ctx: SpanContext) -> str:
+    trace_id, span_id, sampled = ctx
+    return f"00-{trace_id}-{span_id}-{'01' if sampled else '00'}"
+
+
+def parse_traceparent(value: Any) -> Optional[SpanContext]:
+    if not isinstance(value, str):
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2], parts[3] == "01"
+
+
+def current() -> Optional[SpanContext]:
+    return _current.get()
+
+
+def current_traceparent() -> Optional[str]:
+    ctx = _current.get()
+    return format_traceparent(ctx) if ctx else None
+
+
+class JsonlExporter:
+    """Appends finished spans to a JSONL file from a daemon thread."""
+
+    def __init__(self, path: str = TRACE_FILE, max_bytes: int = TRACE_FILE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Dict[str, Any]) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass
+
+    def flush(self, timeout_s: float = 2.0) -> None:
+        deadline = time.monotonic() + timeout_s
+        while self._thread is not None and not self._queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _run(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    for span in batch:
+                        f.write(json.dumps(span, default=str) + "\n")
+            except OSError as e:
+                logger.warning("trace export failed: %s", e)
+
+
+exporter = JsonlExporter()
+atexit.register(exporter.flush)
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "attributes", "error", "_ended")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = _hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.attributes = {k: v for k, v in attributes.items() if v is not None}
+        self.error: Optional[str] = None
+        self._ended = False
+
+    @property
+    def context(self) -> SpanContext:
+        return self.trace_id, self.span_id, True
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    def fail(self, error: Any) -> None:
+        self.error = str(error)[:300]
+
+    def end(self) -> None:
+        if self._ended:
+            return
+        self._ended = True
+        exporter.export(
+            {
+                "service": TRACE_SERVICE,
+                "traceId": self.trace_id,
+                "spanId": self.span_id,
+                "parentSpanId": self.parent_id,
+                "name": self.name,
+                "startTimeUnixNano": self.start_ns,
+                "endTimeUnixNano": time.time_ns(),
+                "attributes": self.attributes,
+                "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"},
+            }
+        )
+
+
+def start_span(name: str, parent: Optional[SpanContext] = None, **attributes: Any) -> Tuple[Optional[Span], SpanContext]:
+    """
+    Open a span under `parent` (default: the current one; a new sampled-or-not
+    trace if there is none). Returns (span or None if unsampled, context to
+    make current). The caller ends the span.
+    """
+    parent = parent or _current.get()
+    if parent is None:
+        trace_id, parent_id, sampled = _hex(16), None, random.random() < TRACE_SAMPLE_RATE
+    else:
+        trace_id, parent_id, sampled = parent
+    if not sampled:
+        return None, (trace_id, parent_id or _hex(8), False)
+    span = Span(name, trace_id, parent_id, attributes)
+    return span, span.context
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """`with span("x", k=v) as s:` -- s is None when the trace is not sampled."""
+    s, ctx = start_span(name, **attributes)
+    token = _current.set(ctx)
+    try:
+        yield s
+    except BaseException as e:
+        if s is not None:
+            s.fail(repr(e))
+        raise
+    finally:
+        _current.reset(token)
+        if s is not None:
+            s.end()
+
+
+# ----------------------------
+# ADK callbacks
+# ----------------------------
+# Spans that open in a before_* callback and close in the matching after_*.
+_open: Dict[Tuple[str, ...], Tuple[Optional[Span], Optional[SpanContext]]] = {}
+_open_lock = threading.Lock()
+_MAX_OPEN = 4096
+
+
+def _begin(key: Tuple[str, ...], name: str, parent: Optional[SpanContext], **attributes: Any) -> None:
+    previous = _current.get()
+    s, ctx = start_span(name, parent=parent or previous, **attributes)
+    _current.set(ctx)
+    with _open_lock:
+        _open[key] = (s, previous)
+        # Runs that died between before_* and after_* never close; drop the oldest.
+        while len(_open) > _MAX_OPEN:
+            _open.pop(next(iter(_open)))
+
+
+def _finish(key: Tuple[str, ...], error: Any = None, **attributes: Any) -> None:
+    with _open_lock:
+        hit = _open.pop(key, None)
+    if hit is None:
+        return
+    s, previous = hit
+    _current.set(previous)
+    if s is not None:
+        s.set(**attributes)
+        if error:
+            s.fail(error)
+        s.end()
+
+
+def _state_get(ctx: Any, key: str) -> Any:
+    try:
+        return ctx.state.get(key)
+    except Exception:
+        return None
+
+
+def begin_agent(callback_context):
+    """before_agent_callback: a span per agent run, parented on the proxy's trace."""
+    parent = _current.get() or parse_traceparent(_state_get(callback_context, TRACEPARENT_KEY))
+    _begin(
+        ("agent", callback_context.invocation_id, callback_context.agent_name),
+        f"agent {callback_context.agent_name}",
+        parent,
+        agent=callback_context.agent_name,
+        session_id=_state_get(callback_context, "ps_session_id"),
+    )
+    return None
+
+
+def end_agent(callback_context):
+    _finish(("agent", callback_context.invocation_id, callback_context.agent_name))
+    return None
+
+
+def begin_model(callback_context, llm_request):
+    """before_model_callback, after the ones that short-circuit so only real LLM calls get a span."""
+    _begin(
+        ("model", callback_context.invocation_id, callback_context.agent_name),
+        "llm call",
+        None,
+        agent=callback_context.agent_name,
+        model=getattr(llm_request, "model", None),
+    )
+    return None
+
+
+def end_model(callback_context, llm_response):
+    if getattr(llm_response, "partial", False):
+        return None
+    usage = getattr(llm_response, "usage_metadata", None)
+    _finish(
+        ("model", callback_context.invocation_id, callback_context.agent_name),
+        error=getattr(llm_response, "error_message", None),
+        input_tokens=getattr(usage, "prompt_token_count", None),
+        output_tokens=getattr(usage, "candidates_token_count", None),
+        cached_tokens=getattr(usage, "cached_content_token_count", None),
+    )
+    return None
+
+
+def _tool_key(tool, tool_context) -> Tuple[str, ...]:
+    call_id = getattr(tool_context, "function_call_id", None) or id(tool_context)
+    return ("tool", str(call_id), getattr(tool, "name", "?"))
+
+
+def begin_tool(tool, args, tool_context):
+    _begin(
+        _tool_key(tool, tool_context),
+        f"tool {getattr(tool, 'name', '?')}",
+        None,
+        tool=getattr(tool, "name", None),
+        agent=getattr(tool_context, "agent_name", None),
+        session_id=_state_get(tool_context, "ps_session_id"),
+    )
+    return None
+
+
+def end_tool(tool, args, tool_context, tool_response):
+    status = tool_response.get("status") if isinstance(tool_response, dict) else None
+    error = tool_response.get("error") if status == "error" else None
+    _finish(_tool_key(tool, tool_context), error=error, status=status)
+    return None
@@ -0,0 +1,123 @@
+"""
+Out-of-band channel for UI payloads.
+
+ADK only emits a tool's state_delta["ui"] once the event carrying it is
+yielded, which for AgentTool specialists is after the specialist (and often
+the coordinator) has finished generating. `publish` hands the payload to a
+background thread that POSTs it to the proxy (main.py, /internal/ui), which
+injects it into the open /agent/stream SSE for that session right away. The
+regular stateDelta event still arrives later, so this path is best effort:
+a full queue or an unreachable proxy just drops the early copy.
+
+The endpoint only accepts posts carrying the channel token: UI_CHANNEL_TOKEN
+when it is set, otherwise a random one main.py writes to
+UI_CHANNEL_TOKEN_FILE (mode 0600) at startup and the agent reads back.
+
+UI_CHANNEL_URL= (empty) disables it.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import secrets
+import threading
+from typing import Any, Dict, Optional
+
+from .metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+UI_CHANNEL_URL = os.environ.get("UI_CHANNEL_URL", "http://127.0.0.1:8001/internal/ui")
+UI_CHANNEL_TOKEN = os.environ.get("UI_CHANNEL_TOKEN", "")
+UI_CHANNEL_TOKEN_FILE = os.environ.get(
+    "UI_CHANNEL_TOKEN_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".local", "ui_channel.token"),
+)
+UI_CHANNEL_TIMEOUT_S = float(os.environ.get("UI_CHANNEL_TIMEOUT_S", "1.0"))
+UI_CHANNEL_MAX_PENDING = int(os.environ.get("UI_CHANNEL_MAX_PENDING", "256"))
+
+
+def channel_token(create: bool = False) -> str:
+    """
+    The shared channel token: UI_CHANNEL_TOKEN, else the one in
+    UI_CHANNEL_TOKEN_FILE. With `create` (main.py) a missing file is generated.
+    """
+    if UI_CHANNEL_TOKEN:
+        return UI_CHANNEL_TOKEN
+    try:
+        with open(UI_CHANNEL_TOKEN_FILE, encoding="utf-8") as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except FileNotFoundError:
+        pass
+    if not create:
+        return ""
+    token = secrets.token_urlsafe(32)
+    os.makedirs(os.path.dirname(UI_CHANNEL_TOKEN_FILE), exist_ok=True)
+    tmp = f"{UI_CHANNEL_TOKEN_FILE}.{os.getpid()}"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token + "\n")
+    os.replace(tmp, UI_CHANNEL_TOKEN_FILE)
+    return token
+
+
+class UiChannel:
+    def __init__(self, url: str = UI_CHANNEL_URL, max_pending: int = UI_CHANNEL_MAX_PENDING):
+        self.url = url
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_pending)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.url)
+
+    def publish(self, user_id: str, session_id: str, payload: Dict[str, Any]) -> None:
+        """Queue `payload` for the session's open stream; never blocks the tool."""
+        if not self.enabled or not session_id:
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait({"user_id": user_id, "session_id": session_id, "ui": payload})
+        except queue.Full:
+            metrics.incr("ui_channel.dropped")
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ui-channel", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        import httpx
+
+        token = channel_token()
+        with httpx.Client(timeout=UI_CHANNEL_TIMEOUT_S) as client:
+            while True:
+                item = self._queue.get()
+                try:
+                    res = client.post(self.url, json=item, headers={"X-UI-Channel-Token": token})
+                    if res.status_code == 403:
+                        # The proxy started (and generated its token) after us.
+                        token = channel_token()
+                        metrics.incr("ui_channel.rejected")
+                        continue
+                    metrics.incr("ui_channel.delivered" if res.status_code == 200 else "ui_channel.no_listener")
+                except httpx.HTTPError as e:
+                    metrics.incr("ui_channel.failed")
+                    logger.debug("ui channel post failed: %s", e)
+                except Exception:
+                    # A bad UI_CHANNEL_URL (InvalidURL) or a payload that isn't
+                    # JSON (TypeError) must not end the thread: later items
+                    # would pile up in the queue.
+                    metrics.incr("ui_channel.failed")
+                    logger.exception("ui channel post failed")
+
+
+ui_channel = UiChannel()
@@ -0,0 +1,297 @@
+from __future__ import annotations
+
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .supabase_client import sb
+
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_MAX_BATCH = int(os.environ.get("WRITE_BEHIND_MAX_BATCH", "50"))
+WRITE_BEHIND_MAX_DELAY_S = float(os.environ.get("WRITE_BEHIND_MAX_DELAY_S", "1.0"))
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get("WRITE_BEHIND_MAX_PENDING", "5000"))
+WRITE_BEHIND_PUT_TIMEOUT_S = float(os.environ.get("WRITE_BEHIND_PUT_TIMEOUT_S", "0.05"))
+WRITE_BEHIND_RETRIES = int(os.environ.get("WRITE_BEHIND_RETRIES", "3"))
+WRITE_BEHIND_SPILL_DIR = os.environ.get(
+    "WRITE_BEHIND_SPILL_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".write_behind"),
+)
+
+# (kind, table, values, match). kind is "insert" or "update"; match is only used by updates.
+Op = Tuple[str, str, Dict[str, Any], Optional[Dict[str, Any]]]
+
+
+class WriteBehindQueue:
+    """
+    Buffers writes nobody reads in the same turn and applies them from a
+    background thread.
+
+    - Consecutive inserts into the same table are sent as one multi-row insert.
+      A batch is flushed at `max_batch` ops or `max_delay_s` after the first
+      buffered op, whichever comes first.
+    - Updates are applied one request each; pending updates of the same row
+      are merged.
+    - At most `max_pending` ops are held in memory. Producers wait up to
+      `put_timeout_s` for room, then the op is spilled to disk instead.
+    - Failed batches are retried with exponential backoff and then spilled.
+      Spilled ops are replayed at warm-up, when the writer starts and on
+      every flush(). A replay renames the spill file aside and deletes it
+      only once its ops are written (or re-spilled), so a crash mid-replay
+      leaves a `.replay` file that the next replay picks up: delivery is at
+      least once.
+    - Spill file I/O (and its fsync) never runs under the buffer lock.
+    """
+
+    def __init__(
+        self,
+        max_batch: int = WRITE_BEHIND_MAX_BATCH,
+        max_delay_s: float = WRITE_BEHIND_MAX_DELAY_S,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+        put_timeout_s: float = WRITE_BEHIND_PUT_TIMEOUT_S,
+        retries: int = WRITE_BEHIND_RETRIES,
+        spill_dir: str = WRITE_BEHIND_SPILL_DIR,
+    ):
+        self.max_batch = max(1, int(max_batch))
+        self.max_delay_s = max(0.0, float(max_delay_s))
+        self.max_pending = max(1, int(max_pending))
+        self.put_timeout_s = max(0.0, float(put_timeout_s))
+        self.retries = max(0, int(retries))
+        self.spill_dir = spill_dir
+        self._pending: Deque[Op] = deque()
+        self._first_at: Optional[float] = None
+        self._cond = threading.Condition()
+        self._spill_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        self.stats = {"enqueued": 0, "written": 0, "requests": 0, "retries": 0, "spilled": 0, "replayed": 0}
+
+    @property
+    def spill_path(self) -> str:
+        # One file per process: several workers (serve.py) never append to or
+        # rename each other's spill while they are alive.
+        return os.path.join(self.spill_dir, f"spill.{os.getpid()}.jsonl")
+
+    # Producer side
+
+    def insert(self, table: str, row: Dict[str, Any]) -> None:
+        self._put(("insert", table, row, None))
+
+    def update(self, table: str, values: Dict[str, Any], match: Dict[str, Any]) -> None:
+        self._put(("update", table, values, match))
+
+    def _put(self, op: Op) -> None:
+        with self._cond:
+            if not self._closed:
+                if op[0] == "update" and self._merge_update(op):
+                    return
+                if self._wait_for_room():
+                    self._pending.append(op)
+                    self.stats["enqueued"] += 1
+                    if self._first_at is None:
+                        self._first_at = time.monotonic()
+                    self._ensure_thread()
+                    self._cond.notify_all()
+                    return
+        # Closed, or backpressure exhausted: keep memory bounded, keep the write durable.
+        self._spill([op])
+
+    def _wait_for_room(self) -> bool:
+        """With _cond held: wait up to put_timeout_s for room in the buffer."""
+        deadline = time.monotonic() + self.put_timeout_s
+        while len(self._pending) >= self.max_pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            self._cond.wait(remaining)
+        return True
+
+    def _merge_update(self, op: Op) -> bool:
+        for i in range(len(self._pending) - 1, -1, -1):
+            kind, table, values, match = self._pending[i]
+            if kind == "update" and table == op[1] and match == op[3]:
+                self._pending[i] = (kind, table, {**values, **op[2]}, match)
+                return True
+        return False
+
+    # Lifecycle
+
+    def flush(self) -> None:
+        """Write everything buffered (and anything previously spilled) now."""
+        self.replay_spill()
+        with self._cond:
+            ops = self._take()
+        self._write(ops)
+
+    def close(self) -> None:
+        """Flush-on-shutdown hook; later writes are spilled for the next process."""
+        with self._cond:
+            self._closed = True
+            ops = self._take()
+        self._write(ops)
+
+    def replay_spill(self) -> int:
+        """Write spilled ops, including ones left by a replay that crashed midway."""
+        with self._replay_lock:
+            replayed = 0
+            for path in self._claim_spills():
+                ops = self._read_spill(path)
+                self.stats["replayed"] += len(ops)
+                self._write(ops)
+                os.remove(path)
+                replayed += len(ops)
+            return replayed
+
+    def _claim_spills(self) -> List[str]:
+        """Rename aside this process's spill and any spill or replay file whose process is gone."""
+        claimed = []
+        for path in sorted(glob.glob(os.path.join(glob.escape(self.spill_dir), "spill.*"))):
+            if path == self.spill_path:
+                continue
+            owner = next((p for p in os.path.basename(path).split(".")[1:] if p.isdigit()), None)
+            if owner is not None and int(owner) != os.getpid() and _alive(int(owner)):
+                continue  # that process is still spilling or replaying into it
+            claimed.append(self._claim(path))
+        with self._spill_lock:
+            if os.path.exists(self.spill_path):
+                claimed.append(self._claim(self.spill_path))
+        return [p for p in claimed if p]
+
+    def _claim(self, path: str) -> Optional[str]:
+        target = os.path.join(self.spill_dir, f"spill.{os.getpid()}.{uuid.uuid4().hex[:8]}.replay")
+        try:
+            os.replace(path, target)
+        except FileNotFoundError:
+            return None  # another process claimed it first
+        return target
+
+    def _read_spill(self, path: str) -> List[Op]:
+        ops: List[Op] = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                    ops.append((rec["kind"], rec["table"], rec["values"], rec.get("match")))
+                except Exception:
+                    logger.warning("write-behind: skipping unreadable spill line")
+        return ops
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _take(self) -> List[Op]:
+        ops = list(self._pending)
+        self._pending.clear()
+        self._first_at = None
+        self._cond.notify_all()
+        return ops
+
+    def _run(self) -> None:
+        try:
+            self.replay_spill()
+        except Exception:
+            logger.exception("write-behind: spill replay failed")
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                while len(self._pending) < self.max_batch:
+                    remaining = self.max_delay_s - (time.monotonic() - (self._first_at or 0.0))
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                ops = self._take()
+            self._write(ops)
+
+    # Consumer side
+
+    def _batches(self, ops: List[Op]) -> List[List[Op]]:
+        batches: List[List[Op]] = []
+        for op in ops:
+            last = batches[-1] if batches else None
+            if (
+                op[0] == "insert"
+                and last
+                and last[0][0] == "insert"
+                and last[0][1] == op[1]
+                and len(last) < self.max_batch
+            ):
+                last.append(op)
+            else:
+                batches.append([op])
+        return batches
+
+    def _write(self, ops: List[Op]) -> None:
+        if not ops:
+            return
+        # Serialize writers so a flush() from shutdown can't interleave with the thread.
+        with self._write_lock:
+            for batch in self._batches(ops):
+                if not self._send_with_retry(batch):
+                    self._spill(batch)
+
+    def _send_with_retry(self, batch: List[Op]) -> bool:
+        kind, table, values, match = batch[0]
+        for attempt in range(self.retries + 1):
+            try:
+                if kind == "insert":
+                    sb().table(table).insert([op[2] for op in batch]).execute()
+                else:
+                    q = sb().table(table).update(values)
+                    for col, val in (match or {}).items():
+                        q = q.eq(col, val)
+                    q.execute()
+                self.stats["requests"] += 1
+                self.stats["written"] += len(batch)
+                return True
+            except Exception as e:
+                if attempt == self.retries:
+                    logger.warning("write-behind %s into %s failed after %d attempts: %s", kind, table, attempt + 1, e)
+                    return False
+                self.stats["retries"] += 1
+                time.sleep(min(2.0, 0.1 * (2 ** attempt)))
+        return False
+
+    def _spill(self, ops: List[Op]) -> None:
+        with self._spill_lock:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for kind, table, values, match in ops:
+                    f.write(json.dumps({"kind": kind, "table": table, "values": values, "match": match}, default=str) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        self.stats["spilled"] += len(ops)
+
+
+def _alive(pid: int) -> bool:
+    if os.name != "posix":
+        return True  # can't probe safely; leave its file alone
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+write_behind = WriteBehindQueue()
+
+# The ADK api_server (uvicorn) runs atexit handlers on graceful shutdown, which
+# is the last point where buffered writes can still reach Supabase.
+atexit.register(write_behind.close)
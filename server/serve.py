@@ -0,0 +1,135 @@
+"""
+Multi-worker agent server: `adk api_server` on every core.
+
+    python serve.py --workers 4          # inside server/, instead of `adk api_server`
+
+Before the workers start, the catalog is copied once into a read-only
+snapshot file (my_agent/catalog_snapshot.py) that every worker memory-maps,
+so catalog lookups, the part/model index and prices are shared rather than
+rebuilt per worker. The parent process rebuilds it every
+CATALOG_SNAPSHOT_REFRESH_S and workers pick up the new file on their own.
+
+Workers share one listening socket, so consecutive turns of a session can
+land on different workers; there is no session affinity. Anything a later
+turn reads is therefore shared rather than kept per process:
+
+- sessions: ADK_SESSION_URI (default a SQLite file under server/.local/),
+  switched to WAL so readers don't block the writer; concurrent writers wait
+  on SQLite's busy timeout (5s by default in the sqlite3 driver).
+- expand_result handles: RESULT_STORE_PATH, a SQLite file (results.py).
+- order history: read from order_summaries every time (no in-process cache).
+- write-behind spills: one file per worker process; a replay only takes the
+  files of processes that are gone (write_behind.py).
+- the open-cart prefetch is off (PREFETCH_CART=0): a checkout in another
+  worker couldn't invalidate it. Other prefetches, the guide and price
+  caches and the negative identifier cache stay per process; they only hold
+  catalog data, which changes with the snapshot.
+
+main.py keeps running as a single process: it holds the open SSE streams
+that the agent's UI channel posts into.
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+import uvicorn
+
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SNAPSHOT = os.path.join(SERVER_DIR, ".local", "catalog.snapshot.db")  # = catalog_snapshot.DEFAULT_PATH
+ADK_SESSION_URI = os.environ.get(
+    "ADK_SESSION_URI", "sqlite:///" + os.path.join(SERVER_DIR, ".local", "sessions.db")
+)
+DEFAULT_RESULT_STORE = os.path.join(SERVER_DIR, ".local", "results.db")
+CATALOG_SNAPSHOT_REFRESH_S = float(os.environ.get("CATALOG_SNAPSHOT_REFRESH_S", "900"))
+
+logger = logging.getLogger("serve")
+
+
+def __getattr__(name):
+    # uvicorn imports "serve:app" in each worker; only workers build the ADK app.
+    if name == "app":
+        from google.adk.cli.fast_api import get_fast_api_app
+
+        app = get_fast_api_app(
+            agents_dir=SERVER_DIR,
+            session_service_uri=ADK_SESSION_URI,
+            allow_origins=["*"],
+            web=False,
+        )
+        # Each worker builds its app once, at startup: warm it up alongside.
+        _warm_worker()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _warm_worker() -> None:
+    # main.py's priming run reaches one worker; each one warms itself too.
+    from my_agent import startup
+
+    threading.Thread(target=startup.warm_up, name="warm-up", daemon=True).start()
+
+
+def _snapshot_age(path: str) -> float:
+    try:
+        return time.time() - os.stat(path).st_mtime
+    except OSError:
+        return float("inf")
+
+
+def _keep_fresh(path: str) -> None:
+    from my_agent import catalog_snapshot
+
+    while True:
+        time.sleep(max(1.0, CATALOG_SNAPSHOT_REFRESH_S - _snapshot_age(path)))
+        try:
+            catalog_snapshot.build(path)
+        except Exception:
+            logger.exception("catalog snapshot rebuild failed; workers keep the previous one")
+
+
+def _use_wal(session_uri: str) -> None:
+    # WAL is a property of the database file, so setting it once here covers
+    # every worker's connections.
+    if not session_uri.startswith("sqlite"):
+        return
+    # SQLAlchemy convention: sqlite:///relative.db, sqlite:////absolute.db
+    path = urlparse(session_uri).path[1:]
+    if not path or path == ":memory:":
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with sqlite3.connect(path) as conn:
+        conn.execute("pragma journal_mode=wal")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the ADK agent server with several workers sharing one catalog snapshot.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--snapshot", default=os.environ.get("CATALOG_SNAPSHOT") or DEFAULT_SNAPSHOT)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # Workers inherit the environment, so this has to be set before they start.
+    os.environ["CATALOG_SNAPSHOT"] = args.snapshot
+    os.environ.setdefault("RESULT_STORE_PATH", DEFAULT_RESULT_STORE)
+    if args.workers > 1:
+        os.environ["PREFETCH_CART"] = "0"
+    _use_wal(ADK_SESSION_URI)
+    os.makedirs(os.path.dirname(args.snapshot), exist_ok=True)
+    from my_agent import catalog_snapshot
+
+    if _snapshot_age(args.snapshot) > CATALOG_SNAPSHOT_REFRESH_S:
+        catalog_snapshot.build(args.snapshot)
+    threading.Thread(target=_keep_fresh, args=(args.snapshot,), name="snapshot-refresh", daemon=True).start()
+
+    uvicorn.run("serve:app", host=args.host, port=args.port, workers=args.workers, app_dir=SERVER_DIR)
+
+
+if __name__ == "__main__":
+    main()